@@ -807,7 +807,8 @@ def context(fname, node):
 class ValidatingXmlParser(object):
     """
     Validating XML Parser based on Expat. It has two methods `.parse_file`
-    and `.parse_bytes` returning a validated :class:`Node` object.
+    and `.parse_bytes` returning a validated :class:`Node` object and
+    a method `.iterparse` yielding validated nodes incrementally.
 
     :param validators: a dictionary of validation functions
     :param stop: the tag where to stop the parsing (if any)
@@ -827,6 +828,7 @@ class ValidatingXmlParser(object):
         self.p.CharacterDataHandler = self._char_data
         self._ancestors = []
         self._root = None
+        self._filter_tag = None
         try:
             yield
         except ExpatError as err:
@@ -871,6 +873,33 @@ class ValidatingXmlParser(object):
                     self.p.ParseFile(f)
         return self._root
 
+    def iterparse(self, fname, filter_tag, bufsize=1024 * 1024):
+        """
+        Parse a file incrementally, in chunks of `bufsize` bytes. The
+        validated nodes with a tag satisfying the given filter are
+        yielded as soon as they are complete and they are not attached
+        to their parent, so that the full tree is never kept in memory.
+        The attributes of all nodes are validated as soon as the nodes
+        are opened, so the ancestors are already usable.
+
+        :param fname: a file name
+        :param filter_tag: a function tag (without namespace) -> boolean
+        :param bufsize: the number of bytes to read at once
+        :yields: pairs (ancestors, node) where ancestors is a tuple of nodes
+        """
+        with self._context():
+            self.filename = fname
+            self._filter_tag = filter_tag
+            self._parsed = []
+            with open(fname, 'rb') as f:
+                for chunk in iter(lambda: f.read(bufsize), b''):
+                    self.p.Parse(chunk, False)
+                    yield from self._parsed
+                    self._parsed.clear()
+                self.p.Parse(b'', True)
+                yield from self._parsed
+                self._parsed.clear()
+
     def _start_element(self, longname, attrs):
         try:
             xmlns, name = longname.split('}')
@@ -878,8 +907,14 @@ class ValidatingXmlParser(object):
             name = tag = longname
         else:  # fix the tag with an opening brace
             tag = '{' + longname
-        self._ancestors.append(
-            Node(tag, attrs, lineno=self.p.CurrentLineNumber))
+        node = Node(tag, attrs, lineno=self.p.CurrentLineNumber)
+        if self._filter_tag:  # in iterparse
+            try:
+                self._set_attribs(node, name)
+            except Exception:
+                with context(self.filename, node):
+                    raise
+        self._ancestors.append(node)
         if self.stop and name == self.stop:
             for anc in reversed(self._ancestors):
                 self._end_element(anc.tag)
@@ -887,10 +922,18 @@ class ValidatingXmlParser(object):
 
     def _end_element(self, name):
         node = self._ancestors[-1]
-        with context(self.filename, node):
+        try:
             self._root = self._literalnode(node)
+        except Exception:
+            # NB: not using a context manager for each node, which is slow
+            with context(self.filename, node):
+                raise
         del self._ancestors[-1]
-        if self._ancestors:
+        if not self._ancestors:
+            return
+        elif self._filter_tag and self._filter_tag(striptag(node.tag)):
+            self._parsed.append((tuple(self._ancestors), node))
+        else:
             self._ancestors[-1].append(self._root)
 
     def _char_data(self, data):
@@ -929,11 +972,15 @@ class ValidatingXmlParser(object):
         # cast the text
         self._set_text(node, node.text, tag)
 
-        # cast the attributes
+        # cast the attributes, unless already done in iterparse
+        if not self._filter_tag:
+            self._set_attribs(node, tag)
+        return node
+
+    def _set_attribs(self, node, tag):
         for n, v in node.attrib.items():
             tn = '%s.%s' % (tag, n)
             if tn in self.validators:
                 self._set_attrib(node, n, tn, v)
             elif n in self.validators:
                 self._set_attrib(node, n, n, v)
-        return node
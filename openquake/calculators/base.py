@@ -34,6 +34,8 @@ from openquake.baselib.performance import Monitor, init_performance
 from openquake.hazardlib import InvalidFile, site
 from openquake.hazardlib.site_amplification import Amplifier
 from openquake.hazardlib.calc.filters import SourceFilter
+from openquake.hazardlib.geo.surface.multi import (
+    GC2_CACHE, cache_gc2, save_gc2_cache, gc2_cache_fname)
 from openquake.hazardlib.source import rupture
 from openquake.hazardlib.shakemap import get_sitecol_shakemap, to_gmfs
 from openquake.risklib import riskinput, riskmodels
@@ -261,9 +263,11 @@ class BaseCalculator(metaclass=abc.ABCMeta):
                 readinput.eids = None
                 readinput.gsim_lt_cache.clear()
 
-                # remove temporary hdf5 file, if any
-                if os.path.exists(self.datastore.tempname) and remove:
-                    os.remove(self.datastore.tempname)
+                # remove temporary hdf5 files, if any
+                for fname in (self.datastore.tempname,
+                              gc2_cache_fname(self.datastore.tempname)):
+                    if os.path.exists(fname) and remove:
+                        os.remove(fname)
         return getattr(self, 'exported', {})
 
     def core_task(*args):
@@ -393,10 +397,35 @@ class HazardCalculator(BaseCalculator):
         else:  # can happen to the ruptures-only calculator
             sitecol = None
             filename = None
+        if filename:
+            self.gc2_fname = gc2_cache_fname(filename)
+            self.gc2_written = set()  # keys of the frameworks in the file
+            self.share_gc2()
         if oq.is_ucerf():
             return UcerfFilter(sitecol, oq.maximum_distance, filename)
         return SourceFilter(sitecol, oq.maximum_distance, filename)
 
+    def share_gc2(self, frameworks=()):
+        """
+        Merge the GC2 frameworks returned by the tasks into the GC2_CACHE
+        and, if there are new ones, rewrite the file .gc2_fname read by
+        the tasks starting later on. The file is written on a temporary
+        name and then renamed, so that it can be replaced while the
+        workers are reading the previous version.
+
+        :param frameworks: a dictionary key -> GC2 framework
+        """
+        for key, framework in dict(frameworks).items():
+            cache_gc2(key, framework)
+        if (not hasattr(self, 'gc2_fname') or
+                set(GC2_CACHE) <= self.gc2_written):
+            return
+        tmp = self.gc2_fname + '.tmp'
+        with hdf5.File(tmp, 'w') as h5:
+            save_gc2_cache(h5)
+        os.replace(tmp, self.gc2_fname)
+        self.gc2_written = set(GC2_CACHE)
+
     @property
     def E(self):
         """
@@ -435,8 +464,11 @@ class HazardCalculator(BaseCalculator):
             # can be None for the ruptures-only calculator
             with hdf5.File(self.datastore.tempname, 'w') as tmp:
                 tmp['sitecol'] = self.sitecol
+        # NB: classical calculations with poes_by_src read the sources also
+        # with --hc, to recompute only the ones changed from the parent
         if ('source_model_logic_tree' in oq.inputs and
-                oq.hazard_calculation_id is None):
+                (oq.hazard_calculation_id is None or
+                 oq.calculation_mode == 'classical' and oq.poes_by_src)):
             with self.monitor('composite source model', measuremem=True):
                 self.csm = csm = readinput.get_composite_source_model(
                     oq, self.datastore.hdf5)
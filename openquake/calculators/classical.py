@@ -16,6 +16,8 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
 import os
+import copy
+import zlib
 import time
 import logging
 import operator
@@ -23,11 +25,14 @@ from datetime import datetime
 import numpy
 
 from openquake.baselib import parallel, hdf5
-from openquake.baselib.general import AccumDict, block_splitter
+from openquake.baselib.general import (
+    AccumDict, block_splitter, group_array)
+from openquake.baselib.python3compat import decode
 from openquake.hazardlib.contexts import ContextMaker
 from openquake.hazardlib.calc.filters import split_sources
 from openquake.hazardlib.calc.hazard_curve import classical
-from openquake.hazardlib.probability_map import ProbabilityMap
+from openquake.hazardlib.probability_map import (
+    ProbabilityMap, ProbabilityCurve)
 from openquake.commonlib import calc, util, logs
 from openquake.commonlib.source_reader import random_filtered_sources
 from openquake.calculators import getters
@@ -38,9 +43,34 @@ U32 = numpy.uint32
 F32 = numpy.float32
 F64 = numpy.float64
 MINWEIGHT = 1000
+POES_CHUNKSIZE = 100_000  # max number of rows of poes_by_src read/written
 weight = operator.attrgetter('weight')
 grp_extreme_dt = numpy.dtype([('grp_id', U16), ('grp_trt', hdf5.vstr),
                              ('extreme_poe', F32)])
+# parameters which must be the same in the parent calculation
+# to reuse its PoEs by source
+POES_PARAMS = ('hazard_imtls', 'truncation_level', 'maximum_distance',
+               'pointsource_distance', 'filter_distance', 'shift_hypo',
+               'minimum_intensity')
+
+
+def get_mean_std_attrs(imtls, full_lt, sitecol, csm=None):
+    """
+    :returns: the attributes identifying the mean_std_ arrays stored in
+              rup/, i.e. the IMTs, the GSIMs by tectonic region type, a
+              checksum of the sites and, if `csm` is given, a checksum of
+              the sources
+    """
+    gsims_by_trt = full_lt.get_gsims_by_trt()
+    attrs = dict(
+        imts=list(imtls),
+        gsims=['%s:%s' % (trt, gsim) for trt in full_lt.gsim_lt.values
+               for gsim in gsims_by_trt[trt]],
+        sites=zlib.adler32(sitecol.complete.array.tobytes()))
+    if csm is not None:
+        checksums = U32([src.checksum for sg in csm.src_groups for src in sg])
+        attrs['sources'] = zlib.adler32(numpy.sort(checksums).tobytes())
+    return attrs
 
 
 def get_extreme_poe(array, imtls):
@@ -158,6 +188,12 @@ class ClassicalCalculator(base.HazardCalculator):
                 if pmap:
                     acc[grp_id] |= pmap
                 acc.eff_ruptures[trt] += eff_rups
+            self.share_gc2(extra.get('gc2', {}))
+            for srcid, pmap in extra.get('pmap_by_src', {}).items():
+                if srcid in self.pmap_by_src:
+                    self.pmap_by_src[srcid] |= pmap
+                else:
+                    self.pmap_by_src[srcid] = pmap
 
             rup_data = dic['rup_data']
             nr = len(rup_data['grp_id'])
@@ -186,6 +222,8 @@ class ClassicalCalculator(base.HazardCalculator):
         num_levels = len(self.oqparam.imtls.array)
         rparams = {'grp_id', 'occurrence_rate',
                    'weight', 'probs_occur', 'sid_', 'lon_', 'lat_', 'rrup_'}
+        if self.oqparam.cache_mean_std:
+            rparams.add('mean_std_')
         gsims_by_trt = self.full_lt.get_gsims_by_trt()
         n = len(self.full_lt.sm_rlzs)
         trts = list(self.full_lt.gsim_lt.values)
@@ -199,6 +237,11 @@ class ClassicalCalculator(base.HazardCalculator):
                     rparams.add(dparam + '_')
                 zd[grp_id] = ProbabilityMap(num_levels, len(gsims))
         zd.eff_ruptures = AccumDict(accum=0)  # trt -> eff_ruptures
+        for sg in self.csm.src_groups:
+            for src in sg:
+                if src.id in self.pmap_by_src:  # reused from the parent
+                    for grp_id in src.grp_ids:
+                        zd[grp_id] |= self.pmap_by_src[src.id]
         self.rparams = sorted(rparams)
         for k in self.rparams:
             # variable length arrays
@@ -212,6 +255,10 @@ class ClassicalCalculator(base.HazardCalculator):
             else:
                 dt = F32
             self.datastore.create_dset('rup/' + k, dt)
+        if self.oqparam.cache_mean_std:
+            # the mean_std_ arrays of shape (2, N, M, G) are stored flattened
+            self.datastore.set_attrs('rup/mean_std_', **get_mean_std_attrs(
+                self.oqparam.imtls, self.full_lt, self.sitecol, self.csm))
         self.by_task = {}  # task_no => src_ids
         self.totrups = 0  # total number of ruptures before collapsing
         return zd
@@ -223,12 +270,19 @@ class ClassicalCalculator(base.HazardCalculator):
         tectonic region type.
         """
         oq = self.oqparam
-        if oq.hazard_calculation_id and not oq.compare_with_classical:
+        if (oq.hazard_calculation_id and not oq.compare_with_classical
+                and not hasattr(self, 'csm')):
             with util.read(self.oqparam.hazard_calculation_id) as parent:
                 self.full_lt = parent['full_lt']
             self.calc_stats()  # post-processing
             return {}
 
+        self.pmap_by_src = {}  # src.id -> ProbabilityMap
+        if oq.hazard_calculation_id:  # recompute only the changed sources
+            eff_ruptures = self.read_parent_poes()
+        else:
+            eff_ruptures = {}
+
         mags = self.datastore['source_mags'][()]
         if len(mags) == 0:  # everything was discarded
             raise RuntimeError('All sources were discarded!?')
@@ -243,6 +297,7 @@ class ClassicalCalculator(base.HazardCalculator):
             num_cores=oq.num_cores)
         smap.task_queue = list(self.gen_task_queue())  # really fast
         acc0 = self.acc0()  # create the rup/ datasets BEFORE swmr_on()
+        acc0.eff_ruptures += eff_ruptures
         self.datastore.swmr_on()
         smap.h5 = self.datastore.hdf5
         self.calc_times = AccumDict(accum=numpy.zeros(3, F32))
@@ -272,18 +327,148 @@ class ClassicalCalculator(base.HazardCalculator):
         numsites = sum(arr[1] for arr in self.calc_times.values())
         logging.info('Effective number of ruptures: %d/%d',
                      self.numrups, self.totrups)
-        logging.info('Effective number of sites per rupture: %d',
-                     numsites / self.numrups)
+        if self.numrups:
+            logging.info('Effective number of sites per rupture: %d',
+                         numsites / self.numrups)
         self.calc_times.clear()  # save a bit of memory
         return acc
 
+    def read_parent_poes(self):
+        """
+        Populate .pmap_by_src with the PoEs stored by the parent calculation
+        for the sources which did not change, i.e. with the same source_id,
+        checksum and grp_ids. Nothing is reused if the parent was computed
+        with different parameters or GSIMs.
+
+        :returns: a dictionary trt -> effective ruptures of the reused sources
+        """
+        oq = self.oqparam
+        parent = self.datastore.parent
+        poq = parent['oqparam']
+        if not poq.poes_by_src:
+            logging.warning('The parent calculation was run without '
+                            'poes_by_src, recomputing all the sources')
+            return {}
+        pparams = dict(poq.to_params())
+        params = dict(oq.to_params())
+        changed = [name for name in POES_PARAMS
+                   if pparams.get(name) != params.get(name)]
+        gsims = {trt: list(map(str, gsims)) for trt, gsims in
+                 self.full_lt.get_gsims_by_trt().items()}
+        pgsims = {trt: list(map(str, gsims)) for trt, gsims in
+                  parent['full_lt'].get_gsims_by_trt().items()}
+        if gsims != pgsims:
+            changed.append('gsim_logic_tree')
+        if changed:
+            logging.warning('Changed %s with respect to the parent, '
+                            'recomputing all the sources', ', '.join(changed))
+            return {}
+        info = parent['source_info'][()]
+        pidx = {(srcid, checksum): i for i, (srcid, checksum) in enumerate(
+            zip(decode(info['source_id']), info['checksum']))}
+        pgrp_ids = group_array(parent['poes_by_src/grp_ids'][()], 'src_id')
+        reused = {}  # parent source index -> source
+        for sg in self.csm.src_groups:
+            if sg.atomic:  # the PoEs of atomic groups are not stored
+                continue
+            for src in sg:
+                i = pidx.get((src.source_id, src.checksum))
+                if i is None:  # new or changed source
+                    continue
+                if i in pgrp_ids and list(
+                        pgrp_ids[i]['grp_id']) == src.grp_ids:
+                    reused[i] = src
+        L = len(oq.imtls.array)
+        gsims_by_trt = self.full_lt.get_gsims_by_trt()
+        eff_ruptures = AccumDict(accum=0)  # trt -> eff_ruptures
+        for i, src in reused.items():
+            trt = src.tectonic_region_type
+            G = len(gsims_by_trt[trt])
+            # the sources with no stored PoEs do not contribute
+            self.pmap_by_src[src.id] = ProbabilityMap(L, G)
+            eff_ruptures[trt] += info[i]['eff_ruptures']
+        for key in parent['poes_by_src']:
+            if not key.startswith('trt-'):
+                continue
+            dset = parent['poes_by_src/' + key]
+            for start in range(0, len(dset), POES_CHUNKSIZE):
+                rows = dset[start:start + POES_CHUNKSIZE]
+                for i, recs in group_array(rows, 'src_id').items():
+                    if i in reused:
+                        self.pmap_by_src[reused[i].id].update(
+                            ProbabilityMap.from_array(recs['poes'],
+                                                      recs['sid']))
+        if reused:
+            # copy the information of the reused sources, so that it is
+            # available to the chained calculations too
+            ids = U32([src.id for src in reused.values()])
+            pids = U32(list(reused))
+            source_info = self.datastore['source_info']
+            for field in ('num_ruptures', 'num_sites', 'eff_ruptures'):
+                column = source_info[field]
+                column[ids] = info[field][pids]
+                source_info[field] = column
+        num_srcs = sum(len(sg) for sg in self.csm.src_groups)
+        logging.info('Reusing the PoEs of %d/%d sources from calculation #%d',
+                     len(reused), num_srcs, oq.hazard_calculation_id)
+        self.datastore.set_attrs('source_info', num_reused=len(reused))
+        return eff_ruptures
+
+    def save_poes_by_src(self):
+        """
+        Save the PoEs of the independent sources, so that they can be reused
+        by a child calculation recomputing only the changed sources.
+        The PoEs are stored as sparse records (src_id, sid, poes) in
+        the datasets poes_by_src/trt-XX, one per tectonic region type,
+        skipping the sources with no contribution; poes_by_src/grp_ids
+        contains the pairs (src_id, grp_id) of the stored sources, i.e.
+        not of the sources in atomic groups.
+        """
+        L = len(self.oqparam.imtls.array)
+        gsims_by_trt = self.full_lt.get_gsims_by_trt()
+        grp_ids = []  # pairs (src_id, grp_id)
+        for trti, trt in enumerate(self.full_lt.gsim_lt.values):
+            dt = numpy.dtype([('src_id', U32), ('sid', U32),
+                              ('poes', (F64, (L, len(gsims_by_trt[trt]))))])
+            dset = hdf5.create(self.datastore.hdf5,
+                               'poes_by_src/trt-%02d' % trti, dt)
+            arrays, size = [], 0
+            for sg in self.csm.src_groups:
+                if sg.atomic or sg.trt != trt:
+                    continue
+                for src in sg:
+                    grp_ids.extend((src.id, grp_id) for grp_id in src.grp_ids)
+                    pmap = self.pmap_by_src.get(src.id)
+                    if not pmap:  # far away from the sites
+                        continue
+                    arr = numpy.zeros(len(pmap), dt)
+                    arr['src_id'] = src.id
+                    arr['sid'] = pmap.sids
+                    arr['poes'] = pmap.array
+                    arrays.append(arr)
+                    size += len(arr)
+                    if size >= POES_CHUNKSIZE:
+                        hdf5.extend(dset, numpy.concatenate(arrays))
+                        arrays, size = [], 0
+            if arrays:
+                hdf5.extend(dset, numpy.concatenate(arrays))
+        self.datastore['poes_by_src/grp_ids'] = numpy.array(
+            grp_ids, [('src_id', U32), ('grp_id', U16)])
+
     def gen_task_queue(self):
         """
         Build a task queue to be attached to the Starmap instance
         """
         oq = self.oqparam
         gsims_by_trt = self.full_lt.get_gsims_by_trt()
-        src_groups = self.csm.src_groups
+        src_groups = []
+        for sg in self.csm.src_groups:
+            srcs = [src for src in sg if src.id not in self.pmap_by_src]
+            if len(srcs) < len(sg):  # skip the sources reused from the parent
+                sg = copy.copy(sg)
+                sg.sources = srcs
+            if srcs:
+                src_groups.append(sg)
 
         def srcweight(src):
             trt = src.tectonic_region_type
@@ -298,7 +483,8 @@ class ClassicalCalculator(base.HazardCalculator):
             maximum_distance=oq.maximum_distance,
             pointsource_distance=oq.pointsource_distance,
             shift_hypo=oq.shift_hypo, max_weight=oq.max_weight,
-            max_sites_disagg=oq.max_sites_disagg)
+            max_sites_disagg=oq.max_sites_disagg,
+            cache_mean_std=oq.cache_mean_std, poes_by_src=oq.poes_by_src)
         srcfilter = self.src_filter(self.datastore.tempname)
         if oq.calculation_mode == 'preclassical':
             f1 = f2 = preclassical
@@ -379,7 +565,11 @@ class ClassicalCalculator(base.HazardCalculator):
                         get_extreme_poe(pmap[sid].array, oq.imtls)
                         for sid in pmap)
                     data.append((grp_id, trt, extreme))
-        if oq.hazard_calculation_id is None and 'poes' in self.datastore:
+        if oq.poes_by_src and hasattr(self, 'csm'):
+            with self.monitor('saving poes_by_src'):
+                self.save_poes_by_src()
+        if ((oq.hazard_calculation_id is None or hasattr(self, 'csm'))
+                and 'poes' in self.datastore):
             self.datastore['disagg_by_grp'] = numpy.array(
                 sorted(data), grp_extreme_dt)
             self.calc_stats()
@@ -407,7 +597,7 @@ class ClassicalCalculator(base.HazardCalculator):
                 self.datastore.create_dset('hmaps-stats', F32, (N, S, M, P))
         ct = oq.concurrent_tasks
         logging.info('Building hazard statistics with %d concurrent_tasks', ct)
-        weights = [rlz.weight for rlz in self.realizations]
+        weights = self.full_lt.get_weights()
         allargs = [  # this list is very fast to generate
             (getters.PmapGetter(self.datastore, weights, t.sids, oq.poes),
              N, hstats, oq.individual_curves, oq.max_sites_disagg,
@@ -465,11 +655,26 @@ def build_hazard(pgetter, N, hstats, individual_curves,
             pmap_by_kind['hmaps-stats'] = [ProbabilityMap(L) for r in range(S)]
     combine_mon = monitor('combine pmaps', measuremem=False)
     compute_mon = monitor('compute stats', measuremem=False)
+    if amplifier:
+        # amplify together the curves of all sites with the same ampcode
+        with monitor('amplify curves'):
+            ampl_curves = {}
+            sids = numpy.array(pgetter.sids)
+            for code in numpy.unique(ampcode[sids]):
+                csids = sids[ampcode[sids] == code]
+                arr = numpy.array([[pc.array[:, 0] for pc in
+                                    pgetter.get_pcurves(sid)]
+                                   for sid in csids])  # shape (n, R, L)
+                for sid, curves in zip(
+                        csids, amplifier.amplify_array(code, arr)):
+                    ampl_curves[sid] = [ProbabilityCurve(curve.reshape(-1, 1))
+                                        for curve in curves]
     for sid in pgetter.sids:
         with combine_mon:
-            pcurves = pgetter.get_pcurves(sid)
             if amplifier:
-                pcurves = amplifier.amplify(ampcode[sid], pcurves)
+                pcurves = ampl_curves[sid]
+            else:
+                pcurves = pgetter.get_pcurves(sid)
         if sum(pc.array.sum() for pc in pcurves) == 0:  # no data
             continue
         with compute_mon:
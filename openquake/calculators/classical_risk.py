@@ -17,6 +17,7 @@
 # along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
 import numpy
 from openquake.baselib.python3compat import encode
+from openquake.baselib.general import group_array
 from openquake.hazardlib.stats import compute_stats
 from openquake.risklib import scientific
 from openquake.calculators import base
@@ -25,6 +26,29 @@ from openquake.calculators import base
 F32 = numpy.float32
 
 
+def get_loss_curves(crmodel, assets, hcurves, lt):
+    """
+    :param crmodel: a CompositeRiskModel instance
+    :param assets: assets of the same taxonomy
+    :param hcurves: an array of shape (R, L1) with the hazard curves
+    :param lt: a loss type
+    :returns: a composite array (loss, poe) of shape (R, A, C)
+    """
+    imts = list(crmodel.imtls)
+    rmodels, weights = crmodel.get_rmodels_weights(assets[0]['taxonomy'])
+    curves = []
+    for rm in rmodels:
+        slc = crmodel.imtls(imts[rm.imti[lt]])
+        curves.append(rm(lt, assets, hcurves[:, slc], None, None))
+    if len(curves) == 1:
+        return curves[0]
+    res = curves[0].copy()
+    for field in res.dtype.names:
+        res[field] = numpy.average(
+            [c[field] for c in curves], weights=weights, axis=0)
+    return res
+
+
 def classical_risk(riskinputs, crmodel, param, monitor):
     """
     Compute and return the average losses for each asset.
@@ -41,35 +65,35 @@ def classical_risk(riskinputs, crmodel, param, monitor):
     result = dict(loss_curves=[], stat_curves=[])
     weights = [w['default'] for w in param['weights']]
     statnames, stats = zip(*param['stats'])
+    haz_mon = monitor('getting hazard', measuremem=False)
+    rsk_mon = monitor('computing risk', measuremem=False)
     for ri in riskinputs:
-        A = len(ri.assets)
-        L = len(crmodel.lti)
-        R = ri.hazard_getter.num_rlzs
-        loss_curves = numpy.zeros((R, L, A), object)
-        avg_losses = numpy.zeros((R, L, A))
-        for out in ri.gen_outputs(crmodel, monitor):
-            r = out.rlzi
-            for l, loss_type in enumerate(crmodel.loss_types):
-                # loss_curves has shape (A, C)
-                for i, asset in enumerate(ri.assets):
-                    loss_curves[out.rlzi, l, i] = lc = out[loss_type][i]
-                    aid = asset['ordinal']
-                    avg = scientific.average_loss(lc)
-                    avg_losses[r, l, i] = avg
-                    lcurve = (lc['loss'], lc['poe'], avg)
-                    result['loss_curves'].append((l, r, aid, lcurve))
-
-        # compute statistics
-        for l, loss_type in enumerate(crmodel.loss_types):
-            for i, asset in enumerate(ri.assets):
-                avg_stats = compute_stats(avg_losses[:, l, i], stats, weights)
-                losses = loss_curves[0, l, i]['loss']
-                all_poes = numpy.array(
-                    [loss_curves[r, l, i]['poe'] for r in range(R)])
-                poes_stats = compute_stats(all_poes, stats, weights)
-                result['stat_curves'].append(
-                    (l, asset['ordinal'], losses, poes_stats, avg_stats))
-    if R == 1:  # the realization is the same as the mean
+        with haz_mon:
+            pcurves = ri.hazard_getter.get_hazard()
+            R = len(pcurves)
+            # hazard curves of all the realizations, shape (R, L1)
+            hcurves = numpy.array([pc.array[:, 0] for pc in pcurves])
+        with rsk_mon:
+            # all the realizations and all the assets of the same
+            # taxonomy are managed at once
+            for assets in group_array(ri.assets, 'taxonomy').values():
+                aids = assets['ordinal']
+                for l, loss_type in enumerate(crmodel.loss_types):
+                    lcs = get_loss_curves(crmodel, assets, hcurves, loss_type)
+                    avgs = scientific.average_loss(lcs)  # shape (R, A)
+                    avg_stats = compute_stats(avgs, stats, weights)
+                    poes_stats = compute_stats(lcs['poe'], stats, weights)
+                    for i, aid in enumerate(aids):
+                        losses = lcs[0, i]['loss']
+                        result['stat_curves'].append(
+                            (l, aid, losses, poes_stats[:, i],
+                             avg_stats[:, i]))
+                        if R > 1:
+                            for r in range(R):
+                                lcurve = (losses, lcs[r, i]['poe'], avgs[r, i])
+                                result['loss_curves'].append(
+                                    (l, r, aid, lcurve))
+    if not result['loss_curves']:  # the realization is the same as the mean
         del result['loss_curves']
     return result
 
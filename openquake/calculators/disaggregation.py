@@ -26,7 +26,7 @@ import numpy
 from openquake.baselib import parallel, hdf5
 from openquake.baselib.general import (
     AccumDict, block_splitter, get_array_nbytes)
-from openquake.baselib.python3compat import encode
+from openquake.baselib.python3compat import encode, decode
 from openquake.hazardlib import stats
 from openquake.hazardlib.calc import disagg
 from openquake.hazardlib.imt import from_string
@@ -36,6 +36,7 @@ from openquake.hazardlib.tom import PoissonTOM
 from openquake.commonlib import util
 from openquake.calculators import getters
 from openquake.calculators import base
+from openquake.calculators.classical import get_mean_std_attrs
 
 weight = operator.attrgetter('weight')
 DISAGG_RES_FMT = 'rlz-%(rlz)s-%(imt)s-%(sid)s-%(poe)s/'
@@ -92,7 +93,7 @@ def _iml4(rlzs, iml_disagg, imtls, poes_disagg, curves):
         iml4, dict(imts=[from_string(imt) for imt in imtls], rlzs=rlzs))
 
 
-def compute_disagg(dstore, idxs, cmaker, iml4, trti, bin_edges,
+def compute_disagg(dstore, idxs, cmaker, iml4, trti, bin_edges, allgsims,
                    monitor):
     # see https://bugs.launchpad.net/oq-engine/+bug/1279247 for an explanation
     # of the algorithm used
@@ -111,6 +112,9 @@ def compute_disagg(dstore, idxs, cmaker, iml4, trti, bin_edges,
         tectonic region type index
     :param bin_egdes:
         a quintet (mag_edges, dist_edges, lon_edges, lat_edges, eps_edges)
+    :param allgsims:
+        the GSIMs used by the classical calculator for the group, or None
+        if the mean_std_ arrays stored in rup/ must be ignored
     :param monitor:
         monitor of the currently running job
     :returns:
@@ -119,7 +123,13 @@ def compute_disagg(dstore, idxs, cmaker, iml4, trti, bin_edges,
     dstore.open('r')
     oq = dstore['oqparam']
     sitecol = dstore['sitecol']
-    rupdata = {k: dstore['rup/' + k][idxs] for k in dstore['rup']}
+    keys = [k for k in dstore['rup'] if k != 'mean_std_' or allgsims]
+    rupdata = {k: dstore['rup/' + k][idxs] for k in keys}
+    if allgsims:  # reshape the cached arrays to (2, N, M, G)
+        M, G = len(iml4.imts), len(allgsims)
+        gidx = [allgsims.index(gsim) for gsim in cmaker.gsims]
+        rupdata['mean_std_'] = [arr.reshape(2, -1, M, G)[..., gidx]
+                                for arr in rupdata['mean_std_']]
     RuptureContext.temporal_occurrence_model = PoissonTOM(
         oq.investigation_time)
     pne_mon = monitor('disaggregate_pne', measuremem=False)
@@ -316,7 +326,17 @@ class DisaggregationCalculator(base.HazardCalculator):
         # submit #groups disaggregation tasks
         dstore = (self.datastore.parent if self.datastore.parent
                   else self.datastore)
+        if dstore.get_attr('source_info', 'num_reused', 0):
+            # the rup/ datasets contain only the recomputed sources
+            raise base.InvalidCalculationID(
+                'Cannot disaggregate on top of a classical calculation '
+                'reusing the PoEs of its parent: run a full calculation')
         indices = get_indices(dstore, oq.concurrent_tasks or 1)
+        self.mean_std_cached = cached = self.check_mean_std(dstore)
+        if cached:
+            logging.info('Using the mean_std_ arrays stored by the '
+                         'classical calculation')
+            gsims_by_trt = self.full_lt.get_gsims_by_trt()
         self.datastore.swmr_on()
         smap = parallel.Starmap(compute_disagg, h5=self.datastore.hdf5)
         for grp_id, trt in self.full_lt.trt_by_grp.items():
@@ -327,12 +347,39 @@ class DisaggregationCalculator(base.HazardCalculator):
                 {'truncation_level': oq.truncation_level,
                  'maximum_distance': src_filter.integration_distance,
                  'filter_distance': oq.filter_distance, 'imtls': oq.imtls})
+            allgsims = list(gsims_by_trt[trt]) if cached else None
             for idxs in indices[grp_id]:
                 smap.submit((dstore, idxs, cmaker, self.iml4, trti,
-                             self.bin_edges))
+                             self.bin_edges, allgsims))
         results = smap.reduce(self.agg_result, AccumDict(accum={}))
         return results  # sid -> trti-> 8D array
 
+    def check_mean_std(self, dstore):
+        """
+        :param dstore: the datastore containing the rup/ datasets
+        :returns: True if the mean_std_ arrays stored by the classical
+                  calculation are consistent with the IMTs, GSIMs, sites
+                  and sources of the current calculation
+        """
+        if 'rup/mean_std_' not in dstore:
+            return False
+        stored = dstore.get_attrs('rup/mean_std_')
+        # the sources are known only if they were read by this calculation
+        expected = get_mean_std_attrs(self.oqparam.imtls, self.full_lt,
+                                      self.sitecol, getattr(self, 'csm', None))
+        for name, value in expected.items():
+            if name not in stored:
+                different = True
+            elif isinstance(value, list):
+                different = decode(list(stored[name])) != value
+            else:
+                different = stored[name] != value
+            if different:
+                logging.warning('The %s differ from the ones of the stored '
+                                'mean_std_ arrays, recomputing them', name)
+                return False
+        return True
+
     def agg_result(self, acc, result):
         """
         Collect the results coming from compute_disagg into self.results.
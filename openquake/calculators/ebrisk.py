@@ -28,7 +28,7 @@ from openquake.hazardlib.calc.filters import getdefault
 from openquake.risklib import riskmodels
 from openquake.risklib.scientific import LossesByAsset
 from openquake.risklib.riskinput import (
-    cache_epsilons, get_assets_by_taxo, get_output)
+    get_epsilon_getter, get_assets_by_taxo, get_output)
 from openquake.commonlib import logs
 from openquake.calculators import base, event_based, getters
 from openquake.calculators.post_risk import PostRiskCalculator
@@ -71,7 +71,7 @@ def calc_risk(gmfs, param, monitor):
     lba.alt = general.AccumDict(
         accum=general.AccumDict(accum=numpy.zeros(L, F32)))
     lba.losses_by_E = numpy.zeros((E, L), F32)
-    tempname = param['tempname']
+    epsgetter = param['epsgetter']
     eid2rlz = dict(events[['id', 'rlz_id']])
     eid2idx = {eid: idx for idx, eid in enumerate(eids)}
     aggby = param['aggregate_by']
@@ -96,7 +96,7 @@ def calc_risk(gmfs, param, monitor):
                 ws = weights[[eid2rlz[eid] for eid in haz['eid']]]
             else:
                 ws = None
-            assets_by_taxo = get_assets_by_taxo(assets, tempname)  # fast
+            assets_by_taxo = get_assets_by_taxo(assets, epsgetter)  # fast
             eidx = numpy.array([eid2idx[eid] for eid in haz['eid']])  # fast
             out = get_output(crmodel, assets_by_taxo, haz)  # slow
         with mon_agg:
@@ -221,8 +221,7 @@ class EbriskCalculator(event_based.EventBasedCalculator):
         self.init_logic_tree(full_lt)
         self.set_param(
             hdf5path=self.datastore.filename,
-            tempname=cache_epsilons(
-                self.datastore, oq, self.assetcol, self.crmodel, self.E))
+            epsgetter=get_epsilon_getter(oq, self.crmodel))
         srcfilter = self.src_filter(self.datastore.tempname)
         logging.info('Sending %d ruptures', len(self.datastore['ruptures']))
         self.events_per_sid = []
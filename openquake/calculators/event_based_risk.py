@@ -49,7 +49,7 @@ def event_based_risk(riskinputs, crmodel, param, monitor):
         a dictionary of numpy arrays of shape (L, R)
     """
     L = len(crmodel.lti)
-    tempname = param['tempname']
+    epsgetter = param['epsgetter']
     for ri in riskinputs:
         with monitor('getting hazard'):
             ri.hazard_getter.init()
@@ -70,7 +70,7 @@ def event_based_risk(riskinputs, crmodel, param, monitor):
             P = len(builder.return_periods)
             all_curves = numpy.zeros((A, R, P), builder.loss_dt)
         # update the result dictionary and the agg array with each output
-        for out in ri.gen_outputs(crmodel, monitor, tempname, hazard):
+        for out in ri.gen_outputs(crmodel, monitor, epsgetter, hazard):
             if len(out.eids) == 0:  # this happens for sites with no events
                 continue
             r = out.rlzi
@@ -161,11 +161,9 @@ class EbrCalculator(base.RiskCalculator):
                 self.param['builder'] = get_loss_builder(
                     parent if parent else self.datastore,
                     oq.return_periods, oq.loss_dt())
-        # sorting the eids is essential to get the epsilons in the right
-        # order (i.e. consistent with the one used in ebr from ruptures)
         self.riskinputs = self.build_riskinputs('gmf')
-        self.param['tempname'] = riskinput.cache_epsilons(
-            self.datastore, oq, self.assetcol, self.crmodel, self.E)
+        self.param['epsgetter'] = riskinput.get_epsilon_getter(
+            oq, self.crmodel)
         self.param['avg_losses'] = oq.avg_losses
         self.param['ses_ratio'] = oq.ses_ratio
         self.param['stats'] = list(oq.hazard_stats().items())
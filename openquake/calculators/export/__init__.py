@@ -15,11 +15,16 @@
 #
 # You should have received a copy of the GNU Affero General Public License
 # along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+import os
+import shutil
 import zipfile
 import logging
+from openquake.baselib import parallel
 from openquake.baselib.general import CallableDict
 from openquake.commonlib.writers import write_csv
 
+CHUNKSIZE = 1_000_000  # number of rows per part file in write_csv_parts
+
 
 class MissingExporter(Exception):
     """
@@ -46,6 +51,53 @@ def export_csv(ekey, dstore):
     return [write_csv(dstore.export_path(name), array)]
 
 
+def write_csv_part(array, fname, sep, fmt, monitor):
+    """
+    Task formatting a chunk of a composite array into a headerless part file
+
+    :returns: the name of the part file
+    """
+    with open(fname, 'wb') as f:
+        write_csv(f, array, sep, fmt, 'no-header')
+    return fname
+
+
+def write_csv_parts(fname, array, sep=',', fmt='%.6E', header=None,
+                    renamedict=None, chunksize=None):
+    """
+    Save a (possibly huge) composite array in CSV format. The array is split
+    in chunks of `chunksize` rows which are formatted in parallel into part
+    files; then the parts are concatenated in order into `fname`.
+
+    :param fname: the path of the CSV file to generate
+    :param array: a composite array
+    :param sep: separator to use (default comma)
+    :param fmt: formatting string for the floats (default '%.6E')
+    :param header: optional list with the names of the columns
+    :param renamedict: a dictionary for renaming the columns
+    :param chunksize: the maximum number of rows per part (or CHUNKSIZE)
+    :returns: the path of the CSV file
+    """
+    chunksize = chunksize or CHUNKSIZE
+    if len(array) <= chunksize:
+        return write_csv(fname, array, sep, fmt, header,
+                         renamedict=renamedict)
+    starts = range(0, len(array), chunksize)
+    parts = ['%s.part%03d' % (fname, i) for i in range(len(starts))]
+    logging.info('Exporting %s in %d parts', fname, len(parts))
+    allargs = [(array[start:start + chunksize], part, sep, fmt)
+               for start, part in zip(starts, parts)]
+    for _ in parallel.Starmap(write_csv_part, allargs):
+        pass  # wait for all the parts to be written
+    with open(fname, 'wb') as dest:
+        write_csv(dest, array[:0], sep, fmt, header, renamedict=renamedict)
+        for part in parts:
+            with open(part, 'rb') as f:
+                shutil.copyfileobj(f, dest)
+            os.remove(part)
+    return fname
+
+
 def keyfunc(ekey):
     """
     Extract the name before the slash:
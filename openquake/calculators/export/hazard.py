@@ -29,7 +29,7 @@ from openquake.hazardlib.imt import from_string
 from openquake.hazardlib.calc import disagg
 from openquake.calculators.views import view
 from openquake.calculators.extract import extract, get_mesh, get_info
-from openquake.calculators.export import export
+from openquake.calculators.export import export, write_csv_parts
 from openquake.calculators.getters import gen_rgetters
 from openquake.commonlib import writers, hazard_writers, calc, util
 
@@ -405,8 +405,8 @@ def export_gmf_data_csv(ekey, dstore):
         writers.write_csv(f, sites)
         fname = dstore.build_fname('gmf', 'data', 'csv')
         gmfa.sort(order=['eid', 'sid'])
-        writers.write_csv(fname, _expand_gmv(gmfa, imts),
-                          renamedict={'sid': 'site_id', 'eid': 'event_id'})
+        write_csv_parts(fname, _expand_gmv(gmfa, imts),
+                        renamedict={'sid': 'site_id', 'eid': 'event_id'})
         if 'sigma_epsilon' in dstore['gmf_data']:
             sig_eps_csv = dstore.build_fname('sigma_epsilon', '', 'csv')
             sig_eps = dstore['gmf_data/sigma_epsilon'][()]
@@ -16,12 +16,15 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with OpenQuake.  If not, see <http://www.gnu.org/licenses/>.
 from urllib.parse import parse_qs
-from functools import lru_cache, partial
+from functools import partial
 import collections
+import hashlib
 import logging
+import pickle
 import gzip
+import time
+import tempfile
 import ast
-import io
 import os
 
 import requests
@@ -43,7 +46,9 @@ F64 = numpy.float64
 TWO32 = 2 ** 32
 ALL = slice(None)
 CHUNKSIZE = 4*1024**2  # 4 MB
-memoized = lru_cache()
+CACHE_MAXSIZE = 256*1024**2  # max size of the extract cache, 256 MB
+# (cache filename, entry name) -> last access time, saved in ExtractCache.set
+ACCESS_TIMES = {}
 
 
 class NotFound(Exception):
@@ -158,6 +163,110 @@ def extract_(dstore, dspath):
         return obj
 
 
+def normalize(key, what):
+    """
+    :returns: a canonical form of the query, independent from the order
+              of the parameters
+
+    >>> normalize('agg_curves', 'loss_type=structural&kind=mean')
+    'agg_curves?kind=mean&loss_type=structural'
+    >>> normalize('hmaps', 'PGA')
+    'hmaps/PGA'
+    """
+    if '=' not in what:
+        return '%s/%s' % (key, what) if what else key
+    qdic = parse_qs(what)
+    return key + '?' + '&'.join('%s=%s' % (k, v) for k in sorted(qdic)
+                                for v in qdic[k])
+
+
+def get_mtime(dstore):
+    """
+    :returns: the modification time of the datastore (and of its parent)
+    """
+    mtime = os.path.getmtime(dstore.filename)
+    if dstore.parent != ():
+        mtime = max(mtime, os.path.getmtime(dstore.parent.filename))
+    return mtime
+
+
+class ExtractCache(object):
+    """
+    Persistent cache for the results of the extractors, stored in a file
+    calc_XXX_extract.hdf5 next to the datastore. The entries are keyed by
+    the normalized query and are invalidated when the datastore changes;
+    the least recently used entries are evicted when the total size
+    exceeds `maxsize` bytes. The lookups open the file in read mode and
+    keep the access times in memory; they are stored in the file by `set`.
+
+    :param dstore: a DataStore instance opened in read mode
+    :param maxsize: the maximum size of the cache in bytes
+    """
+    def __init__(self, dstore, maxsize=CACHE_MAXSIZE):
+        self.filename = dstore.filename[:-5] + '_extract.hdf5'
+        self.mtime = get_mtime(dstore)
+        self.maxsize = maxsize
+
+    def _name(self, query):
+        return hashlib.sha1(query.encode('utf-8')).hexdigest()
+
+    def get(self, query):
+        """
+        :param query: a normalized query
+        :returns: the cached ArrayWrapper or None
+        """
+        if not os.path.exists(self.filename):
+            return
+        name = self._name(query)
+        with hdf5.File(self.filename, 'r') as f:
+            if name not in f or f[name].attrs['mtime'] != self.mtime:
+                return
+            aw = pickle.loads(f[name][()].tobytes())
+        ACCESS_TIMES[self.filename, name] = time.time()
+        return aw
+
+    def set(self, query, aw):
+        """
+        Store the given ArrayWrapper, by evicting the stale entries and the
+        least recently used ones if the cache is full
+
+        :param query: a normalized query
+        :param aw: an ArrayWrapper
+        """
+        data = pickle.dumps(aw, pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.maxsize:
+            return
+        if (os.path.exists(self.filename) and
+                os.path.getsize(self.filename) > 2 * self.maxsize):
+            # the space of the deleted entries is not always reused by HDF5
+            os.remove(self.filename)
+        with hdf5.File(self.filename, 'a') as f:
+            entries = []  # (atime, name, nbytes)
+            for name in list(f):
+                dset = f[name]
+                atime = ACCESS_TIMES.pop((self.filename, name), None)
+                if dset.attrs['mtime'] != self.mtime:
+                    del f[name]
+                    continue
+                elif atime and atime > dset.attrs['atime']:
+                    dset.attrs['atime'] = atime
+                entries.append((dset.attrs['atime'], name,
+                                dset.attrs['nbytes']))
+            entries.sort()
+            tot = sum(e[2] for e in entries) + len(data)
+            for atime, name, nbytes in entries:
+                if tot <= self.maxsize:
+                    break
+                del f[name]
+                tot -= nbytes
+            name = self._name(query)
+            if name in f:
+                del f[name]
+            f[name] = numpy.void(data)
+            f.save_attrs(name, dict(query=query, mtime=self.mtime,
+                                    atime=time.time(), nbytes=len(data)))
+
+
 class Extract(dict):
     """
     A callable dictionary of functions with a single instance called
@@ -166,25 +275,48 @@ class Extract(dict):
     string) by passing as argument the second part of `fullkey`.
 
     For instance extract(dstore, 'sitecol').
+
+    The functions added with `cache=True` are expensive: their results
+    are stored in an :class:`ExtractCache` when the datastore is read-only.
     """
+    def __init__(self):
+        super().__init__()
+        self.cached = set()
+
     def add(self, key, cache=False):
         def decorator(func):
-            self[key] = memoized(func) if cache else func
+            self[key] = func
+            if cache:
+                self.cached.add(key)
             return func
         return decorator
 
     def __call__(self, dstore, key):
         if '/' in key:
             k, v = key.split('/', 1)
-            data = self[k](dstore, v)
         elif '?' in key:
             k, v = key.split('?', 1)
-            data = self[k](dstore, v)
         elif key in self:
-            data = self[key](dstore, '')
+            k, v = key, ''
         else:
-            data = extract_(dstore, key)
-        return ArrayWrapper.from_(data)
+            return ArrayWrapper.from_(extract_(dstore, key))
+        func = self[k]
+        if k not in self.cached or getattr(dstore, 'mode', None) != 'r':
+            return ArrayWrapper.from_(func(dstore, v))
+        cache = ExtractCache(dstore)
+        query = normalize(k, v)
+        try:
+            aw = cache.get(query)
+        except OSError as exc:  # for instance the file is locked
+            logging.warning('Could not read %s: %s', cache.filename, exc)
+            aw = None
+        if aw is None:
+            aw = ArrayWrapper.from_(func(dstore, v))
+            try:
+                cache.set(query, aw)
+            except OSError as exc:
+                logging.warning('Could not write %s: %s', cache.filename, exc)
+        return aw
 
 
 extract = Extract()
@@ -356,7 +488,7 @@ def _get_dict(dstore, name, imtls, stats):
     return dic
 
 
-@extract.add('hcurves')
+@extract.add('hcurves', cache=True)
 def extract_hcurves(dstore, what):
     """
     Extracts hazard curves. Use it as /extract/hcurves?kind=mean or
@@ -656,7 +788,7 @@ extract.add('tot_curves')(partial(extract_curves, tot='tot_'))
 extract.add('app_curves')(partial(extract_curves, tot='app_'))
 
 
-@extract.add('agg_curves')
+@extract.add('agg_curves', cache=True)
 def extract_agg_curves(dstore, what):
     """
     Aggregate loss curves from the ebrisk calculator:
@@ -1159,7 +1291,7 @@ def extract_disagg(dstore, what):
         return ArrayWrapper(numpy.array(allvalues), qdict)
 
 
-@extract.add('disagg_layer')
+@extract.add('disagg_layer', cache=True)
 def extract_disagg_layer(dstore, what):
     """
     Extract a disaggregation output containing all sites
@@ -1234,7 +1366,7 @@ class RuptureData(object):
         return numpy.array(data, self.dt)
 
 
-@extract.add('rupture_info')
+@extract.add('rupture_info', cache=True)
 def extract_rupture_info(dstore, what):
     """
     Extract some information about the ruptures, including the boundary.
@@ -1363,16 +1495,23 @@ class WebExtractor(Extractor):
         """
         url = '%s/v1/calc/%d/extract/%s' % (self.server, self.calc_id, what)
         logging.info('GET %s', url)
-        resp = self.sess.get(url)
+        resp = self.sess.get(url, stream=True)
         if resp.status_code != 200:
             raise WebAPIError(resp.text)
-        logging.info('Read %s of data' % general.humansize(len(resp.content)))
-        npz = numpy.load(io.BytesIO(resp.content))
-        attrs = {k: npz[k] for k in npz if k != 'array'}
-        try:
-            arr = npz['array']
-        except KeyError:
-            arr = ()
+        # the .npz data are streamed in chunks into a temporary file
+        with tempfile.TemporaryFile() as f:
+            nbytes = 0
+            for chunk in resp.iter_content(CHUNKSIZE):
+                f.write(chunk)
+                nbytes += len(chunk)
+            logging.info('Read %s of data' % general.humansize(nbytes))
+            f.seek(0)
+            npz = numpy.load(f)
+            attrs = {k: npz[k] for k in npz if k != 'array'}
+            try:
+                arr = npz['array']
+            except KeyError:
+                arr = ()
         return ArrayWrapper(arr, attrs)
 
     def dump(self, fname):
@@ -79,7 +79,9 @@ class PmapGetter(object):
     def __init__(self, dstore, weights, sids=None, poes=()):
         self.dstore = dstore
         self.sids = dstore['sitecol'].sids if sids is None else sids
-        if len(weights[0].dic) == 1:  # no weights by IMT
+        if isinstance(weights, numpy.ndarray):  # no weights by IMT
+            self.weights = weights
+        elif len(weights[0].dic) == 1:  # no weights by IMT
             self.weights = numpy.array([w['weight'] for w in weights])
         else:
             self.weights = weights
@@ -16,11 +16,10 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with OpenQuake.  If not, see <http://www.gnu.org/licenses/>.
 
-import ast
 import logging
 import numpy
 
-from openquake.baselib import general, parallel, datastore
+from openquake.baselib import general, datastore
 from openquake.baselib.python3compat import encode
 from openquake.hazardlib.stats import set_rlzs_stats
 from openquake.risklib import scientific
@@ -28,6 +27,7 @@ from openquake.calculators import base
 
 F32 = numpy.float32
 U32 = numpy.uint32
+ELT_CHUNKSIZE = 10_000_000  # max number of rows of event_loss_table per chunk
 
 
 def get_loss_builder(dstore, return_periods=None, loss_dt=None):
@@ -69,29 +69,39 @@ def build_loss_tables(dstore):
     dstore['rup_loss_table'] = tbl
 
 
-def post_ebrisk(dstore, aggkey, monitor):
+def gen_elt_chunks(dstore, chunksize):
     """
+    Read the event loss tables of all the aggregation keys, grouping them
+    in chunks of at most `chunksize` rows (a chunk can be larger only
+    if it contains a single aggregation key).
+
     :param dstore: a DataStore instance
-    :param aggkey: aggregation key
-    :param monitor: Monitor instance
-    :returns: a dictionary rlzi -> {agg_curves, agg_losses, idx}
+    :param chunksize: the maximum number of rows in a chunk
+    :yields: triples (idxs, losses, keys) where idxs is an array of shape
+        (K, T) of tag indices, losses an array of shape (N, L) and keys an
+        array of shape (N, 2) of pairs (index in idxs, rlzi)
     """
-    dstore.open('r')
-    oq = dstore['oqparam']
-    try:
-        df = dstore.read_df('event_loss_table/' + aggkey,
-                            ['event_id', 'rlzi'])
-    except (KeyError, dstore.EmptyDataset):   # no data for this realization
-        return {}
-    if ',' in aggkey:
-        idx = tuple(idx - 1 for idx in ast.literal_eval(aggkey))
-    else:
-        idx = (int(aggkey) - 1,)
-    builder = get_loss_builder(dstore)
-    out = {}
-    for rlzi, curves, losses in builder.gen_curves_by_rlz(df, oq.ses_ratio):
-        out[rlzi] = dict(agg_curves=curves, agg_losses=losses, idx=idx)
-    return out
+    idxs, arrays = [], []
+    size = 0
+    for aggkey, dset in dstore['event_loss_table'].items():
+        if size + len(dset) > chunksize and arrays:
+            yield _elt_chunk(idxs, arrays)
+            idxs, arrays, size = [], [], 0
+        if len(dset):
+            idxs.append([int(idx) - 1 for idx in aggkey.split(',')])
+            arrays.append(dset[()])
+            size += len(dset)
+    if arrays:
+        yield _elt_chunk(idxs, arrays)
+
+
+def _elt_chunk(idxs, arrays):
+    keys = numpy.zeros((sum(len(arr) for arr in arrays), 2), U32)
+    keys[:, 0] = numpy.repeat(numpy.arange(len(arrays)),
+                              [len(arr) for arr in arrays])
+    elt = numpy.concatenate(arrays)
+    keys[:, 1] = elt['rlzi']
+    return numpy.array(idxs), elt['loss'], keys
 
 
 @base.calculators.add('post_risk')
@@ -164,31 +174,15 @@ class PostRiskCalculator(base.RiskCalculator):
         self.build_datasets(builder, [], 'app_')
         self.build_datasets(builder, [], 'tot_')
         ds = self.datastore
-        if oq.aggregate_by:
-            aggkeys = list(ds['event_loss_table'])
-            ds.swmr_on()
-            smap = parallel.Starmap(
-                post_ebrisk, [(self.datastore, aggkey) for aggkey in aggkeys],
-                h5=self.datastore.hdf5)
-        else:
-            smap = ()
         # do everything in process since it is really fast
         elt = ds.read_df('losses_by_event', ['event_id', 'rlzi'])
         for r, curves, losses in builder.gen_curves_by_rlz(elt, oq.ses_ratio):
             ds['tot_curves-rlzs'][:, r] = curves  # PL
             ds['tot_losses-rlzs'][:, r] = losses  # L
-        for res in smap:
-            if not res:
-                continue
-            for r, dic in res.items():
-                if oq.aggregate_by:
-                    ds['agg_curves-rlzs'][
-                        (slice(None), r, slice(None)) + dic['idx']  # PRLT..
-                    ] = dic['agg_curves']
-                    ds['agg_losses-rlzs'][
-                        (slice(None), r) + dic['idx']  # LRT...
-                    ] = dic['agg_losses']
-                    ds['app_curves-rlzs'][:, r] += dic['agg_curves']  # PL
+        if oq.aggregate_by:
+            with self.monitor('aggregating event_loss_table',
+                              measuremem=True):
+                self.build_agg_curves(builder)
         if self.R > 1:
             logging.info('Computing aggregate statistics')
             set_rlzs_stats(self.datastore, 'app_curves')
@@ -198,6 +192,35 @@ class PostRiskCalculator(base.RiskCalculator):
                 set_rlzs_stats(self.datastore, 'agg_curves')
                 set_rlzs_stats(self.datastore, 'agg_losses')
 
+    def build_agg_curves(self, builder, chunksize=ELT_CHUNKSIZE):
+        """
+        Build the datasets agg_curves-rlzs, agg_losses-rlzs and
+        app_curves-rlzs by reading the event loss table in big chunks and
+        by grouping the losses by (aggregation key, realization); the
+        results of each chunk are written as soon as they are computed,
+        one aggregation key at the time, so that only the small
+        app_curves array is kept in memory.
+        """
+        ds = self.datastore
+        ses_ratio = self.oqparam.ses_ratio
+        app_curves = numpy.zeros(ds['app_curves-rlzs'].shape, F32)  # PRL
+        for idxs, elt, keys in gen_elt_chunks(ds, chunksize):
+            ukeys, crvs, sums = builder.curves_by_key(elt, keys)
+            # the unique keys are sorted, so the realizations of the same
+            # aggregation key are contiguous and in increasing order
+            ks, starts = numpy.unique(ukeys[:, 0], return_index=True)
+            stops = list(starts[1:]) + [len(ukeys)]
+            for k, start, stop in zip(ks, starts, stops):
+                rlzs = [int(r) for r in ukeys[start:stop, 1]]
+                idx = tuple(int(i) for i in idxs[k])
+                curves = crvs[start:stop].transpose(1, 0, 2)  # PRL
+                ds['agg_curves-rlzs'][
+                    (slice(None), rlzs, slice(None)) + idx] = curves
+                ds['agg_losses-rlzs'][(slice(None), rlzs) + idx] = (
+                    sums[start:stop].T * ses_ratio)  # LR
+                app_curves[:, rlzs] += curves
+        ds['app_curves-rlzs'][...] = app_curves
+
     def post_execute(self, dummy):
         pass
 
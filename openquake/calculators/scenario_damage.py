@@ -39,16 +39,25 @@ def floats_in(numbers):
 
 def bin_ddd(fractions, n, seed):
     """
-    Converting fractions into discrete damage distributions using bincount
-    and numpy.random.choice
+    Converting fractions into discrete damage distributions by sampling
+    the number of units in each damage state with a chain of binomial
+    distributions, i.e. a multinomial distribution; the cost is O(E * D),
+    independently from the number of units n
     """
     n = int(n)
-    D = fractions.shape[1]  # shape (E, D)
-    ddd = numpy.zeros(fractions.shape, U32)
+    E, D = fractions.shape
+    probs = fractions / fractions.sum(axis=1)[:, None]
     numpy.random.seed(seed)
-    for e, frac in enumerate(fractions):
-        ddd[e] = numpy.bincount(
-            numpy.random.choice(D, n, p=frac/frac.sum()), minlength=D)
+    ddd = numpy.zeros((E, D), U32)
+    left = numpy.full(E, n, numpy.int64)  # units not assigned yet
+    rest = numpy.ones(E)  # probability of the damage states not seen yet
+    for d in range(D - 1):
+        p = numpy.divide(probs[:, d], rest, out=numpy.ones(E),
+                         where=rest > 0)
+        ddd[:, d] = numpy.random.binomial(left, numpy.clip(p, 0, 1))
+        left -= ddd[:, d]
+        rest -= probs[:, d]
+    ddd[:, D - 1] = left
     return ddd
 
 
@@ -96,43 +105,65 @@ def scenario_damage(riskinputs, crmodel, param, monitor):
     seed = param['master_seed']
     # algorithm used to compute the discrete damage distributions
     make_ddd = approx_ddd if param['approx_ddd'] else bin_ddd
+    aed_dt = param['aed_dt']
     for ri in riskinputs:
         # otherwise test 4b will randomly break with last digit changes
         # in dmg_by_event :-(
         result = dict(d_asset=[])
         for name in consequences:
             result[name + '_by_asset'] = []
-        ddic = AccumDict(accum=numpy.zeros((L, D - 1), F32))  # aid,eid->dd
+        aeds = []  # arrays (aid, eid, dd), one per output
         with haz_mon:
             ri.hazard_getter.init()
+        aids = ri.assets['ordinal']
+        numbers = ri.assets['number']
         for out in ri.gen_outputs(crmodel, monitor):
             with rsk_mon:
                 r = out.rlzi
+                A, E = len(aids), len(out.eids)
+                # discrete damage distributions in COO format, i.e. a
+                # record (aid, eid, dd) for each asset and event
+                aed = numpy.zeros(A * E, aed_dt)
+                aed['aid'] = numpy.repeat(aids, E)
+                aed['eid'] = numpy.tile(out.eids, A)
+                csq_by_event = {name: numpy.zeros((E, L)) for name in
+                                consequences}
                 for l, loss_type in enumerate(crmodel.loss_types):
-                    for asset, fractions in zip(ri.assets, out[loss_type]):
-                        aid = asset['ordinal']
-                        ddds = make_ddd(fractions, asset['number'], seed + aid)
-                        for e, ddd in enumerate(ddds):
-                            eid = out.eids[e]
-                            ddic[aid, eid][l] = ddd[1:]
-                            d_event[eid][l] += ddd[1:]
-                        if make_ddd is approx_ddd:
-                            ms = mean_std(fractions * asset['number'])
-                        else:
-                            ms = mean_std(ddds)
-                        result['d_asset'].append((l, r, asset['ordinal'], ms))
+                    fractions = out[loss_type]  # shape (A, E, D)
+                    # NB: each asset has its own seed, so that the damage
+                    # distributions do not depend on the task distribution
+                    ddds = numpy.array([
+                        make_ddd(fracs, number, seed + aid)
+                        for fracs, number, aid in zip(
+                            fractions, numbers, aids)])  # shape (A, E, D)
+                    aed['dd'][:, l] = ddds[:, :, 1:].reshape(A * E, D - 1)
+                    if make_ddd is approx_ddd:
+                        values = fractions * numbers[:, None, None]
+                    else:
+                        values = ddds
+                    means = values.mean(axis=1)  # shape (A, D)
+                    stds = (values.std(axis=1, ddof=1) if E > 1
+                            else numpy.ones_like(means) * numpy.nan)
+                    for aid, mean, std in zip(aids, means, stds):
+                        result['d_asset'].append((l, r, aid, (mean, std)))
+                    for asset, fracs in zip(ri.assets, fractions):
                         # TODO: use the ddd, not the fractions in compute_csq
-                        csq = crmodel.compute_csq(asset, fractions, loss_type)
+                        csq = crmodel.compute_csq(asset, fracs, loss_type)
                         for name, values in csq.items():
                             result[name + '_by_asset'].append(
                                 (l, r, asset['ordinal'], mean_std(values)))
-                            by_event = res[name + '_by_event']
-                            for eid, value in zip(out.eids, values):
-                                by_event[eid][l] += value
+                            csq_by_event[name][:, l] += values
+                # sum the damage distributions by event
+                tot = numpy.zeros((E, L, D - 1), U32)
+                numpy.add.at(tot, numpy.tile(numpy.arange(E), A), aed['dd'])
+                for e, eid in enumerate(out.eids):
+                    d_event[eid] += tot[e]
+                    for name in consequences:
+                        res[name + '_by_event'][eid] += csq_by_event[name][e]
+                aeds.append(aed)
         with rsk_mon:
-            result['aed'] = aed = numpy.zeros(len(ddic), param['aed_dt'])
-            for i, ((aid, eid), dd) in enumerate(sorted(ddic.items())):
-                aed[i] = (aid, eid, dd)
+            aed = numpy.concatenate(aeds) if aeds else numpy.zeros(0, aed_dt)
+            result['aed'] = aed[numpy.lexsort((aed['eid'], aed['aid']))]
         yield result
     yield res
 
@@ -83,7 +83,7 @@ def scenario_risk(riskinputs, crmodel, param, monitor):
     for ri in riskinputs:
         with mon:
             ri.hazard_getter.init()
-        for out in ri.gen_outputs(crmodel, monitor, param['tempname']):
+        for out in ri.gen_outputs(crmodel, monitor, param['epsgetter']):
             r = out.rlzi
             slc = param['event_slice'](r)
             for l, loss_type in enumerate(crmodel.loss_types):
@@ -128,8 +128,8 @@ class ScenarioRiskCalculator(base.RiskCalculator):
             _event_slice, oq.number_of_ground_motion_fields)
         E = oq.number_of_ground_motion_fields * self.R
         self.riskinputs = self.build_riskinputs('gmf')
-        self.param['tempname'] = riskinput.cache_epsilons(
-            self.datastore, oq, self.assetcol, self.crmodel, E)
+        self.param['epsgetter'] = riskinput.get_epsilon_getter(
+            oq, self.crmodel)
         self.param['E'] = E
         # assuming the weights are the same for all IMTs
         try:
@@ -17,14 +17,18 @@
 # along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
 
 import os
+import shutil
+import tempfile
 import unittest
 import unittest.mock as mock
 import numpy
 from openquake.baselib import parallel
+from openquake.baselib.hdf5 import ArrayWrapper
 from openquake.hazardlib import InvalidFile
 from openquake.calculators.views import view
 from openquake.calculators.export import export
-from openquake.calculators.extract import extract
+from openquake.calculators.extract import (
+    extract, normalize, ExtractCache)
 from openquake.calculators.tests import CalculatorTestCase, NOT_DARWIN
 from openquake.qa_tests_data.classical import (
     case_1, case_2, case_3, case_4, case_5, case_6, case_7, case_8, case_9,
@@ -206,6 +210,27 @@ class ClassicalTestCase(CalculatorTestCase):
                           '0.0269', '0.0376', '0.0527', '0.0738', '0.103',
                           '0.145', '0.203', '0.284'))
 
+        # the second extraction reads the data from the extract cache
+        cache = ExtractCache(self.calc.datastore)
+        self.assertTrue(os.path.exists(cache.filename))
+        mtime = os.path.getmtime(cache.filename)
+        aw = cache.get(normalize('hcurves', ''))
+        numpy.testing.assert_equal(aw.all, haz['all'])
+        # the lookup does not write on the cache file
+        self.assertEqual(os.path.getmtime(cache.filename), mtime)
+        haz2 = vars(extract(self.calc.datastore, 'hcurves'))
+        numpy.testing.assert_equal(haz2['all'], haz['all'])
+
+        # the entries read recently are evicted last
+        cache = ExtractCache(self.calc.datastore, maxsize=20000)
+        for query in 'abc':
+            cache.set(query, ArrayWrapper(numpy.zeros(1000), {}))
+            if query == 'b':
+                self.assertIsNotNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('c'))
+
     def test_case_14(self):
         # test classical with 2 gsims and 1 sample
         self.assert_curves_ok(['hazard_curve-rlz-000_PGA.csv'],
@@ -355,6 +380,48 @@ hazard_uhs-std.csv
         dupl = sum(len(src.grp_ids) - 1 for src in sg)
         self.assertEqual(dupl, 29)  # there are 29 duplicated sources
 
+    def test_case_20_poes_by_src(self):
+        # incremental calculation: changing the rate of the characteristic
+        # source only the 3 CHAR1 sources are recomputed, the other 4 are
+        # reused from the parent
+        tmp = os.path.join(tempfile.mkdtemp(), 'case_20')
+        shutil.copytree(os.path.dirname(case_20.__file__), tmp)
+        testfile = os.path.join(tmp, '__init__.py')
+        self.run_calc(testfile, 'job.ini', poes_by_src='true')
+        hc_id = str(self.calc.datastore.calc_id)
+        parent = self.calc.datastore['hcurves-rlzs'][()]
+        pinfo = self.calc.datastore['source_info'][()]
+        # a single sparse dataset for the only TRT, plus the grp_ids
+        self.assertEqual(sorted(self.calc.datastore['poes_by_src']),
+                         ['grp_ids', 'trt-00'])
+
+        # nothing changed, all the sources are reused
+        self.run_calc(testfile, 'job.ini', hazard_calculation_id=hc_id)
+        self.assertEqual(self.calc.datastore.get_attr(
+            'source_info', 'num_reused'), 7)
+        numpy.testing.assert_allclose(
+            self.calc.datastore['hcurves-rlzs'][()], parent)
+        # the information about the reused sources is copied
+        info = self.calc.datastore['source_info'][()]
+        for field in ('num_ruptures', 'num_sites', 'eff_ruptures'):
+            numpy.testing.assert_allclose(info[field], pinfo[field])
+
+        fname = os.path.join(tmp, 'source_model.xml')
+        with open(fname, encoding='utf-8') as f:
+            xml = f.read().replace('<occurRates>0.02</occurRates>',
+                                   '<occurRates>0.03</occurRates>')
+        with open(fname, 'w', encoding='utf-8') as f:
+            f.write(xml)
+        self.run_calc(testfile, 'job.ini', hazard_calculation_id=hc_id)
+        self.assertEqual(self.calc.datastore.get_attr(
+            'source_info', 'num_reused'), 4)
+        incremental = self.calc.datastore['hcurves-rlzs'][()]
+
+        # compare with the full recomputation
+        self.run_calc(testfile, 'job.ini')
+        numpy.testing.assert_allclose(
+            incremental, self.calc.datastore['hcurves-rlzs'][()])
+
     def test_case_21(self):
         # Simple fault dip and MFD enumeration
         self.assert_curves_ok([
@@ -423,6 +490,20 @@ hazard_uhs-std.csv
     def test_case_27(self):  # Nankai mutex model
         self.assert_curves_ok(['hazard_curve.csv'], case_27.__file__)
 
+    def test_case_27_poes_by_src(self):
+        # the sources of mutex groups are never reused
+        self.run_calc(case_27.__file__, 'job.ini', poes_by_src='true')
+        hc_id = str(self.calc.datastore.calc_id)
+        parent = self.calc.datastore['hcurves-stats'][()]
+        self.assertEqual(len(self.calc.datastore['poes_by_src/grp_ids']), 0)
+        self.assertEqual(len(self.calc.datastore['poes_by_src/trt-00']), 0)
+
+        self.run_calc(case_27.__file__, 'job.ini', hazard_calculation_id=hc_id)
+        self.assertEqual(self.calc.datastore.get_attr(
+            'source_info', 'num_reused'), 0)
+        numpy.testing.assert_allclose(
+            self.calc.datastore['hcurves-stats'][()], parent)
+
     def test_case_28(self):  # North Africa
         # MultiPointSource with modify MFD logic tree
         self.assert_curves_ok([
@@ -18,6 +18,7 @@
 import os
 import sys
 import unittest
+from unittest import mock
 import numpy
 from openquake.baselib.general import gettemp
 from openquake.hazardlib.probability_map import combine
@@ -32,11 +33,12 @@ from openquake.qa_tests_data.disagg import (
 
 class DisaggregationTestCase(CalculatorTestCase):
 
-    def assert_curves_ok(self, expected, test_dir, fmt='xml', delta=None):
-        self.run_calc(test_dir, 'job.ini', calculation_mode='classical')
+    def assert_curves_ok(self, expected, test_dir, fmt='xml', delta=None,
+                         **kw):
+        self.run_calc(test_dir, 'job.ini', calculation_mode='classical', **kw)
         hc_id = self.calc.datastore.calc_id
         out = self.run_calc(test_dir, 'job.ini', exports=fmt,
-                            hazard_calculation=str(hc_id))
+                            hazard_calculation=str(hc_id), **kw)
         got = out['disagg', fmt]
         self.assertEqual(len(expected), len(got))
         for fname, actual in zip(expected, got):
@@ -114,6 +116,32 @@ class DisaggregationTestCase(CalculatorTestCase):
             self.run_calc(case_3.__file__, 'job.ini')
         self.assertEqual(str(ctx.exception), 'Cannot do any disaggregation')
 
+    def test_case_2_cache_mean_std(self):
+        # the mean_std_ arrays stored by the classical calculation are used
+        if sys.platform == 'darwin':
+            raise unittest.SkipTest('MacOSX')
+        self.assert_curves_ok(
+            ['rlz-0-SA(0.1)-sid-0.xml',
+             'rlz-0-SA(0.1)-sid-1.xml',
+             'rlz-1-SA(0.1)-sid-0.xml',
+             'rlz-1-SA(0.1)-sid-1.xml',
+             'rlz-2-SA(0.1)-sid-1.xml',
+             'rlz-3-SA(0.1)-sid-1.xml'],
+            case_2.__file__, cache_mean_std='true')
+        self.assertTrue(self.calc.mean_std_cached)
+
+        # the cache is ignored if the GSIMs or the sites are different
+        self.calc.datastore.open('r')
+        attrs = self.calc.datastore.get_attrs('rup/mean_std_')
+        dstore = mock.MagicMock()
+        dstore.__contains__.return_value = True
+        changes = dict(gsims=attrs['gsims'][::-1], sites=attrs['sites'] + 1)
+        for name, value in changes.items():
+            dstore.get_attrs.return_value = dict(attrs, **{name: value})
+            self.assertFalse(self.calc.check_mean_std(dstore))
+        dstore.get_attrs.return_value = attrs
+        self.assertTrue(self.calc.check_mean_std(dstore))
+
     def test_case_4(self):
         # this is case with number of lon/lat bins different for site 0/site 1
         # this exercise sampling
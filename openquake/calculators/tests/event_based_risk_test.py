@@ -24,6 +24,7 @@ from openquake.baselib.general import gettemp
 from openquake.baselib.hdf5 import read_csv
 from openquake.calculators.views import view, rst_table
 from openquake.calculators.tests import CalculatorTestCase, strip_calc_id
+from openquake.calculators import post_risk
 from openquake.calculators.export import export
 from openquake.calculators.extract import extract
 from openquake.qa_tests_data.event_based_risk import (
@@ -168,6 +169,21 @@ class EventBasedRiskTestCase(CalculatorTestCase):
         tmp = gettemp(rst_table(aw.to_table()))
         self.assertEqualFiles('expected/agg_curves8.csv', tmp)
 
+        # writing the curves chunk by chunk gives the same datasets
+        self.calc.datastore.close()
+        prc = post_risk.PostRiskCalculator(
+            self.calc.oqparam, self.calc.datastore.calc_id)
+        ds = prc.datastore
+        names = 'agg_curves-rlzs', 'agg_losses-rlzs', 'app_curves-rlzs'
+        expected = [ds[name][()] for name in names]
+        prc.pre_execute()
+        prc.build_agg_curves(post_risk.get_loss_builder(ds), chunksize=1)
+        for name, exp in zip(names, expected):
+            numpy.testing.assert_allclose(ds[name][()], exp, atol=1E-5)
+        # app_curves is the sum of agg_curves over the tags
+        numpy.testing.assert_allclose(
+            expected[0].sum(axis=(3, 4)), expected[2], rtol=1E-5)
+
     def test_case_1f(self):
         # vulnerability function with BT
         self.run_calc(case_1f.__file__, 'job_h.ini,job_r.ini')
@@ -20,6 +20,7 @@ import io
 import os
 import re
 import math
+from unittest import mock
 
 import numpy.testing
 
@@ -136,6 +137,11 @@ class EventBasedTestCase(CalculatorTestCase):
         [fname, _, _] = out['gmf_data', 'csv']
         self.assertEqualFiles('expected/gmf-data.csv', fname)
 
+        # test the export in parts
+        with mock.patch('openquake.calculators.export.CHUNKSIZE', 500):
+            [fname, _, _] = export(('gmf_data', 'csv'), self.calc.datastore)
+        self.assertEqualFiles('expected/gmf-data.csv', fname)
+
         [fname] = export(('hcurves', 'csv'), self.calc.datastore)
         self.assertEqualFiles(
             'expected/hazard_curve-smltp_b1-gsimltp_b1.csv', fname)
@@ -17,6 +17,7 @@
 # along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
 
 import os
+import unittest
 import numpy
 
 from openquake.baselib.general import fast_agg3
@@ -26,6 +27,7 @@ from openquake.qa_tests_data.scenario_damage import (
     case_1, case_1c, case_2, case_3, case_4, case_4b, case_5, case_5a,
     case_6, case_7, case_8, case_9, case_10)
 from openquake.calculators.tests import CalculatorTestCase, strip_calc_id
+from openquake.calculators.scenario_damage import bin_ddd
 from openquake.calculators.extract import extract
 from openquake.calculators.export import export
 from openquake.calculators.views import view
@@ -33,6 +35,37 @@ from openquake.calculators.views import view
 aac = numpy.testing.assert_allclose
 
 
+def choice_ddd(fractions, n, seed):
+    # reference implementation sampling the damage state of each unit
+    D = fractions.shape[1]
+    ddd = numpy.zeros(fractions.shape, numpy.uint32)
+    numpy.random.seed(seed)
+    for e, frac in enumerate(fractions):
+        ddd[e] = numpy.bincount(
+            numpy.random.choice(D, n, p=frac / frac.sum()), minlength=D)
+    return ddd
+
+
+class BinDDDTestCase(unittest.TestCase):
+    def test_same_distribution(self):
+        fractions = numpy.array([[.762, .222, .014, .002, 0.]] * 5000)
+        got = bin_ddd(fractions, 2000, 42)
+        exp = choice_ddd(fractions, 2000, 42)
+        numpy.testing.assert_equal(got.sum(axis=1), 2000)
+        self.assertEqual(got[:, 4].sum(), 0)  # impossible damage state
+        # same means and stddevs within the statistical errors
+        aac(got.mean(axis=0), exp.mean(axis=0), atol=1.)
+        aac(got.std(axis=0), exp.std(axis=0), rtol=.05)
+        aac(got.mean(axis=0), fractions[0] * 2000, atol=1.)
+
+    def test_many_units(self):
+        # the cost does not depend on the number of units
+        fractions = numpy.random.RandomState(42).dirichlet(numpy.ones(5), 1000)
+        ddd = bin_ddd(fractions, 1E9, 42)
+        numpy.testing.assert_equal(ddd.sum(axis=1), 1E9)
+        aac(ddd / 1E9, fractions, atol=1E-3)
+
+
 class ScenarioDamageTestCase(CalculatorTestCase):
     def assert_ok(self, pkg, job_ini, exports='csv', kind='dmg'):
         test_dir = os.path.dirname(pkg.__file__)
@@ -72,7 +105,7 @@ RM       4_000
         # test agg_damages, 1 realization x 3 damage states
         [dmg] = extract(self.calc.datastore, 'agg_damages/structural?'
                         'taxonomy=RC&CRESTA=01.1')
-        aac([1528., 444., 28.], dmg, atol=1E-4)
+        aac([1474., 501., 25.], dmg, atol=1E-4)
         # test no intersection
         dmg = extract(self.calc.datastore, 'agg_damages/structural?'
                       'taxonomy=RM&CRESTA=01.1')
@@ -106,6 +139,11 @@ RM       4_000
     def test_case_4b(self):
         self.run_calc(case_4b.__file__, 'job_haz.ini,job_risk.ini')
 
+        # dd_data contains a row per asset and event, even without damage
+        data = self.calc.datastore['dd_data/data'][()]
+        self.assertEqual(len(data), len(self.calc.assetcol) * self.calc.E)
+        self.assertGreater((data['dd'].sum(axis=(1, 2)) == 0).sum(), 0)
+
         [fname] = export(('dmg_by_event', 'csv'), self.calc.datastore)
         self.assertEqualFiles('expected/' + strip_calc_id(fname), fname)
 
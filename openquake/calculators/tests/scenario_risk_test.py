@@ -68,7 +68,7 @@ class ScenarioRiskTestCase(CalculatorTestCase):
 
         # test agglosses
         tot = extract(self.calc.datastore, 'agg_losses/occupants')
-        aac(tot.array, [0.031716], atol=1E-5)
+        aac(tot.array, [0.031412], atol=1E-5)
 
         # test agglosses with *
         tbl = extract(self.calc.datastore, 'agg_losses/occupants?taxonomy=*')
@@ -85,8 +85,8 @@ class ScenarioRiskTestCase(CalculatorTestCase):
         self.assertEqualFiles('expected/agg_loss.csv', fname)
 
     def test_case_4(self):
-        # this test is sensitive to the ordering of the epsilons
-        # in openquake.riskinput.make_eps
+        # this test is sensitive to the epsilons generated
+        # by openquake.risklib.riskinput.EpsilonGetter
         out = self.run_calc(case_4.__file__, 'job.ini', exports='csv')
         fname = gettemp(view('totlosses', self.calc.datastore))
         self.assertEqualFiles('expected/totlosses.txt', fname)
@@ -168,7 +168,7 @@ class ScenarioRiskTestCase(CalculatorTestCase):
                       'state=*&cresta=0.11')
         self.assertEqual(obj.selected, [b'state=*', b'cresta=0.11'])
         self.assertEqual(obj.tags, [b'state=01'])
-        aac(obj.array, [[2499.0835, 2949.6074]])
+        aac(obj.array, [[2438.6511, 3143.647]])
 
     def test_case_7(self):
         # check independence from concurrent_tasks
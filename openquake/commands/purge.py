@@ -31,16 +31,29 @@ def purge_one(calc_id, user, force):
     dbcmd('del_calc', calc_id, user, force)
     f1 = os.path.join(datadir, 'calc_%s.hdf5' % calc_id)
     f2 = os.path.join(datadir, 'calc_%s_tmp.hdf5' % calc_id)
-    for f in [f1, f2]:
+    f3 = os.path.join(datadir, 'calc_%s_extract.hdf5' % calc_id)
+    for f in [f1, f2, f3]:
         if os.path.exists(f):  # not removed yet
             os.remove(f)
             print('Removed %s' % f)
 
 
+def purge_cache():
+    """
+    Remove the cached exposures and asset collections in $OQ_DATADIR/cache
+    """
+    cachedir = os.path.join(datadir, 'cache')
+    if os.path.exists(cachedir):
+        for fname in os.listdir(cachedir):
+            f = os.path.join(cachedir, fname)
+            os.remove(f)
+            print('Removed %s' % f)
+
+
 # used in the reset command
 def purge_all(user=None):
     """
-    Remove all calculations of the given user
+    Remove all calculations of the given user and the cache
     """
     user = user or getpass.getuser()
     if os.path.exists(datadir):
@@ -49,14 +62,19 @@ def purge_all(user=None):
             if mo is not None:
                 calc_id = int(mo.group(2))
                 purge_one(calc_id, user, force=True)
+        purge_cache()
 
 
 @sap.script
-def purge(calc_id, force=False):
+def purge(calc_id=None, force=False, cache=False):
     """
     Remove the given calculation. If you want to remove all calculations,
-    use oq reset.
+    use oq reset. With --cache remove the cached exposures.
     """
+    if cache:
+        purge_cache()
+    if calc_id is None:
+        return
     if calc_id < 0:
         try:
             calc_id = datastore.get_calc_ids(datadir)[calc_id]
@@ -68,3 +86,4 @@ def purge(calc_id, force=False):
 
 purge.arg('calc_id', 'calculation ID', type=int)
 purge.flg('force', 'ignore dependent calculations')
+purge.flg('cache', 'remove the cached exposures')
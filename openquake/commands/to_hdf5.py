@@ -15,10 +15,9 @@
 #
 # You should have received a copy of the GNU Affero General Public License
 # along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
-import os
 import numpy
-from openquake.baselib import sap, hdf5, node, performance
-from openquake.hazardlib import nrml
+from openquake.baselib import sap, hdf5, performance
+from openquake.hazardlib import sourcetables
 
 
 def convert_npz_hdf5(input_file, output_file):
@@ -30,24 +29,16 @@ def convert_npz_hdf5(input_file, output_file):
 
 
 def convert_xml_hdf5(input_file, output_file):
-    with hdf5.File(output_file, 'w') as out:
-        inp = nrml.read(input_file)
-        if inp['xmlns'].endswith('nrml/0.4'):  # old version
-            d = os.path.dirname(input_file) or '.'
-            raise ValueError('Please upgrade with `oq upgrade_nrml %s`' % d)
-        elif inp['xmlns'].endswith('nrml/0.5'):  # current version
-            sm = inp.sourceModel
-        else:  # not a NRML
-            raise ValueError('Unknown NRML:' % inp['xmlns'])
-        out.save(node.node_to_dict(sm))
-    return output_file
+    return sourcetables.write(input_file, output_file)
 
 
 @sap.script
 def to_hdf5(input):
     """
-    Convert .xml and .npz files to .hdf5 files.
-    """    
+    Convert .xml and .npz files to .hdf5 files. The .xml files must be
+    source models, which are converted into the columnar format readable
+    by the engine.
+    """
     with performance.Monitor('to_hdf5') as mon:
         for input_file in input:
             if input_file.endswith('.npz'):
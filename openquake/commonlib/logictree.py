@@ -27,6 +27,7 @@ with attributes `value`, `weight`, `lt_path` and `ordinal`.
 import io
 import os
 import re
+import copy
 import time
 import logging
 import functools
@@ -44,7 +45,7 @@ import openquake.hazardlib.source as ohs
 from openquake.hazardlib.gsim.mgmpe.avg_gmpe import AvgGMPE
 from openquake.hazardlib.gsim.base import CoeffsTable
 from openquake.hazardlib.imt import from_string
-from openquake.hazardlib import valid, nrml, InvalidFile, pmf
+from openquake.hazardlib import valid, nrml, InvalidFile, pmf, sourcetables
 from openquake.hazardlib.sourceconverter import SourceGroup
 from openquake.commonlib.lt import (
     LogicTreeError, parse_uncertainty, apply_uncertainty)
@@ -570,7 +571,8 @@ class SourceModelLogicTree(object):
             if branchset.uncertainty_type in ('sourceModel', 'extendModel'):
                 try:
                     for fname in value_node.text.strip().split():
-                        if fname.endswith(('.xml', '.nrml')):  # except UCERF
+                        # all source model files except the UCERF ones
+                        if fname.endswith(('.xml', '.nrml', '.hdf5')):
                             self.collect_source_model_data(
                                 branchnode['branchID'], fname)
                 except Exception as exc:
@@ -784,6 +786,13 @@ class SourceModelLogicTree(object):
         information is used then for :meth:`validate_filters` and
         :meth:`validate_uncertainty_value`.
         """
+        if source_model.endswith('.hdf5'):  # columnar source model
+            trts, ids, types = sourcetables.get_info(
+                os.path.join(self.basepath, source_model))
+            self.tectonic_region_types.update(trts)
+            self.source_ids[branch_id].extend(ids)
+            self.source_types.update(types)
+            return
         # using regular expressions is a lot faster than using the
         with self._get_source_model(source_model) as sm:
             xml = sm.read()
@@ -802,45 +811,118 @@ class SourceModelLogicTree(object):
         :return:
             A list of SourceGroups
         """
-        dirname = os.path.dirname(self.filename)
+        [src_groups] = self.apply_all_uncertainties([ltpath], fname,
+                                                    converter)
+        return src_groups
+
+    def apply_all_uncertainties(self, ltpaths, fname, converter):
+        """
+        Apply the uncertainties of several logic tree paths on the same
+        source model file. The file is read once and the source groups
+        are built once per distinct prefix of the paths; the sources
+        unaffected by an uncertainty are shared between the paths, the
+        sources affected are copied before being modified and each
+        sequence of uncertainties is applied to a source only once.
+
+        :param ltpaths:
+            List of lists of branch IDs
+        :param fname:
+            Path to a source model file
+        :param converter:
+            class:`openquake.hazardlib.sourceconverter.SourceConverter` object
+        :return:
+            A list of lists of SourceGroups, one per path
+        """
         [sm] = nrml.read_source_models([fname], converter)
-        base_ids = set(src.source_id for sg in sm.src_groups for src in sg)
-        src_groups = sm.src_groups
+        changes = {}  # id(src) -> branch IDs applied to the source
+        modified = {}  # (source_id, branch IDs) -> modified source
+        memo = {(): sm.src_groups}  # prefix -> src_groups
+        counted = set()  # IDs of the sources with updated num_ruptures
+        out = []
+        for ltpath in ltpaths:
+            prefix = ()
+            src_groups = sm.src_groups
+            for branchset, branch in self._get_branches(ltpath):
+                prefix += (branch.branch_id,)
+                if prefix not in memo:
+                    memo[prefix] = self._apply(
+                        src_groups, branchset, branch, sm.fname, converter,
+                        changes, modified)
+                src_groups = memo[prefix]
+            # make shallow copies, since the calculators change the
+            # attributes of the sources (grp_id, id, ...) for each path
+            groups = []
+            for sg in src_groups:
+                sources = []
+                for src in sg:
+                    if id(src) in changes and id(src) not in counted:
+                        # redoing count_ruptures can be slow
+                        src.num_ruptures = src.count_ruptures()
+                        counted.add(id(src))
+                    sources.append(copy.copy(src))
+                grp = copy.copy(sg)
+                grp.sources = sources
+                groups.append(grp)
+            out.append(groups)
+        return out
+
+    def _get_branches(self, ltpath):
+        # returns the pairs (branchset, branch) in the path, except the
+        # ones of kind sourceModel; the extendModel ones come first, so
+        # that the other uncertainties are applied to the extensions too
+        extend, other = [], []
         path = ltpath
         branchset = self.root_branchset
-        branchsets_and_uncertainties = []
         while branchset is not None:
             brid, path = path[0], path[1:]
             branch = branchset[brid]
             if branchset.uncertainty_type == 'extendModel':
-                extname = os.path.join(dirname, branch.value)
-                [ext] = nrml.read_source_models([extname], converter)
-                extra_ids = set(src.source_id for sg in ext.src_groups
-                                for src in sg)
-                common = base_ids & extra_ids
-                if common:
-                    raise InvalidFile(
-                        '%s contains source(s) %s already present in %s' %
-                        (extname, common, sm.fname))
-                src_groups.extend(ext.src_groups)
+                extend.append((branchset, branch))
             elif branchset.uncertainty_type != 'sourceModel':
-                branchsets_and_uncertainties.append(
-                    (branchset, branch.value))
+                other.append((branchset, branch))
             branchset = branch.bset
-        if branchsets_and_uncertainties:
-            for sg in src_groups:
-                sg.changes = 0
-                for source in sg:
-                    changes = 0
-                    for bset, value in branchsets_and_uncertainties:
-                        if bset.filter_source(source):
-                            apply_uncertainty(
-                                bset.uncertainty_type, source, value)
-                            changes += 1
-                    if changes:  # redoing count_ruptures can be slow
-                        source.num_ruptures = source.count_ruptures()
-                        sg.changes += changes
-        return src_groups
+        return extend + other
+
+    def _apply(self, src_groups, branchset, branch, smname, converter,
+               changes, modified):
+        # apply the uncertainty of the branch to a list of source groups,
+        # returning a new list of source groups
+        if branchset.uncertainty_type == 'extendModel':
+            dirname = os.path.dirname(self.filename)
+            extname = os.path.join(dirname, branch.value)
+            [ext] = nrml.read_source_models([extname], converter)
+            base_ids = set(src.source_id for sg in src_groups for src in sg)
+            extra_ids = set(src.source_id for sg in ext.src_groups
+                            for src in sg)
+            common = base_ids & extra_ids
+            if common:
+                raise InvalidFile(
+                    '%s contains source(s) %s already present in %s' %
+                    (extname, common, smname))
+            return src_groups + ext.src_groups
+        new_groups = []
+        for sg in src_groups:
+            sources = []
+            n = 0
+            for source in sg:
+                if branchset.filter_source(source):
+                    brids = changes.get(id(source), ()) + (branch.branch_id,)
+                    key = source.source_id, brids
+                    if key not in modified:
+                        new = copy.deepcopy(source)
+                        apply_uncertainty(
+                            branchset.uncertainty_type, new, branch.value)
+                        changes[id(new)] = brids
+                        modified[key] = new
+                    source = modified[key]
+                    n += 1
+                sources.append(source)
+            if n:  # copy on write
+                sg = copy.copy(sg)
+                sg.sources = sources
+                sg.changes += n
+            new_groups.append(sg)
+        return new_groups
 
     def get_trti_eri(self):
         """
@@ -969,6 +1051,115 @@ class ImtWeight(object):
         return '<%s %s>' % (self.__class__.__name__, self.dic)
 
 
+def _imt_weight(dic):
+    # build an ImtWeight instance from a dictionary
+    weight = object.__new__(ImtWeight)
+    weight.dic = dic
+    return weight
+
+
+class RlzSpace(object):
+    """
+    Index-based space of GSIM realizations. The realization with index
+    `rlzi` corresponds to the branch indices `numpy.unravel_index(rlzi,
+    shape)`, one for each tectonic region type, i.e. the realizations
+    are numbered in mixed radix, in the same order as
+    `itertools.product(*brlists)`. Weights, paths and GSIMs are computed
+    on demand with vectorized operations, so that the realizations are
+    never enumerated unless required.
+
+    :param brlists: a list of T lists of BranchTuples, one per TRT
+    :param samples: the number of paths collapsed into each realization
+    :param order: if not None, an array of indices in the order of the
+                  realization ordinals
+    """
+    def __init__(self, brlists, samples=1, order=None):
+        self.brlists = brlists
+        self.shape = tuple(len(brs) for brs in brlists)
+        self.samples = samples
+        self.order = order
+        keys = set()
+        for brs in brlists:
+            for br in brs:
+                keys.update(br.weight.dic)
+        self.weight_keys = ['weight'] + sorted(keys - {'weight'})
+        # array of shape (B, K) for each TRT
+        self.wdata = [numpy.array([[br.weight[k] for k in self.weight_keys]
+                                   for br in brs]) for brs in brlists]
+
+    def __len__(self):
+        return int(numpy.prod(self.shape)) if self.shape else 0
+
+    def get_rlzis(self):
+        """
+        :returns: the indices of the realizations in order of ordinal
+        """
+        if self.order is None:
+            return numpy.arange(len(self))
+        return self.order
+
+    def get_indices(self, rlzis):
+        """
+        :param rlzis: N realization indices
+        :returns: an array of shape (N, T) with the branch indices
+        """
+        return numpy.array(numpy.unravel_index(rlzis, self.shape)).T
+
+    def get_weights(self, rlzis):
+        """
+        :param rlzis: N realization indices
+        :returns: an array of shape (N, K), K being the number of weight keys
+        """
+        idxs = self.get_indices(rlzis)
+        weights = numpy.ones((len(idxs), len(self.weight_keys)))
+        for t, wdata in enumerate(self.wdata):
+            weights *= wdata[idxs[:, t]]
+        return weights
+
+    def get_paths(self, rlzis):
+        """
+        :param rlzis: N realization indices
+        :returns: a list of N tuples of branch IDs ('@' if not effective)
+        """
+        ids = [[br.id if br.effective else '@' for br in brs]
+               for brs in self.brlists]
+        return [tuple(ids[t][bi] for t, bi in enumerate(idxs))
+                for idxs in self.get_indices(rlzis)]
+
+    def get_rlzs(self, rlzis=None, ordinals=None):
+        """
+        :param rlzis: N realization indices (if None, all of them)
+        :param ordinals: N ordinals (if None, 0, 1, ... N-1)
+        :returns: a list of N Realization instances
+        """
+        if rlzis is None:
+            rlzis = self.get_rlzis()
+        if ordinals is None:
+            ordinals = range(len(rlzis))
+        gsims = [[br.gsim for br in brs] for brs in self.brlists]
+        rlzs = []
+        for ordinal, idxs, weights, path in zip(
+                ordinals, self.get_indices(rlzis), self.get_weights(rlzis),
+                self.get_paths(rlzis)):
+            value = tuple(gsims[t][bi] for t, bi in enumerate(idxs))
+            weight = _imt_weight(dict(zip(self.weight_keys, weights)))
+            rlzs.append(Realization(value, weight, ordinal, path,
+                                    self.samples))
+        return rlzs
+
+    def sample(self, n, seed):
+        """
+        :param n: number of samples
+        :param seed: random seed
+        :returns: n realization indices
+        """
+        idxs = []
+        for t, wdata in enumerate(self.wdata):
+            numpy.random.seed(seed + t)
+            idxs.append(numpy.random.choice(len(wdata), n, p=wdata[:, 0]))
+        return numpy.ravel_multi_index(idxs, self.shape)
+
+
 class GsimLogicTree(object):
     """
     A GsimLogicTree instance is an iterable yielding `Realization`
@@ -1239,50 +1430,70 @@ class GsimLogicTree(object):
             [trt] = self.values
         return sorted(self.values[trt])
 
+    def get_space(self):
+        """
+        :returns: the :class:`RlzSpace` of all the paths of the tree
+        """
+        # NB: branches are already sorted
+        return RlzSpace([[b for b in self.branches if b.trt == trt]
+                         for trt in self.values])
+
+    def get_effective_space(self):
+        """
+        :returns: the :class:`RlzSpace` of the effective realizations,
+                  where the branches of the non-effective tectonic region
+                  types are collapsed into a single branch with ID '@'
+        """
+        brlists = []
+        samples = 1
+        effective = False
+        prefix_free = True
+        for brs in self.get_space().brlists:
+            if brs and not brs[0].effective:
+                samples *= len(brs)
+                weight = sum(br.weight for br in brs)
+                brs = [BranchTuple(brs[0].trt, '@', brs[0].gsim, weight,
+                                   False)]
+            elif brs:
+                effective = True
+                ids = [br.id for br in brs]
+                if any(i1 != i2 and i2.startswith(i1)
+                       for i1 in ids for i2 in ids):
+                    prefix_free = False
+            brlists.append(brs)
+        if not effective:
+            return RlzSpace([])
+        space = RlzSpace(brlists, samples)
+        if not prefix_free:
+            # the realizations are ordered by path ID, as in
+            # get_effective_rlzs, which is not the mixed-radix order
+            # when a branch ID is a prefix of another branch ID
+            pids = ['_'.join(path) for path in space.get_paths(
+                numpy.arange(len(space)))]
+            space.order = numpy.array(
+                sorted(range(len(pids)), key=pids.__getitem__))
+        return space
+
     def sample(self, n, seed):
         """
         :param n: number of samples
         :param seed: random seed
         :returns: n Realization objects
         """
-        brlists = [sample([b for b in self.branches if b.trt == trt],
-                          n, seed + i) for i, trt in enumerate(self.values)]
-        rlzs = []
-        for i in range(n):
-            weight = 1
-            lt_path = []
-            lt_uid = []
-            value = []
-            for brlist in brlists:  # there is branch list for each TRT
-                branch = brlist[i]
-                lt_path.append(branch.id)
-                lt_uid.append(branch.id if branch.effective else '@')
-                weight *= branch.weight
-                value.append(branch.gsim)
-            rlz = Realization(tuple(value), weight, i, tuple(lt_uid), 1)
-            rlzs.append(rlz)
+        space = self.get_space()
+        rlzs = space.get_rlzs(space.sample(n, seed))
+        for rlz in rlzs:
+            rlz.samples = 1
         return rlzs
 
     def __iter__(self):
         """
         Yield :class:`openquake.commonlib.logictree.Realization` instances
         """
-        groups = []
-        # NB: branches are already sorted
-        for trt in self.values:
-            groups.append([b for b in self.branches if b.trt == trt])
-        # with T tectonic region types there are T groups and T branches
-        for i, branches in enumerate(itertools.product(*groups)):
-            weight = 1
-            lt_path = []
-            lt_uid = []
-            value = []
-            for trt, branch in zip(self.values, branches):
-                lt_path.append(branch.id)
-                lt_uid.append(branch.id if branch.effective else '@')
-                weight *= branch.weight
-                value.append(branch.gsim)
-            yield Realization(tuple(value), weight, i, tuple(lt_uid), 1)
+        space = self.get_space()
+        for rlzi in range(len(space)):
+            [rlz] = space.get_rlzs([rlzi], [rlzi])
+            yield rlz
 
     def __repr__(self):
         lines = ['%s,%s,%s,w=%s' %
@@ -19,8 +19,13 @@
 Set up some system-wide loggers
 """
 import os.path
+import sys
+import queue
+import atexit
 import socket
 import logging
+import threading
+import functools
 from datetime import datetime
 from contextlib import contextmanager
 from openquake.baselib import zeromq, config, parallel, datastore
@@ -32,22 +37,63 @@ LEVELS = {'debug': logging.DEBUG,
           'critical': logging.CRITICAL}
 
 DBSERVER_PORT = int(os.environ.get('OQ_DBSERVER_PORT') or config.dbserver.port)
+QUEUE_SIZE = 10000  # max number of log records waiting to be stored
+BATCH_SIZE = 1000  # max number of log records stored in a single call
+
+gethostbyname = functools.lru_cache()(socket.gethostbyname)
+_local = threading.local()  # thread-local connection to the dbserver
+_sockets = []  # all the connections opened by the current process
+
+
+def _get_socket():
+    # returns a REQ socket connected to the dbserver, one per process and
+    # thread, since zmq sockets cannot be shared among threads
+    host = gethostbyname(config.dbserver.host)
+    address = 'tcp://%s:%s' % (host, DBSERVER_PORT)
+    pid = os.getpid()
+    sock = getattr(_local, 'sock', None)
+    if sock is None or _local.key != (pid, address):
+        sock = zeromq.Socket(address, zeromq.zmq.REQ, 'connect')
+        sock.__enter__()
+        _local.sock, _local.key = sock, (pid, address)
+        _sockets.append((pid, sock))
+    return sock
+
+
+@atexit.register
+def _close_sockets():
+    # close the connections opened by the current process
+    pid = os.getpid()
+    for pid_, sock in _sockets:
+        if pid_ == pid and hasattr(sock, 'zsocket'):
+            sock.__exit__(None, None, None)
+    _sockets.clear()
+    _local.sock = None
 
 
 def dbcmd(action, *args):
     """
-    A dispatcher to the database server.
+    A dispatcher to the database server. The connection is opened at the
+    first call and then reused.
 
     :param string action: database action to perform
     :param tuple args: arguments
     """
-    host = socket.gethostbyname(config.dbserver.host)
-    sock = zeromq.Socket(
-        'tcp://%s:%s' % (host, DBSERVER_PORT), zeromq.zmq.REQ, 'connect')
-    with sock:
+    sock = _get_socket()
+    try:
         res = sock.send((action,) + args)
-        if isinstance(res, parallel.Result):
-            return res.get()
+    except BaseException:
+        # the REQ socket could be in an invalid state, close it and
+        # use a new one at the next call
+        _local.sock = None
+        for i, (pid, s) in enumerate(_sockets):
+            if s is sock:
+                del _sockets[i]
+                break
+        sock.__exit__(None, None, None)
+        raise
+    if isinstance(res, parallel.Result):
+        return res.get()
     return res
 
 
@@ -100,17 +146,72 @@ class LogFileHandler(logging.FileHandler):
 
 class LogDatabaseHandler(logging.Handler):
     """
-    Log stream handler
+    Log handler storing the records in the database. The records are put
+    in a bounded queue and stored in batches by a background thread;
+    when the queue is full `emit` blocks until there is space again.
+    In forked processes the records are stored one at the time.
     """
-    def __init__(self, job_id):
+    def __init__(self, job_id, queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE):
         super().__init__()
         self.job_id = job_id
+        self.batch_size = batch_size
+        self.pid = os.getpid()
+        self.queue = queue.Queue(queue_size)
+        self.thread = None
 
     def emit(self, record):  # pylint: disable=E0202
         if record.levelno >= logging.INFO:
-            dbcmd('log', self.job_id, datetime.utcnow(), record.levelname,
-                  '%s/%s' % (record.processName, record.process),
-                  record.getMessage())
+            row = (self.job_id, datetime.utcnow(), record.levelname,
+                   '%s/%s' % (record.processName, record.process),
+                   record.getMessage())
+            if os.getpid() != self.pid:  # in a forked process
+                dbcmd('log', *row)
+                return
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._store)
+                self.thread.daemon = True
+                self.thread.start()
+            self.queue.put(row)
+
+    def _store(self):
+        # store the queued records in batches, until a None is received
+        running = True
+        while running:
+            rows = [self.queue.get()]
+            while len(rows) < self.batch_size:
+                try:
+                    rows.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            n = len(rows)
+            running = rows[-1] is not None
+            rows = [row for row in rows if row is not None]
+            try:
+                if rows:
+                    dbcmd('log_many', rows)
+            except Exception as exc:
+                sys.stderr.write('Could not store %d log records: %s\n'
+                                 % (len(rows), exc))
+            finally:
+                for _ in range(n):
+                    self.queue.task_done()
+
+    def flush(self):
+        """
+        Wait for the queued records to be stored
+        """
+        if self.thread is not None and os.getpid() == self.pid:
+            self.queue.join()
+
+    def close(self):
+        """
+        Store the queued records and stop the background thread
+        """
+        if self.thread is not None and os.getpid() == self.pid:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+        super().close()
 
 
 @contextmanager
@@ -145,6 +246,7 @@ def handle(job_id, log_level='info', log_file=None):
             logging.root.warn('The log file %s is empty!?' % log_file)
         for handler in handlers:
             logging.root.removeHandler(handler)
+            handler.close()
 
 
 def init(calc_id='nojob', level=logging.INFO):
@@ -22,6 +22,7 @@ import csv
 import copy
 import zlib
 import shutil
+import hashlib
 import zipfile
 import logging
 import tempfile
@@ -31,7 +32,7 @@ import collections
 import numpy
 import requests
 
-from openquake.baselib import hdf5
+from openquake.baselib import __version__, hdf5, datastore
 from openquake.baselib.general import (
     random_filter, countby, group_array, get_duplicates)
 from openquake.baselib.python3compat import decode, zip
@@ -721,20 +722,115 @@ def get_crmodel(oqparam):
     return crm
 
 
+CACHE_SIZE = 10 * 1024 ** 3  # maximum size in bytes of $OQ_DATADIR/cache
+
+
+def _cache_fname(prefix, checksum):
+    # path of a file in the cache directory $OQ_DATADIR/cache
+    dirname = os.path.join(datastore.get_datadir(), 'cache')
+    os.makedirs(dirname, exist_ok=True)
+    return os.path.join(dirname, '%s_%s.hdf5' % (prefix, checksum))
+
+
+def _touch_cache(fname):
+    # mark the file as recently used, see _evict_cache
+    try:
+        os.utime(fname)
+    except OSError:  # removed by a concurrent eviction
+        pass
+
+
+def _evict_cache(dirname, maxsize=CACHE_SIZE):
+    # remove the least recently used files in the cache directory until
+    # the total size is below `maxsize` bytes
+    fnames = [os.path.join(dirname, f) for f in os.listdir(dirname)
+              if f.endswith('.hdf5')]
+    stats = []
+    for fname in fnames:
+        try:
+            stats.append((os.path.getmtime(fname), os.path.getsize(fname),
+                          fname))
+        except OSError:  # removed by a concurrent eviction
+            pass
+    totsize = sum(size for _, size, _ in stats)
+    for _, size, fname in sorted(stats):
+        if totsize <= maxsize:
+            break
+        logging.info('Removing the cached file %s', fname)
+        try:
+            os.remove(fname)
+        except OSError:
+            pass
+        totsize -= size
+
+
+def _save_cache(fname, **objects):
+    # write on a temporary file and then rename it, so that a concurrent
+    # calculation can never read a partially written file
+    tmp = '%s.%d' % (fname, os.getpid())
+    with hdf5.File(tmp, 'w') as f:
+        for key, obj in objects.items():
+            f[key] = obj
+    os.replace(tmp, fname)
+    _evict_cache(os.path.dirname(fname))
+
+
+def get_exposure_checksum(oqparam):
+    """
+    :param oqparam:
+        an :class:`openquake.commonlib.oqvalidation.OqParam` instance
+    :returns:
+        a MD5 hex digest of the exposure files and of the parameters
+        affecting the reading of the exposure
+    """
+    md5 = hashlib.md5(__version__.encode('utf8'))
+    fnames = list(oqparam.inputs['exposure'])
+    for exp in asset.Exposure.read_headers(oqparam.inputs['exposure']):
+        fnames.extend(exp.datafiles)
+    for fname in fnames:
+        with open(fname, 'rb') as f:
+            # hash in blocks, to avoid reading large exposures in memory
+            for block in iter(lambda: f.read(1 << 20), b''):
+                md5.update(block)
+    params = [oqparam.calculation_mode, oqparam.region,
+              sorted(oqparam.ignore_missing_costs),
+              'country' in oqparam.aggregate_by]
+    md5.update(repr(params).encode('utf8'))
+    return md5.hexdigest()
+
+
 def get_exposure(oqparam):
     """
-    Read the full exposure in memory and build a list of
-    :class:`openquake.risklib.asset.Asset` instances.
+    Read the full exposure in memory and build a structured array
+    of assets. If the parameter `cache_exposure` is set, the exposure is
+    read from (or saved into) the cache directory, keyed by a checksum
+    of the exposure files.
 
     :param oqparam:
         an :class:`openquake.commonlib.oqvalidation.OqParam` instance
     :returns:
         an :class:`Exposure` instance or a compatible AssetCollection
     """
-    exposure = asset.Exposure.read(
-        oqparam.inputs['exposure'], oqparam.calculation_mode,
-        oqparam.region, oqparam.ignore_missing_costs,
-        by_country='country' in oqparam.aggregate_by)
+    if oqparam.cache_exposure:
+        checksum = get_exposure_checksum(oqparam)
+        fname = _cache_fname('exposure', checksum)
+        if os.path.exists(fname):
+            logging.info('Reading the cached exposure %s', fname)
+            with hdf5.File(fname, 'r') as f:
+                exposure = f['exposure']
+            _touch_cache(fname)
+        else:
+            exposure = asset.Exposure.read(
+                oqparam.inputs['exposure'], oqparam.calculation_mode,
+                oqparam.region, oqparam.ignore_missing_costs,
+                by_country='country' in oqparam.aggregate_by)
+            _save_cache(fname, exposure=exposure)
+        exposure.checksum = checksum
+    else:
+        exposure = asset.Exposure.read(
+            oqparam.inputs['exposure'], oqparam.calculation_mode,
+            oqparam.region, oqparam.ignore_missing_costs,
+            by_country='country' in oqparam.aggregate_by)
     exposure.mesh, exposure.assets_by_site = exposure.get_mesh_assets_by_site()
     return exposure
 
@@ -760,7 +856,51 @@ def get_sitecol_assetcol(oqparam, haz_sitecol=None, cost_types=()):
                          haz_distance, asset_hazard_distance)
     else:
         haz_distance = asset_hazard_distance
+    reduce_sitecol = (not oqparam.hazard_calculation_id and
+                      'gmfs' not in oqparam.inputs and
+                      'hazard_curves' not in oqparam.inputs)
+    if oqparam.cache_exposure:
+        md5 = hashlib.md5(exposure.checksum.encode('ascii'))
+        md5.update(haz_sitecol.complete.array.tobytes())
+        md5.update(haz_sitecol.sids.tobytes())
+        md5.update(repr([haz_distance, oqparam.time_event,
+                         reduce_sitecol]).encode('utf8'))
+        fname = _cache_fname('assetcol', md5.hexdigest())
+        if os.path.exists(fname):
+            logging.info('Reading the cached site and asset collections %s',
+                         fname)
+            with hdf5.File(fname, 'r') as f:
+                complete = f['sitecol']
+                sids = f['sids'][()]
+                assetcol = f['assetcol']
+                discarded = f['discarded'][()] if 'discarded' in f else []
+            _touch_cache(fname)
+            sitecol = (complete if len(sids) == len(complete)
+                       else complete.filtered(sids))
+        else:
+            sitecol, assetcol, discarded = _get_sitecol_assetcol(
+                oqparam, haz_sitecol, haz_distance, reduce_sitecol)
+            objs = dict(sitecol=sitecol.complete, sids=sitecol.sids,
+                        assetcol=assetcol)
+            if len(discarded):
+                objs['discarded'] = discarded
+            _save_cache(fname, **objs)
+    else:
+        sitecol, assetcol, discarded = _get_sitecol_assetcol(
+            oqparam, haz_sitecol, haz_distance, reduce_sitecol)
+    if assetcol.occupancy_periods:
+        missing = set(cost_types) - set(exposure.cost_types['name']) - set(
+            ['occupants'])
+    else:
+        missing = set(cost_types) - set(exposure.cost_types['name'])
+    if missing and not oqparam.calculation_mode.endswith('damage'):
+        raise InvalidFile('The exposure %s is missing %s' %
+                          (oqparam.inputs['exposure'], missing))
+    return sitecol, assetcol, discarded
+
 
+def _get_sitecol_assetcol(oqparam, haz_sitecol, haz_distance,
+                          reduce_sitecol):
     if haz_sitecol.mesh != exposure.mesh:
         # associate the assets to the hazard sites
         sitecol, assets_by, discarded = geo.utils.assoc(
@@ -782,17 +922,7 @@ def get_sitecol_assetcol(oqparam, haz_sitecol=None, cost_types=()):
                      len(sitecol), sum(len(a) for a in assets_by_site))
     assetcol = asset.AssetCollection(
         exposure, assets_by_site, oqparam.time_event)
-    if assetcol.occupancy_periods:
-        missing = set(cost_types) - set(exposure.cost_types['name']) - set(
-            ['occupants'])
-    else:
-        missing = set(cost_types) - set(exposure.cost_types['name'])
-    if missing and not oqparam.calculation_mode.endswith('damage'):
-        raise InvalidFile('The exposure %s is missing %s' %
-                          (oqparam.inputs['exposure'], missing))
-    if (not oqparam.hazard_calculation_id and 'gmfs' not in oqparam.inputs
-            and 'hazard_curves' not in oqparam.inputs
-            and sitecol is not sitecol.complete):
+    if reduce_sitecol and sitecol is not sitecol.complete:
         # for predefined hazard you cannot reduce the site collection; instead
         # you can in other cases, typically with a grid which is mostly empty
         # (i.e. there are many hazard sites with no assets)
@@ -23,7 +23,7 @@ import numpy
 from openquake.baselib import hdf5
 from openquake.baselib.python3compat import decode
 from openquake.baselib.general import groupby, AccumDict
-from openquake.hazardlib import source, sourceconverter
+from openquake.hazardlib import source, sourceconverter, pmf
 from openquake.commonlib import logictree
 
 
@@ -192,19 +192,30 @@ class FullLogicTree(object):
         """
         return dict(zip(self.gsim_lt.values, rlz.gsim_rlz.value))
 
+    def get_gsim_space(self):
+        """
+        :returns: the (cached) effective RlzSpace of the GSIM logic tree
+        """
+        if not hasattr(self, 'gsim_space'):
+            self.gsim_space = self.gsim_lt.get_effective_space()
+        return self.gsim_space
+
+    def _get_gsim_rlzis(self, sm):
+        # indices in the gsim space of the realizations of the source model
+        if self.num_samples:
+            space = self.gsim_lt.get_space()
+            return space, space.sample(sm.samples, self.seed + sm.ordinal)
+        space = self.get_gsim_space()
+        return space, space.get_rlzis()
+
     def get_rlzs(self, eri):
         """
         :returns: a list of LtRealization objects
         """
         rlzs = []
         sm = self.sm_rlzs[eri]
-        if self.num_samples:
-            gsim_rlzs = self.gsim_lt.sample(sm.samples, self.seed + sm.ordinal)
-        elif hasattr(self, 'gsim_rlzs'):  # cache
-            gsim_rlzs = self.gsim_rlzs
-        else:
-            self.gsim_rlzs = gsim_rlzs = logictree.get_effective_rlzs(
-                self.gsim_lt)
+        space, rlzis = self._get_gsim_rlzis(sm)
+        gsim_rlzs = space.get_rlzs(rlzis)
         for i, gsim_rlz in enumerate(gsim_rlzs):
             weight = sm.weight * gsim_rlz.weight
             rlz = LtRealization(sm.offset + i, sm.lt_path, gsim_rlz, weight)
@@ -231,15 +242,46 @@ class FullLogicTree(object):
                     rlz.weight = rlz.weight / tot_weight
         return rlzs
 
+    def get_weights(self):
+        """
+        :returns: an array of R weights if there are no weights by IMT,
+                  otherwise a list of R ImtWeight instances
+        """
+        if self.num_samples:
+            keys = self.gsim_lt.get_space().weight_keys
+            weights = numpy.ones((self.num_samples, len(keys)))
+            weights /= self.num_samples
+        else:
+            space = self.get_gsim_space()
+            keys = space.weight_keys
+            weights = numpy.concatenate(
+                [sm.weight * space.get_weights(space.get_rlzis())
+                 for sm in self.sm_rlzs])
+            tot = weights.sum(axis=0)
+            if (numpy.abs(tot - 1.) >= pmf.PRECISION).any():
+                # this may happen for rounding errors; we ensure the sum of
+                # the weights is 1
+                weights /= tot
+        if len(keys) == 1:  # no weights by IMT
+            return weights[:, 0]
+        return [logictree._imt_weight(dict(zip(keys, ws))) for ws in weights]
+
     def get_rlzs_by_gsim(self, grp_id):
         """
         :returns: a dictionary gsim -> rlzs
         """
         trti, eri = divmod(grp_id, len(self.sm_rlzs))
+        sm = self.sm_rlzs[eri]
+        space, rlzis = self._get_gsim_rlzis(sm)
+        if len(rlzis) == 0:
+            return {}
+        brs = space.brlists[trti]
+        bis = space.get_indices(rlzis)[:, trti]
         rlzs_by_gsim = AccumDict(accum=[])
-        for rlz in self.get_rlzs(eri):
-            rlzs_by_gsim[rlz.gsim_rlz.value[trti]].append(rlz.ordinal)
-        return {gsim: U32(rlzs) for gsim, rlzs in sorted(rlzs_by_gsim.items())}
+        for bi in numpy.unique(bis):  # different branches can share a gsim
+            rlzs_by_gsim[brs[bi].gsim].extend(numpy.where(bis == bi)[0])
+        return {gsim: U32(sorted(rlzs)) + sm.offset
+                for gsim, rlzs in sorted(rlzs_by_gsim.items())}
 
     def get_rlzs_by_gsim_grp(self):
         """
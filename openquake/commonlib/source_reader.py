@@ -74,19 +74,22 @@ class SourceReader(object):
             self.srcfilter = calc.filters.SourceFilter(
                 h5['sitecol'], h5['oqparam'].maximum_distance)
 
-    def __call__(self, ordinal, path, apply_unc, fname, fileno, monitor):
-        src_groups = apply_unc(path, fname, self.converter)
-        for i, sg in enumerate(src_groups):
-            # sample a source for each group
-            if os.environ.get('OQ_SAMPLE_SOURCES'):
-                sg.sources = random_filtered_sources(
-                    sg.sources, self.srcfilter, i)
-            for i, src in enumerate(sg):
-                dic = {k: v for k, v in vars(src).items()
-                       if k != 'grp_id'}
-                src.checksum = zlib.adler32(pickle.dumps(dic, protocol=4))
-                src._wkt = src.wkt()
-        return dict(src_groups=src_groups, ordinal=ordinal, fileno=fileno)
+    def __call__(self, ordinals, paths, apply_unc, fname, filenos, monitor):
+        # read the source model once for all the paths using it
+        all_src_groups = apply_unc(paths, fname, self.converter)
+        for src_groups in all_src_groups:
+            for i, sg in enumerate(src_groups):
+                # sample a source for each group
+                if os.environ.get('OQ_SAMPLE_SOURCES'):
+                    sg.sources = random_filtered_sources(
+                        sg.sources, self.srcfilter, i)
+                for i, src in enumerate(sg):
+                    dic = {k: v for k, v in vars(src).items()
+                           if k != 'grp_id'}
+                    src.checksum = zlib.adler32(pickle.dumps(dic, protocol=4))
+                    src._wkt = src.wkt()
+        return dict(src_groups=all_src_groups, ordinals=ordinals,
+                    filenos=filenos)
 
 
 def get_csm(oq, source_model_lt, gsim_lt, h5=None):
@@ -105,7 +108,8 @@ def get_csm(oq, source_model_lt, gsim_lt, h5=None):
         oq.investigation_time, oq.rupture_mesh_spacing,
         oq.complex_fault_mesh_spacing, oq.width_of_mfd_bin,
         oq.area_source_discretization, oq.minimum_magnitude,
-        not spinning_off, oq.source_id, discard_trts=oq.discard_trts)
+        not spinning_off, oq.source_id, discard_trts=oq.discard_trts,
+        streaming=oq.streaming_nrml)
     full_lt = FullLogicTree(source_model_lt, gsim_lt)
     classical = not oq.is_event_based()
     if oq.is_ucerf():
@@ -133,15 +137,25 @@ def get_csm(oq, source_model_lt, gsim_lt, h5=None):
 
     logging.info('Reading the source model(s) in parallel')
     groups = [[] for sm_rlz in full_lt.sm_rlzs]
-    allargs = []
+    # the paths using the same source model file are managed by the same
+    # task, so that the file is read only once; if there are many paths
+    # they are split in blocks, so that the tasks are not less than
+    # concurrent_tasks and the parallelism is not lost
+    args = general.AccumDict(accum=[])  # fname -> [(ordinal, path, fileno)]
     fileno = 0
     for rlz in full_lt.sm_rlzs:
         for name in rlz.value.split():
             fname = os.path.abspath(os.path.join(smlt_dir, name))
-            allargs.append((rlz.ordinal, rlz.lt_path,
-                            source_model_lt.apply_uncertainties, fname,
-                            fileno))
+            args[fname].append((rlz.ordinal, rlz.lt_path, fileno))
             fileno += 1
+    maxsize = int(numpy.ceil(fileno / (oq.concurrent_tasks or 1)))
+    allargs = []
+    for fname, triples in args.items():
+        for block in general.block_splitter(triples, maxsize):
+            ordinals, paths, filenos = zip(*block)
+            allargs.append((ordinals, paths,
+                            source_model_lt.apply_all_uncertainties, fname,
+                            filenos))
     # NB: the source models file are often NOT in the shared directory
     # (for instance in oq-engine/demos) so the processpool must be used
     dist = ('no' if os.environ.get('OQ_DISTRIBUTE') == 'no'
@@ -151,16 +165,19 @@ def get_csm(oq, source_model_lt, gsim_lt, h5=None):
         allargs, distribute=dist, h5=h5 if h5 else None)
     # NB: h5 is None in logictree_test.py
 
+    triples = []  # (fileno, ordinal, src_groups)
+    for dic in smap:
+        triples.extend(zip(dic['filenos'], dic['ordinals'], dic['src_groups']))
+
     # various checks
     changes = 0
-    for dic in sorted(smap, key=operator.itemgetter('fileno')):
-        eri = dic['ordinal']
-        groups[eri].extend(dic['src_groups'])
-        for sg in dic['src_groups']:
+    for fileno, eri, src_groups in sorted(triples, key=operator.itemgetter(0)):
+        groups[eri].extend(src_groups)
+        for sg in src_groups:
             changes += sg.changes
         gsim_file = oq.inputs.get('gsim_logic_tree')
         if gsim_file:  # check TRTs
-            for src_group in dic['src_groups']:
+            for src_group in src_groups:
                 if src_group.trt not in gsim_lt.values:
                     raise ValueError(
                         "Found in the source models a tectonic region type %r "
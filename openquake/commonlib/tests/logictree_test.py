@@ -32,12 +32,13 @@ from copy import deepcopy
 from openquake.baselib import parallel
 from openquake.baselib.general import gettemp
 import openquake.hazardlib
-from openquake.hazardlib import geo
+from openquake.hazardlib import geo, nrml
 from openquake.commonlib import logictree, readinput, tests
 from openquake.commonlib.source_reader import get_csm
 from openquake.hazardlib.tom import PoissonTOM
 from openquake.hazardlib.pmf import PMF
 from openquake.hazardlib.mfd import TruncatedGRMFD, EvenlyDiscretizedMFD
+from openquake.hazardlib.sourceconverter import SourceConverter
 from openquake.commonlib.logictree import SourceModelLogicTree, GsimLogicTree
 from openquake.commonlib.lt import apply_uncertainty
 
@@ -2048,6 +2049,43 @@ class GsimLogicTreeTestCase(unittest.TestCase):
         effective_rlzs = set(rlz.pid for rlz in fs_bg_model_lt)
         self.assertEqual(len(effective_rlzs), 5 * 4)
 
+    def test_space(self):
+        xml = codecs.open(
+            os.path.join(DATADIR, 'gmpe_logic_tree_share_reduced.xml'),
+            encoding='utf8').read().encode('utf8')
+        trts = ['Active Shallow Crust', 'Stable Shallow Crust', 'Shield',
+                'Volcanic']
+        gsim_lt = self.parse_valid(xml, trts).reduce(set(trts[:2]))
+        space = gsim_lt.get_space()
+        self.assertEqual(space.shape, (4, 2, 5, 1))
+        self.assertEqual(len(space), 40)
+
+        # random access to the realizations
+        rlzs = list(gsim_lt)
+        [rlz] = space.get_rlzs([17], [17])
+        self.assertEqual(rlz.value, rlzs[17].value)
+        self.assertEqual(rlz.lt_path, rlzs[17].lt_path)
+        self.assertEqual(rlz.weight['weight'], rlzs[17].weight['weight'])
+
+        # the effective space is consistent with get_effective_rlzs
+        expected = logictree.get_effective_rlzs(gsim_lt)
+        effective = gsim_lt.get_effective_space()
+        self.assertEqual(len(effective), 20)
+        for rlz, exp in zip(effective.get_rlzs(), expected):
+            self.assertEqual(rlz.ordinal, exp.ordinal)
+            self.assertEqual(rlz.value, exp.value)
+            self.assertEqual(rlz.pid, exp.pid)
+            self.assertEqual(rlz.samples, exp.samples)
+            self.assertAlmostEqual(rlz.weight['weight'], exp.weight['weight'])
+        numpy.testing.assert_allclose(
+            effective.get_weights(effective.get_rlzis()).sum(axis=0), 1)
+
+        # sampling by index
+        rlzis = space.sample(10, 42)
+        self.assertEqual(len(rlzis), 10)
+        for rlz, rlzi in zip(gsim_lt.sample(10, 42), rlzis):
+            self.assertEqual(rlz.value, rlzs[rlzi].value)
+
     def test_sampling(self):
         xml = _make_nrml("""\
         <logicTree logicTreeID="lt1">
@@ -2144,6 +2182,47 @@ class LogicTreeSourceSpecificUncertaintyTest(unittest.TestCase):
                 msg = "Wrong mmax value assigned to source 'a1'"
                 self.assertIn(src.mfd.max_mag, mags, msg)
 
+    def test_apply_all_uncertainties(self):
+        path = os.path.join(DATADIR, 'source_specific_uncertainty')
+        ssc_lt = SourceModelLogicTree(os.path.join(path, 'sscLt.xml'))
+        converter = SourceConverter(50., 5., 5., .1, 10.)
+        fname = os.path.join(path, 'ssm01.xml')
+        paths = [rlz.lt_path for rlz in ssc_lt if rlz.lt_path[0] == 'b1']
+        self.assertEqual(len(paths), 6)
+        all_groups = ssc_lt.apply_all_uncertainties(paths, fname, converter)
+        mmax = []
+        for ltpath, groups in zip(paths, all_groups):
+            # same results as applying the uncertainties path by path
+            # on a freshly read source model
+            [sm] = nrml.read_source_models([fname], converter)
+            exp = [src for sg in sm.src_groups for src in sg]
+            branchset = ssc_lt.root_branchset
+            for brid in ltpath:
+                branch = branchset[brid]
+                if branchset.uncertainty_type != 'sourceModel':
+                    for src in exp:
+                        if branchset.filter_source(src):
+                            apply_uncertainty(branchset.uncertainty_type,
+                                              src, branch.value)
+                branchset = branch.bset
+            srcs = [src for sg in groups for src in sg]
+            self.assertEqual([s.source_id for s in srcs],
+                             [s.source_id for s in exp])
+            for src, e in zip(srcs, exp):
+                self.assertEqual(src.mfd.max_mag, e.mfd.max_mag)
+                self.assertEqual(src.num_ruptures, e.count_ruptures())
+            mmax.append({src.source_id: src.mfd.max_mag for src in srcs})
+        self.assertEqual([dic['a1'] for dic in mmax],
+                         [5.7, 5.98, 6.26, 6.54, 6.82, 7.1])
+        self.assertEqual([dic['a2'] for dic in mmax], [6.5] * 6)
+
+        # the unmodified sources are shared between the paths
+        a1, a2 = [{src.source_id: src for sg in groups for src in sg}
+                  for groups in all_groups[:2]]
+        self.assertIs(a1['a2'].mfd, a2['a2'].mfd)
+        self.assertIsNot(a1['a1'].mfd, a2['a1'].mfd)
+        self.assertIsNot(a1['a2'], a2['a2'])  # shallow copies
+
     def test_smlt_bad(self):
         # apply to a source that does not exist in the given branch
         path = os.path.join(DATADIR, 'source_specific_uncertainty')
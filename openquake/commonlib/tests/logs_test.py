@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+#
+# Copyright (C) 2020 GEM Foundation
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import time
+import shutil
+import socket
+import getpass
+import logging
+import tempfile
+import unittest
+import threading
+import subprocess
+from unittest import mock
+from datetime import datetime
+from openquake.commonlib import logs
+
+CFG = '''\
+[dbserver]
+file = %s
+listen = 127.0.0.1
+host = 127.0.0.1
+port = %d
+'''
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class LogDatabaseHandlerTestCase(unittest.TestCase):
+    # the test runs against a throwaway dbserver with its own database
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.port = _free_port()
+        cfg = os.path.join(cls.tmpdir, 'openquake.cfg')
+        with open(cfg, 'w', encoding='utf-8') as f:
+            f.write(CFG % (os.path.join(cls.tmpdir, 'db.sqlite3'), cls.port))
+        env = dict(os.environ, OQ_CONFIG_FILE=cfg,
+                   OQ_DBSERVER_PORT=str(cls.port))
+        cls.proc = subprocess.Popen(
+            [sys.executable, '-c', 'from openquake.server.dbserver import '
+             'run_server; run_server(foreground=True)'],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        for _ in range(100):  # wait at most 10 seconds
+            if cls.proc.poll() is not None:
+                break
+            try:
+                socket.create_connection(('127.0.0.1', cls.port)).close()
+                return
+            except OSError:
+                time.sleep(.1)
+        cls.tearDownClass()
+        raise unittest.SkipTest('Could not start a local dbserver')
+
+    @classmethod
+    def tearDownClass(cls):
+        logs._close_sockets()
+        cls.proc.terminate()
+        cls.proc.wait()
+        shutil.rmtree(cls.tmpdir)
+
+    def test_all_stored(self):
+        # the records stored in batches end up in the database
+        with mock.patch.object(logs, 'DBSERVER_PORT', self.port):
+            job_id = logs.init('job')
+            logs.dbcmd('log', job_id, datetime.utcnow(), 'INFO',
+                       'MainProcess/0', 'single line')
+            M = 10000
+            handler = logs.LogDatabaseHandler(job_id)
+            logger = logging.getLogger('logs_test')
+            logger.propagate = False
+            logger.setLevel(logging.INFO)
+            logger.addHandler(handler)
+            try:
+                for i in range(M):
+                    logger.info('line %d', i)
+            finally:
+                logger.removeHandler(handler)
+                handler.close()  # wait for all the records to be stored
+            self.assertEqual(logs.dbcmd('get_log_size', job_id), M + 1)
+            logs.dbcmd('del_calc', job_id, getpass.getuser(), True)
+
+
+class LogDatabaseHandlerBatchTestCase(unittest.TestCase):
+    def test_batches(self):
+        # the records queued while the dbserver is busy are sent together,
+        # with a single log_many call per batch
+        sending, busy = threading.Event(), threading.Event()
+        calls = []
+
+        def dbcmd(action, rows):
+            calls.append((action, [row[-1] for row in rows]))
+            sending.set()
+            busy.wait(10)
+
+        handler = logs.LogDatabaseHandler(42, queue_size=1000, batch_size=100)
+        record = logging.LogRecord('logs_test', logging.INFO, __file__, 0,
+                                   'line %d', None, None)
+        with mock.patch.object(logs, 'dbcmd', dbcmd):
+            for i in range(251):
+                record.args = (i,)
+                handler.emit(record)
+                if i == 0:  # wait for the first record to be sent
+                    sending.wait(10)
+            busy.set()
+            handler.close()
+        self.assertEqual([action for action, _ in calls], ['log_many'] * 4)
+        self.assertEqual([len(msgs) for _, msgs in calls], [1, 100, 100, 50])
+        self.assertEqual(sum((msgs for _, msgs in calls), []),
+                         ['line %d' % i for i in range(251)])
+
+
+class DbcmdTestCase(unittest.TestCase):
+    def test_close_on_failure(self):
+        sock = logs._get_socket()
+        with mock.patch.object(sock, 'send', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                logs.dbcmd('getpid')
+        self.assertFalse(hasattr(sock, 'zsocket'))  # closed
+        self.assertNotIn(sock, [s for _, s in logs._sockets])
+        self.assertIsNot(logs._get_socket(), sock)  # a new connection
+        logs._close_sockets()
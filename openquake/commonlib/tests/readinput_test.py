@@ -20,10 +20,11 @@ import os
 import tempfile
 import unittest.mock as mock
 import unittest
+import numpy
 from io import BytesIO
 
 from openquake.baselib import general, datastore
-from openquake.hazardlib import InvalidFile
+from openquake.hazardlib import InvalidFile, nrml
 from openquake.risklib import asset
 from openquake.risklib.riskmodels import ValidationError
 from openquake.commonlib import readinput
@@ -356,6 +357,7 @@ POLYGON((78.0 31.5, 89.5 31.5, 89.5 25.5, 78.0 25.5, 78.0 31.5))'''
         oqparam.time_event = None
         oqparam.ignore_missing_costs = []
         oqparam.aggregate_by = []
+        oqparam.cache_exposure = False
         with self.assertRaises(ValueError) as ctx:
             readinput.get_exposure(oqparam)
         self.assertIn("Invalid ID 'a 1': the only accepted chars are "
@@ -390,6 +392,7 @@ POLYGON((68.0 31.5, 69.5 31.5, 69.5 25.5, 68.0 25.5, 68.0 31.5))'''
         oqparam.inputs = {'exposure': [self.exposure2],
                           'structural_vulnerability': None}
         oqparam.aggregate_by = []
+        oqparam.cache_exposure = False
         with self.assertRaises(ValueError) as ctx:
             readinput.get_exposure(oqparam)
         self.assertIn("Got 'aggregate', expected "
@@ -408,6 +411,7 @@ POLYGON((78.0 31.5, 89.5 31.5, 89.5 25.5, 78.0 25.5, 78.0 31.5))'''
         oqparam.insured_losses = False
         oqparam.ignore_missing_costs = []
         oqparam.aggregate_by = []
+        oqparam.cache_exposure = False
         with self.assertRaises(ValueError) as ctx:
             readinput.get_exposure(oqparam)
         self.assertIn("'RM ' contains whitespace chars, line 11",
@@ -433,6 +437,53 @@ Expected: ['id', 'lat', 'lon', 'number', 'structural', 'taxonomy']
 Got: ['Lon', 'id', 'lat', 'number', 'structural', 'taxonomy']
 Missing: {'lon'}''', str(ctx.exception))
 
+    def test_csv_exposure(self):
+        csvfile = general.gettemp('''\
+id,lon,lat,taxonomy,number,structural,day,night,state
+a1,10.0,45.0,RM,2,1000,2,4,A
+a2,10.1,45.0,RC,1,500,1,1,?
+a3,10.0,45.0,RC,3,800,0,2,B
+''', suffix='.csv')
+        xmlfile = general.gettemp('''\
+<?xml version='1.0' encoding='utf-8'?>
+<nrml xmlns="http://openquake.org/xmlns/nrml/0.5">
+  <exposureModel id="ep" category="buildings">
+    <description>Exposure model for buildings</description>
+    <conversions>
+      <costTypes>
+        <costType name="structural" type="per_asset" unit="USD" />
+      </costTypes>
+    </conversions>
+    <occupancyPeriods>day night</occupancyPeriods>
+    <tagNames>state</tagNames>
+    <assets>%s</assets>
+  </exposureModel>
+</nrml>''' % os.path.basename(csvfile), suffix='.xml')
+        exp = asset.Exposure.read([xmlfile])
+        self.assertEqual(list(exp.asset_refs), ['a1', 'a2', 'a3'])
+        self.assertEqual(exp.tagcol.taxonomy, ['?', 'RM', 'RC'])
+        self.assertEqual(exp.tagcol.state, ['?', 'A', 'B'])
+        self.assertEqual(list(exp.assets['taxonomy']), [1, 2, 2])
+        self.assertEqual(list(exp.assets['state']), [1, 0, 2])
+        self.assertEqual(list(exp.assets['occupants_None']), [3, 1, 1])
+
+        # the assets are grouped by location, in order of longitude
+        mesh, assets_by_site = exp.get_mesh_assets_by_site()
+        self.assertEqual(list(mesh.lons), [10.0, 10.1])
+        self.assertEqual([list(a['ordinal']) for a in assets_by_site],
+                         [[0, 2], [1]])
+        assetcol = asset.AssetCollection(exp, assets_by_site, None)
+        self.assertEqual(list(assetcol['site_id']), [0, 0, 1])
+        self.assertEqual(list(assetcol['value-structural']),
+                         [2000, 2400, 500])  # per_asset cost * number
+
+        # duplicated IDs are not accepted
+        with open(csvfile, 'a') as f:
+            f.write('a1,10.2,45.0,RM,1,100,0,0,A\n')
+        with self.assertRaises(nrml.DuplicatedID) as ctx:
+            asset.Exposure.read([xmlfile])
+        self.assertEqual(str(ctx.exception), 'a1')
+
     def test_case_similar(self):
         fname = os.path.join(DATADIR, 'exposure2.xml')
         with self.assertRaises(InvalidFile) as ctx:
@@ -514,6 +565,39 @@ class SitecolAssetcolTestCase(unittest.TestCase):
         self.assertEqual(len(assetcol), 151)
         self.assertEqual(len(discarded), 0)
 
+    def test_cached_exposure(self):
+        oq = readinput.get_oqparam('job.ini', case_16, cache_exposure='true')
+        datadir = tempfile.mkdtemp()
+        with mock.patch.dict(os.environ, OQ_DATADIR=datadir):
+            sitecol, assetcol, discarded = readinput.get_sitecol_assetcol(oq)
+            cached = os.listdir(os.path.join(datadir, 'cache'))
+            self.assertEqual(len(cached), 2)  # exposure and assetcol
+            readinput.exposure = None
+            with mock.patch('openquake.risklib.asset.Exposure.read') as read:
+                sitecol2, assetcol2, discarded2 = (
+                    readinput.get_sitecol_assetcol(oq))
+            self.assertEqual(read.call_count, 0)  # read from the cache
+        for name in sitecol.array.dtype.names:
+            numpy.testing.assert_equal(sitecol[name], sitecol2[name])
+        numpy.testing.assert_equal(assetcol.array, assetcol2.array)
+        self.assertEqual(assetcol.tagcol.taxonomy_idx,
+                         assetcol2.tagcol.taxonomy_idx)
+        self.assertEqual(list(readinput.exposure.asset_refs),
+                         list(assetcol.asset_refs))
+        self.assertEqual(len(discarded2), 0)
+
+    def test_evict_cache(self):
+        cachedir = tempfile.mkdtemp()
+        for i, name in enumerate(['a.hdf5', 'b.hdf5', 'c.hdf5']):
+            fname = os.path.join(cachedir, name)
+            with open(fname, 'wb') as f:
+                f.write(b'x' * 100)
+            os.utime(fname, (i, i))
+        readinput._touch_cache(os.path.join(cachedir, 'a.hdf5'))
+        readinput._evict_cache(cachedir, maxsize=250)
+        # b.hdf5 is the least recently used file
+        self.assertEqual(sorted(os.listdir(cachedir)), ['a.hdf5', 'c.hdf5'])
+
     def test_site_amplification(self):
         oq = readinput.get_oqparam('job.ini', case_16)
         oq.inputs['amplification'] = os.path.join(
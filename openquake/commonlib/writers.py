@@ -19,10 +19,11 @@
 import os
 import tempfile
 import numpy  # this is needed by the doctests, don't remove it
-from openquake.baselib.node import scientificformat
+from openquake.baselib.node import scientificformat, zeroset
 from openquake.baselib.python3compat import encode
 
 FIVEDIGITS = '%.5E'
+BLOCKSIZE = 100_000  # number of rows formatted at once by write_csv
 
 
 # recursive function used internally by build_header
@@ -97,6 +98,89 @@ def _header(fields, sep, renamedict):
     return encode(sep.join(fields) + '\n')
 
 
+def format_column(col, fmt='%.6E', seps=(' ', ':')):
+    """
+    Vectorized version of :func:`openquake.baselib.node.scientificformat`
+    working on a whole column of values at once.
+
+    >>> format_column(numpy.array([-0., .5]), '%.1E')
+    ['0.0E+00', '5.0E-01']
+    >>> format_column(numpy.array([[1, 2], [3, 4]]))
+    ['1 2', '3 4']
+    >>> format_column(numpy.array([True, False]))
+    ['1', '0']
+
+    :param col: an array of N elements, possibly array-valued
+    :param fmt: the formatting string to use for float values
+    :param seps: the separators to use for vector-like and matrix-like values
+    :returns: a list of N strings
+    """
+    if col.ndim > 1:  # array-valued column
+        parts = [format_column(col[:, i], fmt, seps[1:] * 2)
+                 for i in range(col.shape[1])]
+        if not parts:
+            return [''] * len(col)
+        return [seps[0].join(row) for row in zip(*parts)]
+    kind = col.dtype.kind
+    if kind == 'b':
+        return ['1' if val else '0' for val in col.tolist()]
+    elif kind == 'S':
+        return [val.decode('utf8') for val in col.tolist()]
+    elif kind == 'U':
+        return col.tolist()
+    elif kind == 'f' and col.dtype.itemsize in (4, 8):
+        strs = list(map(fmt.__mod__, col.tolist()))
+        for i in numpy.where(numpy.signbit(col))[0]:
+            if set(strs[i]) <= zeroset:
+                # '-0.0000000E+00' is converted into '0.0000000E+00
+                strs[i] = strs[i].replace('-', '')
+        return strs
+    elif kind in 'iu':
+        return list(map(str, col.tolist()))
+    elif kind == 'O':
+        return [scientificformat(val, fmt, *seps) for val in col]
+    return list(map(str, col))
+
+
+def format_rows(data, sep=',', fmt='%.6E', renamedict=None):
+    """
+    Format a composite array or a 2D array as CSV rows, column by column.
+    The result is the same as formatting the values one at the time with
+    :func:`openquake.baselib.node.scientificformat`, except for the
+    fields lon, lat, depth which are formatted with 5 digits.
+
+    >>> dt = numpy.dtype([('lon', float), ('lat', float), ('val', float)])
+    >>> format_rows(numpy.array([(10, 45, 1E-3)], dt))
+    '10.00000,45.00000,1.000000E-03\\n'
+
+    :param data: the array to format
+    :param sep: separator to use (default comma)
+    :param fmt: formatting string for the floats (default '%.6E')
+    :param renamedict: an optional dictionary used to rename string values
+    :returns: a string with a line for each row
+    """
+    if data.dtype.names:
+        names = [col.split(':', 1)[0].split('~')
+                 for col in build_header(data.dtype)]
+        columns = [extract_from(data, fields) for fields in names]
+    else:
+        names = [()] * data.shape[1]
+        columns = list(data.T)
+    strcolumns = []
+    for fields, col in zip(names, columns):
+        if fields and fields[0] in ('lon', 'lat', 'depth'):
+            strcolumns.append(['%.5f' % val for val in col.tolist()])
+            continue
+        strs = format_column(col, fmt)
+        if sep in ''.join(strs):
+            strs = [('"%s"' % s if sep in s and not s.startswith('"')
+                     else s) for s in strs]
+        if renamedict and (col.ndim > 1 or col.dtype.kind in 'SUO'):
+            strs = [renamedict.get(s, s) for s in strs]
+        strcolumns.append(strs)
+    return ''.join(sep.join(row) + '\n' for row in zip(*strcolumns))
+
+
 def write_csv(dest, data, sep=',', fmt='%.6E', header=None, comment=None,
               renamedict=None):
     """
@@ -148,18 +232,12 @@ def write_csv(dest, data, sep=',', fmt='%.6E', header=None, comment=None,
             return '"%s"' % col
         return col
 
-    if autoheader:
-        all_fields = [col.split(':', 1)[0].split('~')
-                      for col in autoheader]
-        for record in data:
-            row = []
-            for fields in all_fields:
-                val = extract_from(record, fields)
-                if fields[0] in ('lon', 'lat', 'depth'):
-                    row.append('%.5f' % val)
-                else:
-                    row.append(format(val))
-            dest.write(_header(row, sep, renamedict))
+    if autoheader or (isinstance(data, numpy.ndarray) and data.ndim == 2
+                      and data.dtype.kind != 'O'):
+        # vectorized formatting, by blocks of rows to save memory
+        for start in range(0, len(data), BLOCKSIZE):
+            block = data[start: start + BLOCKSIZE]
+            dest.write(encode(format_rows(block, sep, fmt, renamedict)))
     else:
         for row in data:
             dest.write(encode(sep.join(format(col) for col in row) + '\n'))
@@ -69,6 +69,10 @@ def _disaggregate(cmaker, sitecol, rupdata, indices, iml2, eps3,
         return pack(acc, 'mags dists lons lats pnes'.split())
     maxdist = cmaker.maximum_distance(cmaker.trt)
     fildist = rupdata[cmaker.filter_distance + '_']
+    # mean_std_ arrays of shape (2, N, M, G) stored by the classical calculator
+    mean_stds = rupdata.get('mean_std_')
+    if mean_stds is not None:
+        g = list(cmaker.gsims).index(gsim)
     for ridx, sidx in enumerate(indices):
         if sidx == -1:  # no contribution for this site
             continue
@@ -78,7 +82,8 @@ def _disaggregate(cmaker, sitecol, rupdata, indices, iml2, eps3,
         elif gsim.minimum_distance and dist < gsim.minimum_distance:
             dist = gsim.minimum_distance
         rctx = contexts.RuptureContext(
-            (par, val[ridx]) for par, val in rupdata.items())
+            (par, val[ridx]) for par, val in rupdata.items()
+            if par != 'mean_std_')
         dctx = contexts.DistancesContext(
             (param, getattr(rctx, param + '_')[[sidx]])
             for param in cmaker.REQUIRES_DISTANCES)
@@ -86,9 +91,12 @@ def _disaggregate(cmaker, sitecol, rupdata, indices, iml2, eps3,
         acc['lons'].append(rctx.lon_[sidx])
         acc['lats'].append(rctx.lat_[sidx])
         acc['dists'].append(dist)
-        with gmf_mon:
-            mean_std = get_mean_std(
-                sitecol, rctx, dctx, iml2.imts, [gsim])[..., 0]  # (2, N, M)
+        if mean_stds is not None:
+            mean_std = mean_stds[ridx][..., g][:, [sidx]]  # (2, N, M)
+        else:
+            with gmf_mon:
+                mean_std = get_mean_std(
+                    sitecol, rctx, dctx, iml2.imts, [gsim])[..., 0]
         with pne_mon:
             iml = numpy.array(
                 [to_distribution_values(lvl, imt) for imt, lvl in zip(
@@ -27,6 +27,8 @@ from scipy.spatial import cKDTree, distance
 
 from openquake.baselib import hdf5
 from openquake.baselib.python3compat import raise_
+from openquake.hazardlib.geo.surface.multi import (
+    load_gc2_cache, gc2_cache_fname)
 from openquake.hazardlib.geo.utils import (
     KM_TO_DEGREES, angular_distance, fix_lon, get_bounding_box, cross_idl,
     get_longitudinal_extent, BBoxError, spherical_to_cartesian)
@@ -258,6 +260,11 @@ class SourceFilter(object):
             raise FileNotFoundError('%s: shared_dir issue?' % self.filename)
         with hdf5.File(self.filename, 'r') as h5:
             self.__dict__['sitecol'] = sc = h5.get('sitecol')
+        # read the GC2 frameworks of the multi surfaces, if any
+        gc2_fname = gc2_cache_fname(self.filename)
+        if os.path.exists(gc2_fname):
+            with hdf5.File(gc2_fname, 'r') as h5:
+                load_gc2_cache(h5)
         return sc
 
     def get_rectangle(self, src):
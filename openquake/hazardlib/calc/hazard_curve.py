@@ -27,6 +27,7 @@ than 20 lines of code:
    import logging
    from openquake.baselib import parallel
    from openquake.hazardlib.calc.filters import SourceFilter
+from openquake.hazardlib.geo.surface.multi import pop_gc2_frameworks
    from openquake.hazardlib.calc.hazard_curve import calc_hazard_curves
    from openquake.commonlib import readinput
 
@@ -60,6 +61,7 @@ from openquake.baselib.general import DictArray, groupby, AccumDict
 from openquake.hazardlib.probability_map import ProbabilityMap
 from openquake.hazardlib.gsim.base import ContextMaker
 from openquake.hazardlib.calc.filters import SourceFilter
+from openquake.hazardlib.geo.surface.multi import pop_gc2_frameworks
 from openquake.hazardlib.sourceconverter import SourceGroup
 from openquake.hazardlib.tom import FatedTOM
 
@@ -121,6 +123,8 @@ def classical(group, src_filter, gsims, param, monitor=Monitor()):
         src_filter, group)
     extra['task_no'] = getattr(monitor, 'task_no', 0)
     extra['trt'] = trt
+    # the GC2 frameworks built here are shared with the other tasks
+    extra['gc2'] = pop_gc2_frameworks()
 
     group_probability = getattr(group, 'grp_probability', None)
     if src_mutex and group_probability:
@@ -32,7 +32,8 @@ from openquake.hazardlib import imt as imt_module
 from openquake.hazardlib.gsim import base
 from openquake.hazardlib.calc.filters import IntegrationDistance, getdefault
 from openquake.hazardlib.probability_map import ProbabilityMap
-from openquake.hazardlib.geo.surface import PlanarSurface
+from openquake.hazardlib.geo.surface.planar import (
+    PlanarSurface, PlanarSurfaceBatch)
 
 I16 = numpy.int16
 F32 = numpy.float32
@@ -106,7 +107,7 @@ class RupData(object):
                 self.add(rup, sites)
         return {k: numpy.array(v) for k, v in self.data.items()}
 
-    def add(self, rup, sctx, dctx=None):
+    def add(self, rup, sctx, dctx=None, mean_std=None):
         rate = rup.occurrence_rate
         if numpy.isnan(rate):  # for nonparametric ruptures
             probs_occur = rup.probs_occur
@@ -128,6 +129,8 @@ class RupData(object):
         closest = rup.surface.get_closest_points(sctx)
         self.data['lon_'].append(F32(closest.lons))
         self.data['lat_'].append(F32(closest.lats))
+        if mean_std is not None:  # array of shape (2, N, M, G)
+            self.data['mean_std_'].append(F32(mean_std).flatten())
 
 
 class ContextMaker(object):
@@ -139,6 +142,8 @@ class ContextMaker(object):
     def __init__(self, trt, gsims, param=None, monitor=Monitor()):
         param = param or {}
         self.max_sites_disagg = param.get('max_sites_disagg', 10)
+        self.cache_mean_std = param.get('cache_mean_std', False)
+        self.poes_by_src = param.get('poes_by_src', False)
         self.trt = trt
         self.gsims = gsims
         self.maximum_distance = (
@@ -178,7 +183,7 @@ class ContextMaker(object):
                 if imt != 'MMI':
                     self.loglevels[imt] = numpy.log(imls)
 
-    def filter(self, sites, rup):
+    def filter(self, sites, rup, dists_by_param=None):
         """
         Filter the site collection with respect to the rupture.
 
@@ -187,10 +192,16 @@ class ContextMaker(object):
         :param rup:
             Instance of
             :class:`openquake.hazardlib.source.rupture.BaseRupture`
+        :param dists_by_param:
+            if not None, a dictionary param -> distances already computed
+            for all the sites
         :returns:
             (filtered sites, distance context)
         """
-        distances = get_distances(rup, sites, self.filter_distance)
+        dists_by_param = dists_by_param or {}
+        distances = dists_by_param.get(self.filter_distance)
+        if distances is None:
+            distances = get_distances(rup, sites, self.filter_distance)
         mdist = self.maximum_distance(rup.tectonic_region_type, rup.mag)
         mask = distances <= mdist
         if mask.any():
@@ -198,7 +209,11 @@ class ContextMaker(object):
         else:
             raise FarAwayRupture(
                 '%d: %d km' % (rup.rup_id, distances.min()))
-        return sites, DistancesContext([(self.filter_distance, distances)])
+        dctx = DistancesContext([(self.filter_distance, distances)])
+        for param, dists in dists_by_param.items():
+            if param != self.filter_distance:
+                setattr(dctx, param, dists[mask])
+        return sites, dctx
 
     def add_rup_params(self, rupture):
         """
@@ -228,7 +243,7 @@ class ContextMaker(object):
                                  (type(self).__name__, param))
             setattr(rupture, param, value)
 
-    def make_contexts(self, sites, rupture):
+    def make_contexts(self, sites, rupture, dists_by_param=None):
         """
         Filter the site collection with respect to the rupture and
         create context objects.
@@ -240,6 +255,10 @@ class ContextMaker(object):
             Instance of
             :class:`openquake.hazardlib.source.rupture.BaseRupture`
 
+        :param dists_by_param:
+            if not None, a dictionary param -> distances already computed
+            for all the sites
+
         :returns:
             Tuple of two items: sites and distances context.
 
@@ -247,8 +266,9 @@ class ContextMaker(object):
             If any of declared required parameters (site, rupture and
             distance parameters) is unknown.
         """
-        sites, dctx = self.filter(sites, rupture)
-        for param in self.REQUIRES_DISTANCES - set([self.filter_distance]):
+        sites, dctx = self.filter(sites, rupture, dists_by_param)
+        known = set(dists_by_param or ()) | {self.filter_distance}
+        for param in self.REQUIRES_DISTANCES - known:
             distances = get_distances(rupture, sites, param)
             setattr(dctx, param, distances)
         reqv_obj = (self.reqv.get(rupture.tectonic_region_type)
@@ -267,14 +287,32 @@ class ContextMaker(object):
         :returns: a list of triples (rctx, sctx, dctx)
         """
         ctxs = []
-        for rup in ruptures:
+        for rup, dists_by_param in zip(
+                ruptures, self._gen_dists_by_param(ruptures, sites)):
             try:
-                sctx, dctx = self.make_contexts(sites, rup)
+                sctx, dctx = self.make_contexts(sites, rup, dists_by_param)
             except FarAwayRupture:
                 continue
             ctxs.append((rup, sctx, dctx))
         return ctxs
 
+    def _gen_dists_by_param(self, ruptures, sites):
+        # for ruptures with planar surfaces (i.e. coming from point sources)
+        # the distances from all the sites are computed for all the planes
+        # at once and then split by rupture; otherwise yield None
+        if len(ruptures) < 2 or any(type(rup.surface) is not PlanarSurface
+                                    for rup in ruptures):
+            for rup in ruptures:
+                yield None
+            return
+        batch = PlanarSurfaceBatch([rup.surface for rup in ruptures])
+        params = (self.REQUIRES_DISTANCES | {self.filter_distance}) & (
+            batch.DISTANCES)
+        dists = {param: batch.get_distances(sites, param)
+                 for param in params}
+        for p in range(len(batch)):
+            yield {param: dists[param][p] for param in params}
+
     def max_intensity(self, onesite, mags, dists):
         """
         :param onesite: a SiteCollection instance with a single site
@@ -317,6 +355,10 @@ class ContextMaker(object):
         # AccumDict of arrays with 3 elements nrups, nsites, calc_time
         calc_times = AccumDict(accum=numpy.zeros(3, numpy.float32))
         pmaker = PmapMaker(self, srcfilter, group)
+        # the contributions of the single sources are kept only for
+        # independent sources, the ones combined with 1 - prod(1 - p)
+        by_src = self.poes_by_src and not getattr(group, 'atomic', False)
+        pmap_by_src = AccumDict(accum=ProbabilityMap(L, G))
         totrups = 0
         src_sites = srcfilter(group)
         while True:
@@ -333,10 +375,14 @@ class ContextMaker(object):
             totrups += poemap.totrups
             calc_times[src.id] += numpy.array(
                 [poemap.numrups, poemap.nsites, time.time() - t0])
+            if by_src:  # poemap contains probabilities of no exceedance
+                pmap_by_src[src.id] |= ~poemap
 
         rdata = {k: numpy.array(v) for k, v in rup_data.items()}
         rdata['grp_id'] = numpy.uint16(rup_data['grp_id'])
         extra = dict(totrups=totrups)
+        if by_src:
+            extra['pmap_by_src'] = pmap_by_src
         return pmap, rdata, calc_times, extra
 
 
@@ -373,7 +419,7 @@ class PmapMaker(object):
         self.gmf_mon = cmaker.mon('computing mean_std', measuremem=False)
 
     def _sids_poes(self, rup, r_sites, dctx, srcid):
-        # return sids and poes of shape (N, L, G)
+        # return sids, poes of shape (N, L, G) and mean_std
         # NB: this must be fast since it is inside an inner loop
         with self.gmf_mon:
             mean_std = base.get_mean_std(  # shape (2, N, M, G)
@@ -387,7 +433,7 @@ class PmapMaker(object):
                         # set by the engine when parsing the gsim logictree;
                         # when 0 ignore the gsim: see _build_trts_branches
                         poes[:, ll(imt), g] = 0
-            return r_sites.sids, poes
+            return r_sites.sids, poes, mean_std
 
     def _update(self, pmap, pm, src):
         if self.rup_indep:
@@ -413,6 +459,9 @@ class PmapMaker(object):
                 (mag, list(rups)) for mag, rups in itertools.groupby(
                     src.iter_ruptures(shift_hypo=self.shift_hypo),
                     key=operator.attrgetter('mag'))]
+        for gsim in self.gsims:
+            if hasattr(gsim, 'set_tables'):  # interpolate all mags at once
+                gsim.set_tables([mag for mag, _ in self.mag_rups], self.imts)
         rupdata = RupData(self.cmaker)
         totrups, numrups, nsites = 0, 0, 0
         L, G = len(self.imtls.array), len(self.gsims)
@@ -425,9 +474,11 @@ class PmapMaker(object):
                     ctxs = self.collapse(ctxs)
                     numrups += len(ctxs)
             for rup, r_sites, dctx in ctxs:
+                sids, poes, mean_std = self._sids_poes(
+                    rup, r_sites, dctx, src.id)
                 if self.fewsites:  # store rupdata
-                    rupdata.add(rup, r_sites, dctx)
-                sids, poes = self._sids_poes(rup, r_sites, dctx, src.id)
+                    rupdata.add(rup, r_sites, dctx,
+                                mean_std if self.cache_mean_std else None)
                 with self.pne_mon:
                     pnes = rup.get_probability_no_exceedance(poes)
                     if self.rup_indep:
@@ -21,7 +21,7 @@ Module :mod:`openquake.hazardlib.geo.mesh` defines classes :class:`Mesh` and
 its subclass :class:`RectangularMesh`.
 """
 import numpy
-from scipy.spatial.distance import cdist
+from scipy.spatial import cKDTree
 import shapely.geometry
 import shapely.ops
 
@@ -170,6 +170,23 @@ class Mesh(object):
         return geo_utils.spherical_to_cartesian(
             self.lons.flat, self.lats.flat, self.depths.flat)
 
+    @cached_property
+    def kdt(self):
+        """
+        :returns: a cKDTree on the cartesian coordinates of the mesh points
+        """
+        return cKDTree(self.xyz)
+
+    @cached_property
+    def surface_kdt(self):
+        """
+        :returns:
+            a cKDTree on the cartesian coordinates of the projection of the
+            mesh points on the earth surface
+        """
+        return cKDTree(geo_utils.spherical_to_cartesian(
+            self.lons.flat, self.lats.flat))
+
     def __iter__(self):
         """
         Generate :class:`~openquake.hazardlib.geo.point.Point` objects the mesh
@@ -243,9 +260,11 @@ class Mesh(object):
         Method doesn't make any assumptions on arrangement of the points
         in either mesh and instead calculates the distance from each point of
         this mesh to each point of the target mesh and returns the lowest found
-        for each.
+        for each. The search is performed with a KD-tree, built once and
+        cached on the mesh, so that the memory occupation is linear in the
+        number of points and not quadratic.
         """
-        return cdist(self.xyz, mesh.xyz).min(axis=0)
+        return self.kdt.query(mesh.xyz)[0]
 
     def get_closest_points(self, mesh):
         """
@@ -255,7 +274,7 @@ class Mesh(object):
             :class:`Mesh` object of the same shape as `mesh` with closest
             points from this one at respective indices.
         """
-        min_idx = cdist(self.xyz, mesh.xyz).argmin(axis=0)  # lose shape
+        min_idx = self.kdt.query(mesh.xyz)[1]  # lose shape
         if hasattr(mesh, 'shape'):
             min_idx = min_idx.reshape(mesh.shape)
         lons = self.lons.take(min_idx)
@@ -338,8 +357,10 @@ class Mesh(object):
         # depends on mesh spacing. but the difference can be neglected
         # if calculated geodetic distance is over some threshold.
         # get the highest slice from the 3D mesh
-        distances = geodetic.min_geodetic_distance(
-            (self.lons, self.lats), (mesh.lons, mesh.lats))
+        # the search is performed with a KD-tree on the surface projection
+        # of the mesh, thus avoiding the full (mesh x sites) distance matrix
+        distances = self.surface_kdt.query(geo_utils.spherical_to_cartesian(
+            mesh.lons.flatten(), mesh.lats.flatten()))[0]
         # here we find the points for which calculated mesh-to-mesh
         # distance is below a threshold. this threshold is arbitrary:
         # lower values increase the maximum possible error, higher
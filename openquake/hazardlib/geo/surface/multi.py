@@ -20,6 +20,9 @@
 Module :mod:`openquake.hazardlib.geo.surface.multi` defines
 :class:`MultiSurface`.
 """
+import os
+import hashlib
+import collections
 import numpy
 from copy import deepcopy
 from scipy.spatial.distance import pdist, squareform
@@ -30,6 +33,84 @@ from openquake.hazardlib.geo.surface import (
     PlanarSurface, SimpleFaultSurface, ComplexFaultSurface)
 from openquake.hazardlib.geo.surface.gridded import GriddedSurface
 
+# content-addressed cache key -> GC2 framework, see MultiSurface.gc2_key;
+# the least recently used frameworks are evicted first
+GC2_CACHE = collections.OrderedDict()
+GC2_CACHE_SIZE = 10000  # maximum number of frameworks kept in memory
+GC2_ATTRS = ('proj', 'segments', 'gc_length')
+# keys of the frameworks built in this process and not shared yet,
+# see pop_gc2_frameworks
+GC2_NEW = set()
+
+segment_dt = numpy.dtype([('p0x', float), ('p0y', float), ('p1x', float),
+                          ('p1y', float), ('length', float), ('s', float)])
+
+
+def gc2_cache_fname(filename):
+    """
+    :param filename: the scratch file of a calculation
+    :returns: the name of the file where the GC2 frameworks are shared
+    """
+    return os.path.splitext(filename)[0] + '_gc2.hdf5'
+
+
+def cache_gc2(key, framework):
+    """
+    Add a GC2 framework to the GC2_CACHE, evicting the least recently used
+    one if the cache is full
+    """
+    GC2_CACHE[key] = framework
+    GC2_CACHE.move_to_end(key)
+    if len(GC2_CACHE) > GC2_CACHE_SIZE:
+        GC2_CACHE.popitem(last=False)
+
+
+def pop_gc2_frameworks():
+    """
+    :returns: a dictionary key -> framework with the GC2 frameworks built
+              in this process since the last call, to be sent back to the
+              master and shared with the other tasks
+    """
+    frameworks = {key: GC2_CACHE[key] for key in GC2_NEW if key in GC2_CACHE}
+    GC2_NEW.clear()
+    return frameworks
+
+
+def save_gc2_cache(h5):
+    """
+    Store the GC2 frameworks in the GC2_CACHE in the group `gc2` of the
+    given hdf5 file, see :func:`gc2_cache_fname`.
+
+    :param h5: an hdf5.File open in write mode
+    """
+    for key, fw in GC2_CACHE.items():
+        if 'gc2/' + key not in h5:
+            proj = fw['proj']
+            h5['gc2/' + key] = fw['segments']
+            h5['gc2/' + key].attrs.update(
+                bbox=[proj.west, proj.east, proj.north, proj.south],
+                gc_length=fw['gc_length'])
+
+
+def load_gc2_cache(h5):
+    """
+    Populate the GC2_CACHE from the group `gc2` of the given hdf5 file,
+    if any.
+
+    :param h5: an hdf5.File open in read mode
+    :returns: the number of frameworks read
+    """
+    if 'gc2' not in h5:
+        return 0
+    n = 0
+    for key, dset in h5['gc2'].items():
+        if key not in GC2_CACHE:
+            cache_gc2(key, dict(
+                proj=utils.OrthographicProjection(*dset.attrs['bbox']),
+                segments=dset[()], gc_length=dset.attrs['gc_length']))
+            n += 1
+    return n
+
 
 class MultiSurface(BaseSurface):
     """
@@ -133,6 +214,7 @@ class MultiSurface(BaseSurface):
         self.gc2u = None
         self.tmp_mesh = None
         self.gc_length = None
+        self.segments = None
 
     def _get_edge_set(self, tol=0.1):
         """
@@ -458,10 +540,48 @@ class MultiSurface(BaseSurface):
             self.p0 = beginning
         else:
             self.p0 = ending
+        # Collect the segments of all the traces, to compute the generalised
+        # coordinates of many sites for all the segments at once
+        segments = []
+        for edges in self.cartesian_edges:
+            s0 = numpy.dot((edges[0, :2] - self.p0), self.gc2_config["b_hat"])
+            lengths = numpy.sqrt(((edges[1:, :2] - edges[:-1, :2]) ** 2).sum(
+                axis=1))
+            cum_lengths = numpy.hstack([0., numpy.cumsum(lengths)])
+            for i in range(edges.shape[0] - 1):
+                segments.append(
+                    (edges[i, 0], edges[i, 1], edges[i + 1, 0],
+                     edges[i + 1, 1], lengths[i], cum_lengths[i] + s0))
+        self.segments = numpy.array(segments, segment_dt)
         # To later calculate Ry0 it is necessary to determine the maximum
         # GC2-U coordinate for the fault
         self._get_gc2_coordinates_for_rupture(edge_sets)
 
+    @property
+    def gc2_key(self):
+        """
+        A content-addressed key for the GC2 framework, i.e. a digest of the
+        edge set of the surface
+        """
+        md5 = hashlib.md5(type(self).__name__.encode('utf8'))
+        for edges in self.edge_set:
+            md5.update(numpy.float64(edges).tobytes())
+            md5.update(numpy.int64(len(edges)).tobytes())
+        return md5.hexdigest()
+
+    def _get_gc2_framework(self):
+        # set the GC2 attributes by looking at the GC2_CACHE first; the
+        # cache is useful since the same ruptures are instantiated many
+        # times (for instance UCERF ruptures are rebuilt in every task)
+        key = self.gc2_key
+        try:
+            vars(self).update(GC2_CACHE[key])
+            GC2_CACHE.move_to_end(key)
+        except KeyError:
+            self._setup_gc2_framework()
+            cache_gc2(key, {attr: getattr(self, attr) for attr in GC2_ATTRS})
+            GC2_NEW.add(key)
+
     def _get_gc2_coordinates_for_rupture(self, edge_sets):
         """
         Calculates the GC2 coordinates for the nodes of the upper edge of the
@@ -474,31 +594,6 @@ class MultiSurface(BaseSurface):
         # GC2 length should be the largest positive GC2 value of the edges
         self.gc_length = numpy.max(rup_gc2u)
 
-    def _get_ut_i(self, seg, sx, sy):
-        """
-        Returns the U and T coordinate for a specific trace segment
-
-        :param seg:
-            End points of the segment edge
-
-        :param sx:
-            Sites longitudes rendered into coordinate system
-
-        :param sy:
-            Sites latitudes rendered into coordinate system
-        """
-        p0x, p0y, p1x, p1y = seg[0, 0], seg[0, 1], seg[1, 0], seg[1, 1]
-        # Unit vector normal to strike
-        t_i_vec = [p1y - p0y, -(p1x - p0x), 0.0]
-        t_i_hat = t_i_vec / numpy.linalg.norm(t_i_vec)
-        # Unit vector along strike
-        u_i_vec = [p1x - p0x, p1y - p0y, 0.0]
-        u_i_hat = u_i_vec / numpy.linalg.norm(u_i_vec)
-        # Vectors from P0 to sites
-        rsite = numpy.column_stack([sx - p0x, sy - p0y])
-        return numpy.sum(u_i_hat[:-1] * rsite, axis=1),\
-            numpy.sum(t_i_hat[:-1] * rsite, axis=1)
-
     def get_generalised_coordinates(self, lons, lats):
         """
         Transforms the site positions into the generalised coordinate form
@@ -511,72 +606,66 @@ class MultiSurface(BaseSurface):
         Open-File Report 2015-1028
         """
         # If the GC2 configuration has not been setup already - do it!
-        if not self.gc2_config:
-            self._setup_gc2_framework()
-        # Initially the weights are set to zero
+        if self.segments is None:
+            self._get_gc2_framework()
         sx, sy = self.proj(lons, lats)
-        sum_w_i = numpy.zeros_like(lons)
-        sum_w_i_t_i = numpy.zeros_like(lons)
-        sum_wi_ui_si = numpy.zeros_like(lons)
-        # Find the cumulative length of the fault up until the given segment
-        # Essentially calculating s_i
-        general_t = numpy.zeros_like(lons)
-        general_u = numpy.zeros_like(lons)
-        on_segment = numpy.zeros_like(lons, dtype=bool)
-        # Loop over the traces
-        for j, edges in enumerate(self.cartesian_edges):
-            # Loop over segments in trace
-            # s_ij_total = 0.0
-            for i in range(edges.shape[0] - 1):
-                # Get u_i and t_i
-                u_i, t_i = self._get_ut_i(edges[i:(i + 2), :], sx, sy)
-                # If t_i is 0 and u_i is within the section length then site is
-                # directly on the edge - therefore general_t is 0
-                w_i = numpy.zeros_like(lons)
-                ti0_check = numpy.fabs(t_i) < 1.0E-3  # < 1 m precision
-                on_segment_range = numpy.logical_and(
-                    u_i >= 0.0,
-                    u_i <= self.length_set[j][i])
-                # Deal with the case in which t_i is 0 and the site is inside
-                # of the segment
-                idx0 = numpy.logical_and(ti0_check, on_segment_range)
-                # In this null case w_i is ignored - however, null sites on
-                # previous segments would not be null sites on this segment,
-                # so we update the list of null sites
-                on_segment[numpy.logical_or(on_segment, idx0)] = True
-                # Also take care of the U case this time using
-                # equation 12 of Spudich and Chiou
-                s_ij = self.cum_length_set[j][i] + numpy.dot(
-                    (edges[0, :2] - self.p0), self.gc2_config["b_hat"])
-                general_u[idx0] = u_i[idx0] + s_ij
-
-                # In the first case, ti = 0, u_i is outside of the segment
-                # this implements equation 5
-                idx1 = numpy.logical_and(ti0_check,
-                                         numpy.logical_not(on_segment_range))
-                w_i[idx1] = ((1.0 / (u_i[idx1] - self.length_set[j][i])) -
-                             (1.0 / u_i[idx1]))
-
-                # In the last case the site is not on the edge (t != 0)
-                # implements equation 4
-                idx2 = numpy.logical_not(ti0_check)
-                w_i[idx2] = ((1. / t_i[idx2]) * (numpy.arctan(
-                             (self.length_set[j][i] - u_i[idx2]) / t_i[idx2]) -
-                             numpy.arctan(-u_i[idx2] / t_i[idx2])))
-
-                idx = numpy.logical_or(idx1, idx2)
-                # Equation 3
-                sum_w_i[idx] += w_i[idx]
-                # Part of equation 2
-                sum_w_i_t_i[idx] += (w_i[idx] * t_i[idx])
-                # Part of equation 9
-                sum_wi_ui_si[idx] += (w_i[idx] * (u_i[idx] + s_ij))
-
+        shape = numpy.shape(sx)
+        sx, sy = numpy.ravel(sx), numpy.ravel(sy)
+        seg = self.segments
+        # the computation is vectorized over segments and sites: u_i, t_i
+        # and w_i are arrays of shape (S, N)
+        dx, dy = seg['p1x'] - seg['p0x'], seg['p1y'] - seg['p0y']
+        norm = numpy.sqrt(dx ** 2 + dy ** 2)
+        # Unit vector along strike and unit vector normal to strike
+        ux, uy = (dx / norm)[:, None], (dy / norm)[:, None]
+        rx, ry = sx - seg['p0x'][:, None], sy - seg['p0y'][:, None]
+        u_i = ux * rx + uy * ry
+        t_i = uy * rx - ux * ry
+        length = seg['length'][:, None]
+        # If t_i is 0 and u_i is within the section length then site is
+        # directly on the edge - therefore general_t is 0
+        ti0_check = numpy.fabs(t_i) < 1.0E-3  # < 1 m precision
+        on_segment_range = (u_i >= 0.0) & (u_i <= length)
+        idx0 = ti0_check & on_segment_range
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            w_i = numpy.where(
+                ti0_check,
+                # t_i is 0 and u_i is outside of the segment: equation 5
+                (1.0 / (u_i - length)) - (1.0 / u_i),
+                # the site is not on the edge (t != 0): equation 4
+                (1. / t_i) * (numpy.arctan((length - u_i) / t_i) -
+                              numpy.arctan(-u_i / t_i)))
+        # In the null case w_i is ignored
+        w_i[idx0] = 0.
+        # Equation 3
+        sum_w_i = w_i.sum(axis=0)
+        # Part of equation 2
+        sum_w_i_t_i = (w_i * t_i).sum(axis=0)
+        # Part of equation 9
+        sum_wi_ui_si = (w_i * (u_i + seg['s'][:, None])).sum(axis=0)
+
+        general_t = numpy.zeros_like(sx)
+        general_u = numpy.zeros_like(sx)
+        on_segment = idx0.any(axis=0)
+        # For the sites on a segment edge take the U coordinate from the
+        # last segment containing them, using equation 12 of Spudich and Chiou
+        last = len(seg) - 1 - idx0[::-1].argmax(axis=0)
+        ok = numpy.arange(len(sx))
+        general_u[on_segment] = (u_i[last, ok] + seg['s'][last])[on_segment]
         # For those sites not on the segment edge itself
         idx_t = numpy.logical_not(on_segment)
         general_t[idx_t] = (1.0 / sum_w_i[idx_t]) * sum_w_i_t_i[idx_t]
         general_u[idx_t] = (1.0 / sum_w_i[idx_t]) * sum_wi_ui_si[idx_t]
-        return general_t, general_u
+        return general_t.reshape(shape), general_u.reshape(shape)
+
+    def _set_gc2_coordinates(self, mesh):
+        # compute the GC2 coordinates unless they have been computed already
+        # for the same mesh (for instance by invoking Ry0 first)
+        if self.tmp_mesh is None or not (self.tmp_mesh == mesh):
+            self.gc2t, self.gc2u = self.get_generalised_coordinates(mesh.lons,
+                                                                    mesh.lats)
+            # Update mesh
+            self.tmp_mesh = deepcopy(mesh)
 
     def get_rx_distance(self, mesh):
         """
@@ -587,14 +676,7 @@ class MultiSurface(BaseSurface):
         <.base.BaseSurface.get_rx_distance>`
         for spec of input and result values.
         """
-        # If the GC2 calculations have already been computed (by invoking Ry0
-        # first) and the mesh is identical then class has GC2 attributes
-        # already pre-calculated
-        if not self.tmp_mesh or (self.tmp_mesh == mesh):
-            self.gc2t, self.gc2u = self.get_generalised_coordinates(mesh.lons,
-                                                                    mesh.lats)
-            # Update mesh
-            self.tmp_mesh = deepcopy(mesh)
+        self._set_gc2_coordinates(mesh)
         # Rx coordinate is taken directly from gc2t
         return self.gc2t
 
@@ -607,16 +689,7 @@ class MultiSurface(BaseSurface):
         <.base.BaseSurface.get_ry0_distance>`
         for spec of input and result values.
         """
-        # If the GC2 calculations have already been computed (by invoking Ry0
-        # first) and the mesh is identical then class has GC2 attributes
-        # already pre-calculated
-        if not self.tmp_mesh or (self.tmp_mesh == mesh):
-            # If that's not the case, or the mesh is different then
-            # re-compute GC2 configuration
-            self.gc2t, self.gc2u = self.get_generalised_coordinates(mesh.lons,
-                                                                    mesh.lats)
-            # Update mesh
-            self.tmp_mesh = deepcopy(mesh)
+        self._set_gc2_coordinates(mesh)
 
         # Default value ry0 (for sites within fault length) is 0.0
         ry0 = numpy.zeros_like(self.gc2u, dtype=float)
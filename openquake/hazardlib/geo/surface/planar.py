@@ -18,7 +18,7 @@
 
 """
 Module :mod:`openquake.hazardlib.geo.surface.planar` contains
-:class:`PlanarSurface`.
+:class:`PlanarSurface` and :class:`PlanarSurfaceBatch`.
 """
 import logging
 import numpy
@@ -622,3 +622,151 @@ class PlanarSurface(BaseSurface):
         return (self.corner_lons.take([0, 1, 3, 2, 0]),
                 self.corner_lats.take([0, 1, 3, 2, 0]),
                 self.corner_depths.take([0, 1, 3, 2, 0]))
+
+
+class PlanarSurfaceBatch(object):
+    """
+    A batch of P planar surfaces, typically the ruptures generated by a
+    point source for a given magnitude. The planes are stored as arrays,
+    so that the distances from N sites can be computed for all the planes
+    with a single vectorized projection.
+
+    :param surfaces: a sequence of P :class:`PlanarSurface` instances
+    """
+    DISTANCES = frozenset('rrup rjb rx ry0'.split())
+    # max number of (plane, site) pairs processed at once, to keep the
+    # temporary arrays small; the sites are split in blocks accordingly
+    MAX_PAIRS = 100_000
+
+    def __init__(self, surfaces):
+        self.normal = numpy.array([s.normal for s in surfaces])  # (P, 3)
+        self.d = numpy.array([s.d for s in surfaces])  # (P,)
+        self.uv1 = numpy.array([s.uv1 for s in surfaces])  # (P, 3)
+        self.uv2 = numpy.array([s.uv2 for s in surfaces])  # (P, 3)
+        self.zero_zero = numpy.array([s.zero_zero for s in surfaces])
+        self.length = numpy.array([s.length for s in surfaces])[:, None]
+        self.width = numpy.array([s.width for s in surfaces])[:, None]
+        self.strike = numpy.array([s.strike for s in surfaces])[:, None]
+        self.corner_lons = numpy.array([s.corner_lons for s in surfaces])
+        self.corner_lats = numpy.array([s.corner_lats for s in surfaces])
+
+    def __len__(self):
+        return len(self.d)
+
+    def _project(self, xyz):
+        # vectorized version of PlanarSurface._project for P planes and
+        # N points, returning three arrays of shape (P, N)
+        dists = self.normal @ xyz.T + self.d[:, None]
+        xx = (xyz @ self.uv1.T).T - dists * (
+            self.normal * self.uv1).sum(axis=1)[:, None] - (
+                self.zero_zero * self.uv1).sum(axis=1)[:, None]
+        yy = (xyz @ self.uv2.T).T - dists * (
+            self.normal * self.uv2).sum(axis=1)[:, None] - (
+                self.zero_zero * self.uv2).sum(axis=1)[:, None]
+        return dists, xx, yy
+
+    def _by_blocks(self, func, *arrays):
+        # call func on blocks of sites, splitting the arrays of N elements
+        # along the first axis; returns an array of shape (P, N)
+        N = len(arrays[0])
+        blocksize = max(self.MAX_PAIRS // len(self), 1)
+        if N <= blocksize:
+            return func(*arrays)
+        out = numpy.zeros((len(self), N))
+        for start in range(0, N, blocksize):
+            slc = slice(start, start + blocksize)
+            out[:, slc] = func(*[arr[slc] for arr in arrays])
+        return out
+
+    def get_min_distance(self, mesh):
+        """
+        :param mesh: a mesh of N points (or a site collection)
+        :returns: an array of shape (P, N) with the rupture distances
+
+        See :meth:`PlanarSurface.get_min_distance` for the algorithm.
+        """
+        return self._by_blocks(self._min_distance, mesh.xyz.reshape(-1, 3))
+
+    def _min_distance(self, xyz):
+        dists, xx, yy = self._project(xyz)
+        mxx = numpy.select([xx < 0, xx > self.length],
+                           [xx, xx - self.length], 0)
+        myy = numpy.select([yy < 0, yy > self.width],
+                           [yy, yy - self.width], 0)
+        return numpy.sqrt(dists ** 2 + mxx ** 2 + myy ** 2)
+
+    def get_joyner_boore_distance(self, mesh):
+        """
+        :param mesh: a mesh of N points (or a site collection)
+        :returns: an array of shape (P, N) with the Joyner-Boore distances
+
+        See :meth:`PlanarSurface.get_joyner_boore_distance` for the
+        algorithm.
+        """
+        return self._by_blocks(
+            self._joyner_boore_distance, mesh.lons.flatten(),
+            mesh.lats.flatten(), mesh.xyz.reshape(-1, 3))
+
+    def _joyner_boore_distance(self, lons, lats, xyz):
+        # the temporary arrays have shape (P, 4, N) and (P, 4, N, 3)
+        arcs_lons = self.corner_lons[:, [0, 2, 0, 1], None]  # (P, 4, 1)
+        arcs_lats = self.corner_lats[:, [0, 2, 0, 1], None]  # (P, 4, 1)
+        downdip_azimuth = (self.strike + 90) % 360
+        arcs_azimuths = numpy.concatenate(
+            [self.strike, self.strike, downdip_azimuth, downdip_azimuth],
+            axis=1)[:, :, None]  # (P, 4, 1)
+        dists_to_arcs = geodetic.distance_to_arc(
+            arcs_lons, arcs_lats, arcs_azimuths, lons, lats)  # (P, 4, N)
+        corners = geo_utils.spherical_to_cartesian(
+            self.corner_lons, self.corner_lats)  # (P, 4, 3)
+        dists_to_corners = numpy.sqrt(
+            ((corners[:, :, None] - xyz) ** 2).sum(axis=-1)).min(axis=1)
+        ds1, ds2, ds3, ds4 = numpy.sign(dists_to_arcs).transpose(1, 0, 2)
+        dists_to_arcs = numpy.abs(dists_to_arcs)
+        return numpy.select(
+            [(ds1 == ds2) & (ds3 == ds4), ds1 == ds2, ds3 == ds4],
+            [dists_to_corners,
+             numpy.fmin(dists_to_arcs[:, 0], dists_to_arcs[:, 1]),
+             numpy.fmin(dists_to_arcs[:, 2], dists_to_arcs[:, 3])],
+            0)
+
+    def get_rx_distance(self, mesh):
+        """
+        :param mesh: a mesh of N points (or a site collection)
+        :returns: an array of shape (P, N) with the Rx distances
+        """
+        return geodetic.distance_to_arc(
+            self.corner_lons[:, [0]], self.corner_lats[:, [0]], self.strike,
+            mesh.lons.flatten(), mesh.lats.flatten())
+
+    def get_ry0_distance(self, mesh):
+        """
+        :param mesh: a mesh of N points (or a site collection)
+        :returns: an array of shape (P, N) with the Ry0 distances
+        """
+        lons, lats = mesh.lons.flatten(), mesh.lats.flatten()
+        downdip_azimuth = (self.strike + 90.) % 360
+        dst1 = geodetic.distance_to_arc(
+            self.corner_lons[:, [0]], self.corner_lats[:, [0]],
+            downdip_azimuth, lons, lats)
+        dst2 = geodetic.distance_to_arc(
+            self.corner_lons[:, [1]], self.corner_lats[:, [1]],
+            downdip_azimuth, lons, lats)
+        return numpy.where(numpy.sign(dst1) == numpy.sign(dst2),
+                           numpy.fmin(numpy.abs(dst1), numpy.abs(dst2)), 0)
+
+    def get_distances(self, mesh, param):
+        """
+        :param mesh: a mesh of N points (or a site collection)
+        :param param: a distance parameter in .DISTANCES
+        :returns: an array of shape (P, N)
+        """
+        if param == 'rrup':
+            return self.get_min_distance(mesh)
+        elif param == 'rjb':
+            return self.get_joyner_boore_distance(mesh)
+        elif param == 'rx':
+            return self.get_rx_distance(mesh)
+        elif param == 'ry0':
+            return self.get_ry0_distance(mesh)
+        raise ValueError('Unknown distance measure %r' % param)
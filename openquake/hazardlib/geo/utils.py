@@ -22,7 +22,6 @@ to several geographical primitives and some other low-level spatial operations.
 """
 import math
 import logging
-import operator
 import collections
 
 import numpy
@@ -141,7 +140,7 @@ class _GeographicObjects(object):
         Associated a list of assets by site to the site collection used
         to instantiate GeographicObjects.
 
-        :param assets_by_sites: a list of lists of assets
+        :param assets_by_sites: a list of arrays of assets
         :param assoc_dist: the maximum distance for association
         :param mode: 'strict', 'warn' or 'filter'
         :param asset_ref: ID of the assets are a list of strings
@@ -154,28 +153,37 @@ class _GeographicObjects(object):
         assets_by_sid = collections.defaultdict(list)
         discarded = []
         for assets in assets_by_site:
-            lon, lat = assets[0].location
+            lon, lat = assets['lon'][0], assets['lat'][0]
             obj, distance = self.get_closest(lon, lat)
             if distance <= assoc_dist:
                 # keep the assets, otherwise discard them
-                assets_by_sid[obj['sids']].extend(assets)
+                assets_by_sid[obj['sids']].append(assets)
             elif mode == 'strict':
                 raise SiteAssociationError(
                     'There is nothing closer than %s km '
                     'to site (%s %s)' % (assoc_dist, lon, lat))
             else:
-                discarded.extend(assets)
+                discarded.append(assets)
         sids = sorted(assets_by_sid)
         if not sids:
             raise SiteAssociationError(
                 'Could not associate any site to any assets within the '
                 'asset_hazard_distance of %s km' % assoc_dist)
-        assets_by_site = [
-            sorted(assets_by_sid[sid], key=operator.attrgetter('ordinal'))
-            for sid in sids]
-        data = [(asset_refs[asset.ordinal],) + asset.location
-                for asset in discarded]
-        discarded = numpy.array(data, asset_dt)
+        assets_by_site = []
+        for sid in sids:
+            assets = numpy.concatenate(assets_by_sid[sid])
+            assets_by_site.append(
+                assets[numpy.argsort(assets['ordinal'], kind='stable')])
+        if discarded:
+            discarded = numpy.concatenate(discarded)
+            data = numpy.zeros(len(discarded), asset_dt)
+            data['asset_ref'] = numpy.asarray(asset_refs)[
+                discarded['ordinal']]
+            data['lon'] = discarded['lon']
+            data['lat'] = discarded['lat']
+            discarded = data
+        else:
+            discarded = numpy.zeros(0, asset_dt)
         return self.objects.filtered(sids), assets_by_site, discarded
 
 
@@ -184,8 +192,8 @@ def assoc(objects, sitecol, assoc_dist, mode, asset_refs=()):
     Associate geographic objects to a site collection.
 
     :param objects:
-        something with .lons, .lats or ['lon'] ['lat'], or a list of lists
-        of objects with a .location attribute (i.e. assets_by_site)
+        something with .lons, .lats or ['lon'] ['lat'], or a list of arrays
+        with fields 'lon', 'lat' and 'ordinal' (i.e. assets_by_site)
     :param assoc_dist:
         the maximum distance for association
     :param mode:
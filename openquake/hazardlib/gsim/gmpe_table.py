@@ -23,6 +23,7 @@ in the form of binary tables, and
 :class:`openquake.hazardlib.gsim.gmpe_table.AmplificationTable` for defining
 the corresponding amplification of the IMLs
 """
+import os
 from copy import deepcopy
 
 import h5py
@@ -36,6 +37,26 @@ from openquake.hazardlib.contexts import RuptureContext
 from openquake.hazardlib.gsim.base import GMPE
 from openquake.baselib.python3compat import round
 
+CACHESIZE = 1000  # maximum number of interpolated tables kept per GMPETable
+
+
+def read_array(dset):
+    """
+    Read an HDF5 dataset as a read-only memory map if the dataset is stored
+    contiguously and uncompressed in a real file, otherwise read it in memory.
+    Memory maps are shared by all the processes reading the same file.
+
+    :param dset: an instance of :class:`h5py.Dataset`
+    :returns: a numpy array
+    """
+    fname = dset.file.filename
+    if (dset.chunks is None and dset.compression is None and dset.size and
+            os.path.isfile(fname)):
+        offset = dset.id.get_offset()
+        if offset is not None:
+            return numpy.memmap(fname, dset.dtype, 'r', offset, dset.shape)
+    return dset[()]
+
 
 def hdf_arrays_to_dict(hdfgroup):
     """
@@ -48,7 +69,37 @@ def hdf_arrays_to_dict(hdfgroup):
         Dictionary containing each of the datasets within the group arranged
         by name
     """
-    return {key: hdfgroup[key][:] for key in hdfgroup}
+    return {key: read_array(hdfgroup[key]) for key in hdfgroup}
+
+
+class LRUCache(dict):
+    """
+    A dictionary keeping at most `maxsize` keys, discarding the least
+    recently used ones.
+
+    >>> cache = LRUCache(2)
+    >>> cache['a'] = 1; cache['b'] = 2
+    >>> cache.get('a')
+    1
+    >>> cache['c'] = 3
+    >>> sorted(cache)
+    ['a', 'c']
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+
+    def get(self, key, default=None):
+        try:
+            value = self.pop(key)
+        except KeyError:
+            return default
+        self[key] = value  # move the key at the end
+        return value
+
+    def __setitem__(self, key, value):
+        if key not in self and len(self) >= self.maxsize:
+            del self[next(iter(self))]  # the least recently used
+        super().__setitem__(key, value)
 
 
 class AmplificationTable(object):
@@ -305,10 +356,14 @@ class GMPETable(GMPE):
     def __init__(self, **kwargs):
         """
         Executes the preprocessing steps at the instantiation stage to read in
-        the tables from hdf5 and hold them in memory.
+        the tables from hdf5; the tables are memory-mapped when possible.
         """
         super().__init__(**kwargs)
+        self._read_tables()
+
+    def _read_tables(self):
         fname = self.kwargs.get('gmpe_table', self.gmpe_table)
+        self._cache = LRUCache(CACHESIZE)
         with h5py.File(fname, "r") as fle:
             self.distance_type = decode(fle["Distances"].attrs["metric"])
             self.REQUIRES_DISTANCES = set([self.distance_type])
@@ -328,6 +383,23 @@ class GMPETable(GMPE):
             if "Amplification" in fle:
                 self._setup_amplification(fle)
 
+    def __getstate__(self):
+        # the tables are not pickled when they can be read again from the
+        # file, so that the workers do not receive a copy of them
+        state = self.__dict__.copy()
+        del state['_cache']
+        if isinstance(self.kwargs.get('gmpe_table', self.gmpe_table), str):
+            for name in ('imls', 'stddevs', 'amplification'):
+                state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if 'imls' in state:
+            self._cache = LRUCache(CACHESIZE)
+        else:
+            self._read_tables()
+
     def _setup_standard_deviations(self, fle):
         """
         Reads the standard deviation tables from hdf5 and stores them in
@@ -421,21 +493,16 @@ class GMPETable(GMPE):
         :param distances:
             The distance vector for the given magnitude and IMT
         """
-        # For values outside of the interpolation range use -999. to ensure
-        # value is identifiable and outside of potential real values
-        interpolator_mean = interp1d(dists, data,
-                                     bounds_error=False,
-                                     fill_value=-999.)
-        mean = interpolator_mean(getattr(dctx, self.distance_type))
+        distances = getattr(dctx, self.distance_type)
         # For those distances less than or equal to the shortest distance
-        # extrapolate the shortest distance value
-        mean[getattr(dctx, self.distance_type) < (dists[0] + 1.0E-3)] = data[0]
+        # extrapolate the shortest distance value; if any distance is between
+        # the final distance and a margin of 0.001 km then assign the value
+        # at the final distance (numpy.interp does both)
+        mean = numpy.interp(distances, dists, data)
+        mean[distances < (dists[0] + 1.0E-3)] = data[0]
         # For those distances significantly greater than the furthest distance
         # set to 1E-20.
-        mean[getattr(dctx, self.distance_type) > (dists[-1] + 1.0E-3)] = 1E-20
-        # If any distance is between the final distance and a margin of 0.001
-        # km then assign to smallest distance
-        mean[mean < -1.] = data[-1]
+        mean[distances > (dists[-1] + 1.0E-3)] = 1E-20
         return mean
 
     def _get_stddevs(self, dists, mag, dctx, imt, stddev_types):
@@ -458,22 +525,68 @@ class GMPETable(GMPE):
                 raise ValueError("Standard Deviation type %s not supported"
                                  % stddev_type)
             sigma = self._return_tables(mag, imt, stddev_type)
-            interpolator_std = interp1d(dists, sigma,
-                                        bounds_error=False)
-            stddev = interpolator_std(getattr(dctx, self.distance_type))
-            stddev[getattr(dctx, self.distance_type) < dists[0]] = sigma[0]
-            stddev[getattr(dctx, self.distance_type) > dists[-1]] = sigma[-1]
-            stddevs.append(stddev)
+            # outside the range of the table the stddev at the closest
+            # distance is used
+            stddevs.append(numpy.interp(
+                getattr(dctx, self.distance_type), dists, sigma))
         return stddevs
 
+    def set_tables(self, mags, imts):
+        """
+        Interpolate in a single pass the tables for all the given magnitudes
+        and store them in the cache used by :meth:`_return_tables`.
+        Magnitudes below the range of the table are left to the
+        rupture-by-rupture path, which raises an error for them.
+
+        :param mags: rupture magnitudes, possibly repeated
+        :param imts: intensity measure types
+        """
+        mags = numpy.unique(numpy.array(mags, float))
+        mags = mags[mags >= self.m_w[0]]
+        if len(mags) == 0:
+            return
+        # NB: subclasses like NGAEastGMPE do not have tabulated stddevs
+        val_types = ["IMLs"] + sorted(getattr(self, 'stddevs', ()))
+        for imt in imts:
+            for val_type in val_types:
+                tables = self.apply_magnitude_interpolation(
+                    mags, self._get_log_table(imt, val_type), log=True)
+                for mag, table in zip(mags, tables.T):
+                    self._cache[str(imt), val_type, mag] = table
+
     def _return_tables(self, mag, imt, val_type):
         """
         Returns the vector of ground motions or standard deviations
         corresponding to the specific magnitude and intensity measure type.
+        The results for scalar magnitudes are cached; see also
+        :meth:`set_tables`.
 
+        :param mag:
+            Magnitude or array of magnitudes; in the second case the
+            result is a matrix with a column per magnitude
         :param val_type:
             String indicating the type of data {"IMLs", "Total", "Inter" etc}
         """
+        if numpy.ndim(mag):
+            return self.apply_magnitude_interpolation(
+                mag, self._get_log_table(imt, val_type), log=True)
+        key = (str(imt), val_type, mag)
+        table = self._cache.get(key)
+        if table is None:
+            table = self._cache[key] = self.apply_magnitude_interpolation(
+                mag, self._get_log_table(imt, val_type), log=True)
+        return table
+
+    def _get_log_table(self, imt, val_type):
+        """
+        :returns:
+            the log10 of the table for the given IMT and value type, of
+            shape (number of distances, number of magnitudes)
+        """
+        key = (str(imt), val_type)
+        table = self._cache.get(key)
+        if table is not None:
+            return table
         if imt.name in 'PGA PGV':
             # Get scalar imt
             if val_type == "IMLs":
@@ -502,28 +615,35 @@ class GMPETable(GMPE):
                                     numpy.log10(iml_table),
                                     axis=1)
             iml_table = 10. ** interpolator(numpy.log10(imt.period))
-        return self.apply_magnitude_interpolation(mag, iml_table)
+        self._cache[key] = table = numpy.log10(iml_table)
+        return table
 
-    def apply_magnitude_interpolation(self, mag, iml_table):
+    def apply_magnitude_interpolation(self, mag, iml_table, log=False):
         """
         Interpolates the tables to the required magnitude level
 
-        :param float mag:
-            Magnitude
+        :param mag:
+            Magnitude or array of magnitudes
         :param iml_table:
             Intensity measure level table
+        :param log:
+            If True, the table contains the log10 of the levels
         """
+        mags = numpy.array(mag, float)
         # do not allow "mag" to exceed maximum table magnitude
-        if mag > self.m_w[-1]:
-            mag = self.m_w[-1]
+        mags[mags > self.m_w[-1]] = self.m_w[-1]
 
         # Get magnitude values
-        if mag < self.m_w[0] or mag > self.m_w[-1]:
+        if (mags < self.m_w[0]).any():
             raise ValueError("Magnitude %.2f outside of supported range "
-                             "(%.2f to %.2f)" % (mag,
+                             "(%.2f to %.2f)" % (mags.min(),
                                                  self.m_w[0],
                                                  self.m_w[-1]))
         # It is assumed that log10 of the spectral acceleration scales
         # linearly (or approximately linearly) with magnitude
-        m_interpolator = interp1d(self.m_w, numpy.log10(iml_table), axis=1)
-        return 10.0 ** m_interpolator(mag)
+        table = iml_table if log else numpy.log10(iml_table)
+        # same as interp1d(self.m_w, table, axis=1)(mags)
+        hi = numpy.searchsorted(self.m_w, mags).clip(1, len(self.m_w) - 1)
+        lo = hi - 1
+        slope = (table[:, hi] - table[:, lo]) / (self.m_w[hi] - self.m_w[lo])
+        return 10.0 ** (slope * (mags - self.m_w[lo]) + table[:, lo])
@@ -76,6 +76,7 @@ import re
 import sys
 import logging
 import operator
+import itertools
 import collections.abc
 
 import numpy
@@ -181,10 +182,14 @@ default = sourceconverter.SourceConverter()  # rupture_mesh_spacing=10
 
 @node_to_obj.add(('sourceModel', 'nrml/0.4'))
 def get_source_model_04(node, fname, converter=default):
+    converter.fname = fname
+    return _source_model_04(node, node.get('name', ''), converter)
+
+
+def _source_model_04(src_nodes, name, converter):
     sources = []
     source_ids = set()
-    converter.fname = fname
-    for src_node in node:
+    for src_node in src_nodes:
         src = converter.convert_node(src_node)
         if src is None:
             continue
@@ -198,20 +203,29 @@ def get_source_model_04(node, fname, converter=default):
     src_groups = sorted(sourceconverter.SourceGroup(
         trt, srcs, min_mag=converter.minimum_magnitude)
                         for trt, srcs in groups.items())
-    return SourceModel(src_groups, node.get('name', ''))
+    return SourceModel(src_groups, name)
 
 
 @node_to_obj.add(('sourceModel', 'nrml/0.5'))
 def get_source_model_05(node, fname, converter=default):
     converter.fname = fname
+    return _source_model_05(node, ((grp, grp) for grp in node), converter)
+
+
+def _source_model_05(node, grp_pairs, converter):
+    # grp_pairs is an iterable over pairs (sourceGroup node, source nodes)
     groups = []  # expect a sequence of sourceGroup nodes
-    for src_group in node:
+    for src_group, src_nodes in grp_pairs:
         if 'sourceGroup' not in src_group.tag:
             raise InvalidFile(
                 '%s: you have an incorrect declaration '
                 'xmlns="http://openquake.org/xmlns/nrml/0.5"; it should be '
-                'xmlns="http://openquake.org/xmlns/nrml/0.4"' % fname)
-        sg = converter.convert_node(src_group)
+                'xmlns="http://openquake.org/xmlns/nrml/0.4"' %
+                converter.fname)
+        trt = src_group.attrib.get('tectonicRegion')
+        if trt and trt in converter.discard_trts:
+            continue
+        sg = converter.convert_sourceGroup(src_group, src_nodes)
         if sg and len(sg):
             # a source group can be empty if the source_id filtering is on
             groups.append(sg)
@@ -306,18 +320,67 @@ validators = {
 }
 
 
+def _is_source(tag):
+    return tag.endswith('Source')
+
+
+def _split_groups(pairs):
+    # split the pairs (ancestors, source node) by source group, lazily
+    for _, grp in itertools.groupby(pairs, lambda pair: id(pair[0][-1])):
+        ancestors, src_node = next(grp)
+        yield ancestors[-1], itertools.chain(
+            [src_node], (node for _, node in grp))
+
+
+def read_source_model(fname, converter=default):
+    """
+    Parse a source model file incrementally, converting and validating
+    each source node as soon as it is read, without building the full
+    tree of nodes in memory. It is slower than :func:`to_python` but it
+    needs a fraction of the memory on large source models.
+
+    :param fname:
+        a source model file in NRML format
+    :param converter:
+        a :class:`openquake.hazardlib.sourceconverter.SourceConverter` instance
+    :returns:
+        a SourceModel instance
+    """
+    converter.fname = fname
+    pairs = ValidatingXmlParser(validators).iterparse(fname, _is_source)
+    try:
+        ancestors, src_node = next(pairs)
+    except StopIteration:  # no sources, read the file in the usual way
+        return to_python(fname, converter)
+    pairs = itertools.chain([(ancestors, src_node)], pairs)
+    node = ancestors[1]  # sourceModel node, without children
+    tag, version = get_tag_version(node)
+    if tag != 'sourceModel':
+        raise InvalidFile('%s: expected a sourceModel, got %s' % (fname, tag))
+    elif version == 'nrml/0.4':
+        return _source_model_04((src_node for _, src_node in pairs),
+                                node.get('name', ''), converter)
+    return _source_model_05(node, _split_groups(pairs), converter)
+
+
 def read_source_models(fnames, converter):
     """
     :param fnames:
-        list of source model files
+        list of source model files, in NRML or in columnar HDF5 format
     :param converter:
-        a :class:`openquake.hazardlib.sourceconverter.SourceConverter` instance
+        a :class:`openquake.hazardlib.sourceconverter.SourceConverter` instance;
+        if converter.streaming is set the NRML files are parsed incrementally
     :yields:
         SourceModel instances
     """
     for fname in fnames:
-        if fname.endswith(('.xml', '.nrml')):
+        if fname.endswith(('.xml', '.nrml')) and converter.streaming:
+            sm = read_source_model(fname, converter)
+        elif fname.endswith(('.xml', '.nrml')):
             sm = to_python(fname, converter)
+        elif fname.endswith('.hdf5'):
+            from openquake.hazardlib import sourcetables
+            sm = sourcetables.read(fname, converter)
         else:
             raise ValueError('Unrecognized extension in %s' % fname)
         sm.fname = fname
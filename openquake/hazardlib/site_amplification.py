@@ -16,7 +16,6 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with OpenQuake.  If not, see <http://www.gnu.org/licenses/>.
 
-from itertools import cycle
 import numpy
 from scipy.stats import norm
 from openquake.baselib.general import group_array
@@ -120,6 +119,7 @@ class Amplifier(object):
         self.imtdict = {imt: str(imts[m]) for m, imt in zip(m_indices, imtls)}
         self.alpha = {}  # code, imt -> alphas
         self.sigma = {}  # code, imt -> sigmas
+        self.kernels = {}  # code, imt -> matrix of shape (I-1, A)
         self.ampcodes = []
         for code, arr in group_array(ampl_funcs, 'ampcode').items():
             self.ampcodes.append(code)
@@ -146,6 +146,35 @@ class Amplifier(object):
                              'from vs30_ref=%d over the tolerance of %d' %
                              (self.vs30_ref, vs30_tolerance))
 
+    def get_kernel(self, ampl_code, imt):
+        """
+        :param ampl_code: code for the amplification function
+        :param imt: an intensity measure type
+        :returns: a matrix of shape (I-1, A), computed once and cached
+
+        The element (i, a) of the kernel is the probability that the
+        amplified intensity at the mid level i exceeds the soil level a.
+        """
+        if ampl_code == b'' and len(self.ampcodes) == 1:
+            # manage the case of a site collection with empty ampcode
+            ampl_code = self.ampcodes[0]
+        stored_imt = self.imtdict[imt]
+        try:
+            return self.kernels[ampl_code, stored_imt]
+        except KeyError:
+            pass
+        I1 = len(self.midlevels)
+        # there are either I-1 coefficients or a single one for all levels
+        alphas = numpy.resize(self.alpha[ampl_code, stored_imt], I1)[:, None]
+        sigmas = numpy.resize(self.sigma[ampl_code, stored_imt], I1)[:, None]
+        x = self.amplevels / self.midlevels[:, None]  # shape (I-1, A)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            cdf = norm.cdf(x, loc=alphas, scale=sigmas)
+        # norm.cdf returns NaNs for sigma=0, use the Heaviside function
+        cdf = numpy.where(sigmas == 0, numpy.heaviside(x - alphas, .5), cdf)
+        kernel = self.kernels[ampl_code, stored_imt] = 1. - cdf
+        return kernel
+
     def amplify_one(self, ampl_code, imt, poes):
         """
         :param ampl_code: code for the amplification function
@@ -155,20 +184,27 @@ class Amplifier(object):
         """
         if isinstance(poes, list):  # in the tests
             poes = numpy.array(poes).reshape(-1, 1)
-        if ampl_code == b'' and len(self.ampcodes) == 1:
-            # manage the case of a site collection with empty ampcode
-            ampl_code = self.ampcodes[0]
-        stored_imt = self.imtdict[imt]
-        alphas = self.alpha[ampl_code, stored_imt]  # array with I-1 elements
-        sigmas = self.sigma[ampl_code, stored_imt]  # array with I-1 elements
-        A, G = len(self.amplevels), poes.shape[1]
-        ampl_poes = numpy.zeros((A, G))
-        for g in range(G):
-            p_occ = -numpy.diff(poes[:, g])
-            for mid, p, a, s in zip(
-                    self.midlevels, p_occ, cycle(alphas), cycle(sigmas)):
-                ampl_poes[:, g] += (1-norm_cdf(self.amplevels/mid, a, s)) * p
-        return ampl_poes
+        p_occ = -numpy.diff(poes, axis=0)  # shape (I-1, G)
+        return self.get_kernel(ampl_code, imt).T @ p_occ
+
+    def amplify_array(self, ampl_code, poes):
+        """
+        :param ampl_code: code for the amplification function
+        :param poes: the original PoEs as an array of shape (..., L)
+        :returns: the amplified PoEs as an array of shape (..., A * M)
+
+        All the curves in the array are amplified at once with a single
+        matrix product per IMT, so this is the method to use when
+        amplifying the curves of many sites and realizations.
+        """
+        shp = poes.shape[:-1]
+        poes = poes.reshape(-1, poes.shape[-1])
+        I = len(self.midlevels) + 1  # the levels are the same for all IMTs
+        out = []
+        for m, imt in enumerate(self.imtls):
+            p_occ = -numpy.diff(poes[:, m * I:(m + 1) * I], axis=1)
+            out.append(p_occ @ self.get_kernel(ampl_code, imt))
+        return numpy.concatenate(out, axis=1).reshape(shp + (-1,))
 
     def amplify(self, ampl_code, pcurves):
         """
@@ -176,15 +212,11 @@ class Amplifier(object):
         :param pcurves: a list of ProbabilityCurves containing PoEs
         :returns: amplified ProbabilityCurves
         """
-        out = []
-        for pcurve in pcurves:
-            lst = []
-            for imt in self.imtls:
-                slc = self.imtls(imt)
-                new = self.amplify_one(ampl_code, imt, pcurve.array[slc])
-                lst.append(new)
-            out.append(ProbabilityCurve(numpy.concatenate(lst)))
-        return out
+        if not pcurves:
+            return []
+        arr = numpy.array([pcurve.array.T for pcurve in pcurves])  # R, G, L
+        return [ProbabilityCurve(curves.T)
+                for curves in self.amplify_array(ampl_code, arr)]
 
     def amplify_gmvs(self, ampl_code, gmvs, imt):
         """
@@ -571,7 +571,7 @@ class SourceConverter(RuptureConverter):
                  area_source_discretization=None,
                  minimum_magnitude={'default': 0},
                  spinning_floating=True, source_id=None,
-                 discard_trts=''):
+                 discard_trts='', streaming=False):
         self.investigation_time = investigation_time
         self.area_source_discretization = area_source_discretization
         self.minimum_magnitude = minimum_magnitude
@@ -582,6 +582,7 @@ class SourceConverter(RuptureConverter):
         self.spinning_floating = spinning_floating
         self.source_id = source_id
         self.discard_trts = discard_trts
+        self.streaming = streaming
 
     def convert_node(self, node):
         """
@@ -889,20 +890,36 @@ class SourceConverter(RuptureConverter):
     def convert_sourceModel(self, node):
         return [self.convert_node(subnode) for subnode in node]
 
-    def convert_sourceGroup(self, node):
+    def convert_sourceGroup(self, node, src_nodes=None):
         """
         Convert the given node into a SourceGroup object.
 
         :param node:
             a node with tag sourceGroup
+        :param src_nodes:
+            an iterable over the source nodes (if None, the children of node)
         :returns:
             a :class:`SourceGroup` instance
         """
+        if src_nodes is None:
+            src_nodes = node
+        sg = self.new_sourceGroup(node)
+        num_srcs = 0
+        for src_node in src_nodes:
+            num_srcs += 1
+            src = self.convert_node(src_node)
+            if src is None:  # filtered out by source_id
+                continue
+            with context(self.fname, src_node):
+                self.add_source(sg, node, src)
+        return self.check_sourceGroup(sg, node, num_srcs)
+
+    def new_sourceGroup(self, node):
+        """
+        :param node: a node with tag sourceGroup (the children are ignored)
+        :returns: an empty :class:`SourceGroup` instance
+        """
         trt = node['tectonicRegion']
-        srcs_weights = node.attrib.get('srcs_weights')
-        grp_attrs = {k: v for k, v in node.attrib.items()
-                     if k not in ('name', 'src_interdep', 'rup_interdep',
-                                  'srcs_weights')}
         sg = SourceGroup(trt, min_mag=self.minimum_magnitude)
         sg.temporal_occurrence_model = self.get_tom(node)
         sg.name = node.attrib.get('name')
@@ -921,30 +938,46 @@ class SourceConverter(RuptureConverter):
             assert 'tom' in node.attrib, msg
             if isinstance(tom, PoissonTOM):
                 assert hasattr(sg, 'occurrence_rate')
-        #
-        for src_node in node:
-            src = self.convert_node(src_node)
-            if src is None:  # filtered out by source_id
-                continue
-            # transmit the group attributes to the underlying source
-            for attr, value in grp_attrs.items():
-                if attr == 'tectonicRegion':
-                    src_trt = src_node.get('tectonicRegion')
-                    if src_trt and src_trt != trt:
-                        with context(self.fname, src_node):
-                            raise ValueError('Found %s, expected %s' %
-                                             (src_node['tectonicRegion'], trt))
-                    src.tectonic_region_type = trt
-                elif attr == 'grp_probability':
-                    pass  # do not transmit
-                else:  # transmit as it is
-                    setattr(src, attr, node[attr])
-            sg.update(src)
+        return sg
+
+    def add_source(self, sg, node, src):
+        """
+        Transmit the attributes of the sourceGroup node to the source
+        and add it to the SourceGroup.
+
+        :param sg: a :class:`SourceGroup` instance
+        :param node: the corresponding node with tag sourceGroup
+        :param src: a hazardlib source
+        """
+        trt = node['tectonicRegion']
+        for attr, value in node.attrib.items():
+            if attr in ('name', 'src_interdep', 'rup_interdep',
+                        'srcs_weights', 'grp_probability'):
+                pass  # do not transmit
+            elif attr == 'tectonicRegion':
+                src_trt = src.tectonic_region_type
+                if src_trt and src_trt != trt:
+                    raise ValueError('Found %s, expected %s' % (src_trt, trt))
+                src.tectonic_region_type = trt
+            else:  # transmit as it is
+                setattr(src, attr, value)
+        sg.update(src)
+
+    def check_sourceGroup(self, sg, node, num_srcs):
+        """
+        Set the mutex weights of the sources and check the SourceGroup.
+
+        :param sg: a :class:`SourceGroup` instance
+        :param node: the corresponding node with tag sourceGroup
+        :param num_srcs: the number of sources before the source_id filtering
+        :returns: the SourceGroup
+        """
+        srcs_weights = node.attrib.get('srcs_weights')
         if srcs_weights is not None:
-            if len(node) and len(srcs_weights) != len(node):
+            if num_srcs and len(srcs_weights) != num_srcs:
                 raise ValueError(
                     'There are %d srcs_weights but %d source(s) in %s'
-                    % (len(srcs_weights), len(node), self.fname))
+                    % (len(srcs_weights), num_srcs, self.fname))
             for src, sw in zip(sg, srcs_weights):
                 src.mutex_weight = sw
         # check that, when the cluster option is set, the group has a temporal
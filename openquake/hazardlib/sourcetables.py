@@ -0,0 +1,564 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+#
+# Copyright (C) 2020 GEM Foundation
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+"""
+Columnar HDF5 format for source models, as generated by `oq to_hdf5`.
+The file contains the following datasets:
+
+- `sources`: a structured array with a row per source, in the same order
+  as in the original NRML file, with the scalar parameters of the source
+- `source_id`, `name` and `trt`: the corresponding string attributes
+  of the sources (stored apart since they have variable length)
+- `coords`: the ragged array of the geometries (lon, lat, depth, edge),
+  i.e. the point locations, the polygons, the fault traces and the edges
+- `npd` and `hdd`: the ragged arrays of the nodal plane distributions and
+  of the hypocenter depth distributions
+- `mfd`: a flat array of floats with the parameters of the MFDs
+- `groups`: the sourceGroup nodes (without children) in NRML format
+- `nodes`: the source nodes which are not stored in columnar form, in
+  NRML format
+
+Point, area, multi-point, simple fault and complex fault sources are stored
+in columnar form and converted without passing through the
+:class:`openquake.hazardlib.sourceconverter.SourceConverter`; characteristic
+and nonparametric sources (and simple faults with a hypoList or a slipList)
+are stored as XML strings, validated again when read and converted in the
+usual way; the file contains no pickles, so reading an untrusted file
+cannot execute arbitrary code.
+The conversion parameters (mesh spacings, width of the MFD bins, area
+discretization, etc) are not stored, since they are read from the job.ini.
+"""
+import io
+import os
+import numpy
+
+from openquake.baselib import hdf5
+from openquake.baselib.node import ValidatingXmlParser, striptag, context
+from openquake.hazardlib import geo, mfd, pmf, source, tom, valid, nrml
+from openquake.hazardlib.sourceconverter import (
+    split_coords_2d, split_coords_3d, fix_dupl)
+
+U16 = numpy.uint16
+U32 = numpy.uint32
+I32 = numpy.int32
+F32 = numpy.float32
+F64 = numpy.float64
+
+COLUMNAR = ('pointSource', 'areaSource', 'multiPointSource',
+            'simpleFaultSource', 'complexFaultSource')
+# field of the MFD -> name of the attribute in a (non multi) MFD node
+ATTRIB = dict(mfd.multi_mfd.ALIAS, total_moment_rate='totalMomentRate')
+RAGGED = ('magnitudes', 'occurRates')
+
+source_dt = numpy.dtype([
+    ('kind', 'S30'), ('grp_id', U32), ('msr', 'S40'),
+    ('aspect_ratio', F64), ('upper_depth', F64), ('lower_depth', F64),
+    ('dip', F64), ('rake', F64), ('discretization', F64),
+    ('tom', 'S20'), ('occurrence_rate', F64),
+    ('mfd', 'S30'), ('mfd_size', U32), ('mfd_start', U32), ('mfd_stop', U32),
+    ('npd_start', U32), ('npd_stop', U32),
+    ('hdd_start', U32), ('hdd_stop', U32),
+    ('coo_start', U32), ('coo_stop', U32), ('node', I32)])
+coords_dt = numpy.dtype([('lon', F64), ('lat', F64), ('depth', F64),
+                         ('edge', U16)])
+npd_dt = numpy.dtype([('probability', F64), ('strike', F64), ('dip', F64),
+                      ('rake', F64)])
+hdd_dt = numpy.dtype([('probability', F64), ('depth', F64)])
+
+
+def _to_xml(node):
+    # convert a validated node into a NRML string, without losing precision
+    with io.BytesIO() as f:
+        nrml.write([node], f, '%r')
+        return f.getvalue().decode('utf-8')
+
+
+def _from_xml(xml):
+    # convert a NRML string generated by _to_xml into a validated node
+    return ValidatingXmlParser(nrml.validators).parse_bytes(
+        xml.encode('utf-8'))[0]
+
+
+def _mfd_fields(kind):
+    # returns the scalar fields and the ragged fields of the given MFD kind
+    fields = mfd.multi_mfd.ASSOC[kind][1:]
+    return ([f for f in fields if f not in RAGGED],
+            [f for f in fields if f in RAGGED])
+
+
+def _mfd_values(mfd_node, field, multi):
+    if multi or field in RAGGED:  # field stored in a subnode
+        try:
+            return ~getattr(mfd_node, field)
+        except AttributeError:  # missing bin_width in multiMFD
+            return []
+    elif ATTRIB[field] in mfd_node.attrib:
+        return [mfd_node[ATTRIB[field]]]
+    return []  # missing optional attribute
+
+
+def _mfd_params(mfd_node):
+    # returns (kind, size, flat list of floats) for the given MFD node;
+    # each field is stored as the number of values followed by the values
+    # and the ragged fields are preceded by their lengths
+    tag = striptag(mfd_node.tag)
+    multi = tag == 'multiMFD'
+    kind, size = (mfd_node['kind'], mfd_node['size']) if multi else (tag, 0)
+    scalars, ragged = _mfd_fields(kind)
+    lists = [_mfd_values(mfd_node, field, multi) for field in scalars]
+    if ragged:
+        values = [_mfd_values(mfd_node, field, multi) for field in ragged]
+        lists.append(~mfd_node.lengths if multi else [len(values[0])])
+        lists.extend(values)
+    flat = []
+    for values in lists:
+        flat.append(len(values))
+        flat.extend(values)
+    return kind, size, flat
+
+
+def _is_columnar(node):
+    # True if the source node can be stored in columnar form
+    kind = striptag(node.tag)
+    if kind not in COLUMNAR:
+        return False
+    tags = set(striptag(subnode.tag) for subnode in node)
+    if 'hypoList' in tags or 'slipList' in tags:
+        return False
+    return 'multiMFD' not in tags or kind == 'multiPointSource'
+
+
+class _Tables(object):
+    # accumulate the rows of the tables, source by source
+    def __init__(self):
+        self.sources = []
+        self.coords = []
+        self.npd = []
+        self.hdd = []
+        self.mfd = []
+        self.nodes = []
+
+    def _extend(self, name, rows):
+        lst = getattr(self, name)
+        start = len(lst)
+        lst.extend(rows)
+        return start, len(lst)
+
+    def add(self, node, grp_id):
+        kind = striptag(node.tag)
+        row = dict(kind=kind, source_id=node['id'], name=node['name'],
+                   trt=node.get('tectonicRegion', ''), grp_id=grp_id,
+                   tom=node.get('tom', ''),
+                   occurrence_rate=node.get('occurrence_rate', numpy.nan),
+                   node=-1)
+        if not _is_columnar(node):
+            row['node'] = len(self.nodes)
+            self.nodes.append(_to_xml(node))
+            self.sources.append(row)
+            return
+        [mfd_node] = [n for n in node if striptag(n.tag).endswith('MFD')]
+        kind_, size, flat = _mfd_params(mfd_node)
+        row['mfd'], row['mfd_size'] = kind_, size
+        row['mfd_start'], row['mfd_stop'] = self._extend('mfd', flat)
+        row['msr'] = ~node.magScaleRel
+        row['aspect_ratio'] = ~node.ruptAspectRatio
+        if kind in ('pointSource', 'areaSource', 'multiPointSource'):
+            npd = [(n['probability'], n['strike'], n['dip'], n['rake'])
+                   for n in node.nodalPlaneDist]
+            hdd = [(n['probability'], n['depth'])
+                   for n in node.hypoDepthDist]
+            row['npd_start'], row['npd_stop'] = self._extend('npd', npd)
+            row['hdd_start'], row['hdd_stop'] = self._extend('hdd', hdd)
+        if kind == 'pointSource':
+            geom = node.pointGeometry
+            lon, lat = ~geom.Point.pos
+            coords = [(lon, lat, numpy.nan, 0)]
+        elif kind == 'areaSource':
+            geom = node.areaGeometry
+            coords = [(lon, lat, numpy.nan, 0) for lon, lat in split_coords_2d(
+                ~geom.Polygon.exterior.LinearRing.posList)]
+            row['discretization'] = geom.attrib.get(
+                'discretization', numpy.nan)
+        elif kind == 'multiPointSource':
+            geom = node.multiPointGeometry
+            coords = [(lon, lat, numpy.nan, 0)
+                      for lon, lat in split_coords_2d(~geom.posList)]
+        elif kind == 'simpleFaultSource':
+            geom = node.simpleFaultGeometry
+            coords = [(lon, lat, numpy.nan, 0) for lon, lat in split_coords_2d(
+                ~geom.LineString.posList)]
+            row['dip'] = ~geom.dip
+            row['rake'] = ~node.rake
+        elif kind == 'complexFaultSource':
+            geom = node.complexFaultGeometry
+            coords = [(lon, lat, depth, e) for e, edge in enumerate(geom)
+                      for lon, lat, depth in split_coords_3d(
+                          ~edge.LineString.posList)]
+            row['rake'] = ~node.rake
+        if kind != 'complexFaultSource':
+            row['upper_depth'] = ~geom.upperSeismoDepth
+            row['lower_depth'] = ~geom.lowerSeismoDepth
+        row['coo_start'], row['coo_stop'] = self._extend('coords', coords)
+        self.sources.append(row)
+
+    def get_sources(self):
+        defaults = {name: numpy.nan if source_dt[name].kind == 'f' else
+                    0 if source_dt[name].kind in 'iu' else ''
+                    for name in source_dt.names}
+        return numpy.array([tuple(row.get(name, defaults[name])
+                                  for name in source_dt.names)
+                            for row in self.sources], source_dt)
+
+    def get_strings(self, name):
+        return numpy.array([row[name] for row in self.sources], object)
+
+
+def write(xmlfname, hdf5fname):
+    """
+    Convert a source model file in NRML 0.5 format into the columnar
+    HDF5 format. The source nodes are read and validated one at the time.
+
+    :param xmlfname: path to a source model file in NRML format
+    :param hdf5fname: path to the .hdf5 file to generate
+    :returns: hdf5fname
+    """
+    pairs = ValidatingXmlParser(nrml.validators).iterparse(
+        xmlfname, lambda tag: tag.endswith('Source'))
+    tables = _Tables()
+    groups = []
+    sm_node = None
+    for ancestors, node in pairs:
+        if sm_node is None:
+            sm_node = ancestors[1]
+            tag, version = nrml.get_tag_version(sm_node)
+            if tag != 'sourceModel':
+                raise ValueError('%s: expected a sourceModel, got %s' %
+                                 (xmlfname, tag))
+            elif version == 'nrml/0.4':
+                raise ValueError('Please upgrade with `oq upgrade_nrml %s`' %
+                                 (os.path.dirname(xmlfname) or '.'))
+        grp_node = ancestors[-1]
+        if not groups or groups[-1] is not grp_node:
+            if 'sourceGroup' not in grp_node.tag:
+                raise ValueError('%s: expected a sourceGroup, got %s' %
+                                 (xmlfname, grp_node.tag))
+            groups.append(grp_node)
+        with context(xmlfname, node):
+            tables.add(node, len(groups) - 1)
+    if sm_node is None:
+        raise ValueError('There are no sources in %s' % xmlfname)
+    with hdf5.File(hdf5fname, 'w') as h5:
+        h5['sources'] = tables.get_sources()
+        for name in ('source_id', 'name', 'trt'):
+            h5.create_dataset(name, (len(tables.sources),), hdf5.vstr)[:] = (
+                tables.get_strings(name))
+        h5['coords'] = numpy.array(tables.coords, coords_dt)
+        h5['npd'] = numpy.array(tables.npd, npd_dt)
+        h5['hdd'] = numpy.array(tables.hdd, hdd_dt)
+        h5['mfd'] = numpy.array(tables.mfd, F64)
+        for name, xmls in [('groups', [_to_xml(grp) for grp in groups]),
+                           ('nodes', tables.nodes)]:
+            h5.create_dataset(name, (len(xmls),), hdf5.vstr)[:] = numpy.array(
+                xmls, object)
+        for name in ('name', 'investigation_time', 'start_time'):
+            if name in sm_node.attrib:
+                h5.attrs[name] = str(sm_node[name])
+    return hdf5fname
+
+
+def _split(flat):
+    # split a flat list [n1, v1, ... vn1, n2, w1, ... wn2 ...] into lists
+    lists = []
+    i = 0
+    while i < len(flat):
+        n = int(flat[i])
+        lists.append(flat[i + 1: i + 1 + n])
+        i += n + 1
+    return lists
+
+
+def _mfd_columns(starts, flat, kind):
+    # decode the parameters of N (non multi) MFDs of the given kind, column
+    # by column, by following the layout generated by _mfd_params;
+    # returns a dictionary field -> N values (or N arrays for ragged fields),
+    # with NaNs for the missing optional parameters
+    flat = numpy.append(flat, numpy.nan)  # to index the missing values
+    scalars, ragged = _mfd_fields(kind)
+    pos = starts.astype(int)
+    columns = {}
+    for field in scalars:
+        n = flat[pos].astype(int)  # 0 if missing, 1 otherwise
+        columns[field] = numpy.where(n, flat[pos + 1], numpy.nan)
+        pos += n + 1
+    if ragged:
+        pos += flat[pos].astype(int) + 1  # skip the lengths
+        for field in ragged:
+            n = flat[pos].astype(int)
+            columns[field] = [flat[p + 1: p + 1 + m] for p, m in zip(pos, n)]
+            pos += n + 1
+    return columns
+
+
+class _SourceBuilder(object):
+    # build hazardlib sources from the rows of the columnar tables
+    def __init__(self, converter, h5):
+        self.converter = converter
+        coords = h5['coords'][()]
+        self.lon = coords['lon']
+        self.lat = coords['lat']
+        self.depth = coords['depth']
+        self.edge = coords['edge']
+        self.npd = h5['npd'][()]
+        self.hdd = h5['hdd'][()]
+        self.mfd = h5['mfd'][()]
+        self.msr = {}  # name -> magnitude scaling relationship
+
+    def get_mfds(self, array):
+        """
+        :param array: an array of rows with the fields of `source_dt`
+        :returns: a list with the MFDs of the columnar sources (None for
+                  the other sources); the parameters of the MFDs are
+                  decoded in batches, one for each MFD kind
+        """
+        mfds = [None] * len(array)
+        columnar = array['node'] < 0
+        for idx in numpy.where(columnar & (array['mfd_size'] > 0))[0]:
+            mfds[idx] = self.get_mfd(array[idx])
+        single = columnar & (array['mfd_size'] == 0)
+        for kind in numpy.unique(array['mfd'][single]):
+            idxs, = numpy.where(single & (array['mfd'] == kind))
+            cols = _mfd_columns(array['mfd_start'][idxs], self.mfd,
+                                kind.decode('utf8'))
+            for i, idx in enumerate(idxs):
+                kw = {}
+                for field, col in cols.items():
+                    val = col[i]
+                    if field in RAGGED:
+                        kw[field] = val.tolist()
+                    else:  # missing optional parameters are None
+                        kw[field] = None if numpy.isnan(val) else float(val)
+                mfds[idx] = self._new_mfd(kind.decode('utf8'), kw)
+        return mfds
+
+    def get_mfd(self, row):
+        kind = row['mfd'].decode('utf8')
+        size = row['mfd_size']
+        scalars, ragged = _mfd_fields(kind)
+        lists = _split(self.mfd[row['mfd_start']:row['mfd_stop']].tolist())
+        kwargs = dict(zip(scalars, lists))
+        if ragged:
+            lengths = lists[len(scalars)]
+            if size and len(lengths) == 1:  # all the same length
+                lengths = lengths * size
+            for field, values in zip(ragged, lists[len(scalars) + 1:]):
+                it = iter(values)
+                kwargs[field] = [[next(it) for _ in range(int(length))]
+                                 for length in lengths]
+        if size:  # multiMFD
+            kw = {field: values for field, values in kwargs.items()
+                  if values}  # bin_width can be missing
+            return mfd.multi_mfd.MultiMFD(
+                kind, size, self.converter.width_of_mfd_bin, **kw)
+        kw = {field: values[0] if values else None
+              for field, values in kwargs.items()}
+        return self._new_mfd(kind, kw)
+
+    def _new_mfd(self, kind, kw):
+        # build a (non multi) MFD from the dictionary of its parameters
+        if kind == 'incrementalMFD':
+            return mfd.EvenlyDiscretizedMFD(
+                min_mag=kw['min_mag'], bin_width=kw['bin_width'],
+                occurrence_rates=kw['occurRates'])
+        elif kind == 'truncGutenbergRichterMFD':
+            return mfd.TruncatedGRMFD(
+                a_val=kw['a_val'], b_val=kw['b_val'],
+                min_mag=kw['min_mag'], max_mag=kw['max_mag'],
+                bin_width=self.converter.width_of_mfd_bin)
+        elif kind == 'arbitraryMFD':
+            return mfd.ArbitraryMFD(
+                magnitudes=kw['magnitudes'],
+                occurrence_rates=kw['occurRates'])
+        elif kind == 'YoungsCoppersmithMFD':
+            return mfd.YoungsCoppersmith1985MFD(
+                min_mag=kw['min_mag'], b_val=kw['b_val'],
+                char_mag=kw['char_mag'], char_rate=kw['char_rate'],
+                total_moment_rate=kw['total_moment_rate'],
+                bin_width=kw['bin_width'])
+
+    def get_npdist(self, row):
+        npdist = [(prob, geo.NodalPlane(strike, dip, rake))
+                  for prob, strike, dip, rake in self.npd[
+                      row['npd_start']:row['npd_stop']].tolist()]
+        fix_dupl(npdist, self.converter.fname, row['source_id'])
+        if not self.converter.spinning_floating:
+            npdist = [(1, npdist[0][1])]  # consider the first nodal plane
+        return pmf.PMF(npdist)
+
+    def get_hddist(self, row):
+        hddist = self.hdd[row['hdd_start']:row['hdd_stop']].tolist()
+        fix_dupl(hddist, self.converter.fname, row['source_id'])
+        if not self.converter.spinning_floating:  # consider the first depth
+            hddist = [(1, hddist[0][1])]
+        return pmf.PMF(hddist)
+
+    def get_tom(self, row):
+        tom_cls = tom.registry[row['tom'].decode('utf8') or 'PoissonTOM']
+        rate = row['occurrence_rate']
+        return tom_cls(time_span=self.converter.investigation_time,
+                       occurrence_rate=None if numpy.isnan(rate) else rate)
+
+    def build(self, row, mfd=None):
+        """
+        :param row: a dictionary with the fields of `source_dt` and the
+            keys source_id, name, trt
+        :param mfd: the MFD of the source, if already built by get_mfds
+        :returns: a hazardlib source
+        """
+        kind = row['kind'].decode('utf8')
+        msr_name = row['msr'].decode('utf8')
+        try:
+            msr = self.msr[msr_name]
+        except KeyError:
+            msr = self.msr[msr_name] = valid.SCALEREL[msr_name]()
+        coo = slice(row['coo_start'], row['coo_stop'])
+        lons, lats = self.lon[coo], self.lat[coo]
+        kw = dict(source_id=row['source_id'], name=row['name'],
+                  tectonic_region_type=row['trt'] or None,
+                  mfd=self.get_mfd(row) if mfd is None else mfd,
+                  magnitude_scaling_relationship=msr,
+                  rupture_aspect_ratio=row['aspect_ratio'],
+                  temporal_occurrence_model=self.get_tom(row))
+        if kind in ('pointSource', 'areaSource', 'multiPointSource'):
+            kw['nodal_plane_distribution'] = self.get_npdist(row)
+            kw['hypocenter_distribution'] = self.get_hddist(row)
+        if kind != 'complexFaultSource':
+            kw['upper_seismogenic_depth'] = row['upper_depth']
+            kw['lower_seismogenic_depth'] = row['lower_depth']
+        if kind == 'pointSource':
+            return source.PointSource(
+                location=geo.Point(float(lons[0]), float(lats[0])),
+                rupture_mesh_spacing=self.converter.rupture_mesh_spacing,
+                **kw)
+        elif kind == 'areaSource':
+            discretization = row['discretization']
+            if numpy.isnan(discretization):
+                discretization = self.converter.area_source_discretization
+            if discretization is None:
+                raise ValueError(
+                    'The source %r has no `discretization` parameter and the '
+                    'job.ini file has no `area_source_discretization` '
+                    'parameter either' % row['source_id'])
+            return source.AreaSource(
+                polygon=geo.Polygon([geo.Point(lon, lat) for lon, lat in
+                                     zip(lons.tolist(), lats.tolist())]),
+                area_discretization=discretization,
+                rupture_mesh_spacing=self.converter.rupture_mesh_spacing,
+                **kw)
+        elif kind == 'multiPointSource':
+            return source.MultiPointSource(
+                mesh=geo.Mesh(F32(lons), F32(lats)), **kw)
+        elif kind == 'simpleFaultSource':
+            return source.SimpleFaultSource(
+                fault_trace=geo.Line([geo.Point(lon, lat) for lon, lat in
+                                      zip(lons.tolist(), lats.tolist())]),
+                dip=row['dip'], rake=row['rake'],
+                rupture_mesh_spacing=self.converter.rupture_mesh_spacing,
+                **kw)
+        elif kind == 'complexFaultSource':
+            # the coordinates of the edges are contiguous
+            splits = numpy.flatnonzero(numpy.diff(self.edge[coo])) + 1
+            edges = [geo.Line([geo.Point(lon, lat, depth) for lon, lat, depth
+                               in zip(lo.tolist(), la.tolist(), de.tolist())])
+                     for lo, la, de in zip(numpy.split(lons, splits),
+                                           numpy.split(lats, splits),
+                                           numpy.split(self.depth[coo],
+                                                       splits))]
+            return source.ComplexFaultSource(
+                edges=edges, rake=row['rake'],
+                rupture_mesh_spacing=self.converter.complex_fault_mesh_spacing,
+                **kw)
+
+
+def read(hdf5fname, converter):
+    """
+    Read a source model in columnar HDF5 format, as generated by
+    :func:`write`.
+
+    :param hdf5fname:
+        path to a source model file in columnar HDF5 format
+    :param converter:
+        a :class:`openquake.hazardlib.sourceconverter.SourceConverter` instance
+    :returns:
+        a :class:`openquake.hazardlib.nrml.SourceModel` instance
+    """
+    converter.fname = hdf5fname
+    with hdf5.File(hdf5fname, 'r') as h5:
+        builder = _SourceBuilder(converter, h5)
+        array = h5['sources'][()]
+        strings = zip(*[h5[name][()] for name in ('source_id', 'name', 'trt')])
+        grp_nodes = [_from_xml(xml) for xml in h5['groups'][()]]
+        nodes = h5['nodes'][()]
+        attrs = dict(h5.attrs)
+    bounds = numpy.searchsorted(array['grp_id'], numpy.arange(len(grp_nodes)))
+    names = source_dt.names + ('source_id', 'name', 'trt')
+    mfds = builder.get_mfds(array)
+    groups = []
+    for grp_node, rows, start, stop in zip(
+            grp_nodes, numpy.split(array, bounds[1:]), bounds,
+            list(bounds[1:]) + [len(array)]):
+        recs = [rec + next(strings) for rec in rows.tolist()]
+        trt = grp_node.attrib.get('tectonicRegion')
+        if trt and trt in converter.discard_trts:
+            continue
+        sg = converter.new_sourceGroup(grp_node)
+        for rec, mfd_ in zip(recs, mfds[start:stop]):
+            row = dict(zip(names, rec))
+            if row['node'] >= 0:  # not columnar
+                src = converter.convert_node(_from_xml(nodes[row['node']]))
+            elif row['trt'] and row['trt'] in converter.discard_trts:
+                src = None
+            elif converter.source_id and (
+                    row['source_id'] not in converter.source_id):
+                src = None
+            else:
+                src = builder.build(row, mfd_)
+            if src is not None:  # not filtered out
+                converter.add_source(sg, grp_node, src)
+        converter.check_sourceGroup(sg, grp_node, len(rows))
+        if len(sg):
+            # a source group can be empty if the source_id filtering is on
+            groups.append(sg)
+    itime = attrs.get('investigation_time')
+    if itime is not None:
+        itime = valid.positivefloat(itime)
+    stime = attrs.get('start_time')
+    if stime is not None:
+        stime = valid.positivefloat(stime)
+    return nrml.SourceModel(sorted(groups), attrs.get('name'), itime, stime)
+
+
+def get_info(hdf5fname):
+    """
+    :param hdf5fname: path to a source model file in columnar HDF5 format
+    :returns: tectonic region types, source IDs and source types in the file
+    """
+    with hdf5.File(hdf5fname, 'r') as h5:
+        kinds = set(kind.decode('utf8') for kind in h5['sources']['kind'])
+        trts = set(_from_xml(xml)['tectonicRegion']
+                   for xml in h5['groups'][()])
+        trts.update(trt for trt in h5['trt'][()] if trt)
+        return trts, list(h5['source_id'][()]), kinds
@@ -256,6 +256,20 @@ class MeshGetMinDistanceTestCase(unittest.TestCase):
         self._test(mesh, target_mesh,
                    expected_distance_indices=[3, 3, 3, 0, 0, 3, 3, 3, 3])
 
+    def test_large_mesh(self):
+        # the KD-tree must give the same distances as the brute force
+        # approach computing the full distance matrix
+        rng = numpy.random.RandomState(42)
+        mesh = Mesh(rng.uniform(0, 1, 500), rng.uniform(0, 1, 500),
+                    rng.uniform(0, 20, 500))
+        sites = Mesh(rng.uniform(-2, 3, 1000), rng.uniform(-2, 3, 1000))
+        dists = numpy.sqrt(((mesh.xyz[:, None] - sites.xyz) ** 2).sum(-1))
+        aac(mesh.get_min_distance(sites), dists.min(axis=0))
+        idx = dists.argmin(axis=0)
+        closest = mesh.get_closest_points(sites)
+        numpy.testing.assert_equal(closest.lons, mesh.lons[idx])
+        numpy.testing.assert_equal(closest.lats, mesh.lats[idx])
+
 
 class MeshGetDistanceMatrixTestCase(unittest.TestCase):
     def test_zeroes(self):
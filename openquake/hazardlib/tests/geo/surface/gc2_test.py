@@ -22,9 +22,16 @@ fault surface testing modules
 """
 
 import os
+import pickle
 import unittest
+from unittest import mock
 import numpy
 
+from openquake.baselib import hdf5
+from openquake.baselib.general import gettemp
+from openquake.hazardlib.site import SiteCollection
+from openquake.hazardlib.calc.filters import SourceFilter
+from openquake.hazardlib.geo.surface import multi
 from openquake.hazardlib.geo.surface.multi import MultiSurface
 from openquake.hazardlib.geo import Mesh, Point, Line, PlanarSurface,\
     SimpleFaultSurface
@@ -321,3 +328,85 @@ class DiscordantSurfaceTestCase(unittest.TestCase):
         self.data = numpy.genfromtxt(DISCORDANT_FILE, delimiter=",")
         self.mesh = Mesh(self.data[:, 0], self.data[:, 1], self.data[:, 2])
         self.model = MultiSurface(FRANK2.surfaces)
+
+
+class GC2CacheTestCase(unittest.TestCase):
+    """
+    Tests the cache of the GC2 frameworks, both in memory and on hdf5
+    """
+    def setUp(self):
+        self.data = numpy.genfromtxt(DISCORDANT_FILE, delimiter=",")
+        self.mesh = Mesh(self.data[:, 0], self.data[:, 1], self.data[:, 2])
+
+    def test_cache(self):
+        multi.GC2_CACHE.clear()
+        rx = MultiSurface(FRANK2.surfaces).get_rx_distance(self.mesh)
+        [key] = multi.GC2_CACHE
+        fname = gettemp(suffix='.hdf5')
+        with hdf5.File(fname, 'w') as h5:
+            multi.save_gc2_cache(h5)
+        multi.GC2_CACHE.clear()
+        with hdf5.File(fname, 'r') as h5:
+            self.assertEqual(multi.load_gc2_cache(h5), 1)
+        # a new surface with the same geometry reuses the stored framework
+        surface = MultiSurface(FRANK2.surfaces)
+        self.assertEqual(surface.gc2_key, key)
+        numpy.testing.assert_array_almost_equal(
+            surface.get_rx_distance(self.mesh), rx)
+        self.assertIsNone(surface.gc2_config)  # the setup was not needed
+        numpy.testing.assert_array_almost_equal(
+            surface.get_ry0_distance(self.mesh), self.data[:, 6])
+
+        # the rx distance is recomputed if the mesh changes
+        numpy.testing.assert_array_almost_equal(
+            surface.get_rx_distance(self.mesh[:10]), rx[:10])
+
+    def test_shared_file(self):
+        multi.GC2_CACHE.clear()
+        multi.GC2_NEW.clear()
+        # a first task builds the framework and sends it to the master
+        rx = MultiSurface(FRANK2.surfaces).get_rx_distance(self.mesh)
+        frameworks = multi.pop_gc2_frameworks()
+        self.assertEqual(len(frameworks), 1)
+        self.assertEqual(multi.pop_gc2_frameworks(), {})
+
+        # the master, running in another process, stores the sitecol
+        # and the frameworks returned by the tasks
+        multi.GC2_CACHE.clear()
+        fname = gettemp(suffix='.hdf5')
+        sitecol = SiteCollection.from_points(self.mesh.lons, self.mesh.lats)
+        with hdf5.File(fname, 'w') as h5:
+            h5['sitecol'] = sitecol
+        for key, framework in frameworks.items():
+            multi.cache_gc2(key, framework)
+        with hdf5.File(multi.gc2_cache_fname(fname), 'w') as h5:
+            multi.save_gc2_cache(h5)
+
+        # a second task, in yet another process, reads the framework
+        # from the file instead of building it
+        multi.GC2_CACHE.clear()
+        srcfilter = pickle.loads(pickle.dumps(
+            SourceFilter(sitecol, {'default': 200}, fname)))
+        self.assertEqual(len(srcfilter.sitecol), len(self.mesh))
+        self.assertEqual(list(multi.GC2_CACHE), list(frameworks))
+        surface = MultiSurface(FRANK2.surfaces)
+        with mock.patch.object(MultiSurface, '_setup_gc2_framework',
+                               side_effect=RuntimeError('rebuilt')):
+            numpy.testing.assert_array_almost_equal(
+                surface.get_rx_distance(self.mesh), rx)
+        self.assertEqual(multi.pop_gc2_frameworks(), {})
+        os.remove(multi.gc2_cache_fname(fname))
+
+    def test_lru_eviction(self):
+        multi.GC2_CACHE.clear()
+        size = multi.GC2_CACHE_SIZE
+        multi.GC2_CACHE_SIZE = 3
+        try:
+            for key in 'abc':
+                multi.cache_gc2(key, {})
+            multi.GC2_CACHE.move_to_end('a')  # 'a' was used recently
+            multi.cache_gc2('d', {})
+            self.assertEqual(list(multi.GC2_CACHE), ['c', 'a', 'd'])
+        finally:
+            multi.GC2_CACHE_SIZE = size
+            multi.GC2_CACHE.clear()
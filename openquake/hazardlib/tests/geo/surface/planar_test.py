@@ -19,7 +19,8 @@ import numpy
 from openquake.hazardlib.geo import Point
 from openquake.hazardlib.geo.mesh import Mesh
 from openquake.hazardlib.geo import utils as geo_utils
-from openquake.hazardlib.geo.surface.planar import PlanarSurface
+from openquake.hazardlib.geo.surface.planar import (
+    PlanarSurface, PlanarSurfaceBatch)
 from openquake.hazardlib.tests.geo.surface import _planar_test_data as tdata
 
 aac = numpy.testing.assert_allclose
@@ -459,6 +460,45 @@ class PlanarSurfaceGetRy0DistanceTestCase(unittest.TestCase):
         numpy.testing.assert_allclose(dists, 5.55974422 * numpy.ones(2))
 
 
+class PlanarSurfaceBatchTestCase(unittest.TestCase):
+    def test_distances(self):
+        # the batch must give the same distances as the single surfaces
+        surfaces = []
+        for strike in (0, 45, 135, 300):
+            for dip in (30, 90):
+                surfaces.append(PlanarSurface.from_corner_points(
+                    *self._corners(strike, dip)))
+        batch = PlanarSurfaceBatch(surfaces)
+        self.assertEqual(len(batch), 8)
+        rng = numpy.random.RandomState(42)
+        sites = Mesh(rng.uniform(-1, 1, 200), rng.uniform(-1, 1, 200),
+                     rng.uniform(0, 2, 200))
+        for param, meth in [('rrup', 'get_min_distance'),
+                            ('rjb', 'get_joyner_boore_distance'),
+                            ('rx', 'get_rx_distance'),
+                            ('ry0', 'get_ry0_distance')]:
+            dists = batch.get_distances(sites, param)
+            self.assertEqual(dists.shape, (8, 200))
+            for surface, dist in zip(surfaces, dists):
+                aac(dist, getattr(surface, meth)(sites), atol=1E-6)
+
+        # splitting the sites in blocks gives the same distances
+        batch.MAX_PAIRS = 8 * 30  # blocks of 30 sites
+        for param in ('rrup', 'rjb'):
+            aac(batch.get_distances(sites, param),
+                PlanarSurfaceBatch(surfaces).get_distances(sites, param))
+
+    def _corners(self, strike, dip):
+        # corners of a 20 km x 10 km plane with the top edge at 2 km
+        top_left = Point(0, 0, 2)
+        top_right = top_left.point_at(20, 0, strike)
+        hdist = 10 * numpy.cos(numpy.radians(dip))
+        vdist = 10 * numpy.sin(numpy.radians(dip))
+        bottom_left = top_left.point_at(hdist, vdist, strike + 90)
+        bottom_right = top_right.point_at(hdist, vdist, strike + 90)
+        return top_left, top_right, bottom_right, bottom_left
+
+
 class PlanarSurfaceGetTopEdgeDepthTestCase(unittest.TestCase):
     def test(self):
         corners = [Point(-0.05, -0.05, 8), Point(0.05, 0.05, 8),
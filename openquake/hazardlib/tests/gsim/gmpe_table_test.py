@@ -17,6 +17,7 @@
 # along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
 
 import os
+import pickle
 import tempfile
 import unittest
 
@@ -457,6 +458,50 @@ class GSIMTableGoodTestCase(unittest.TestCase):
             gsim._return_tables(6.5, imt_module.SA(1.0), "IMLs"),
             expected_table_sa1)
 
+    def test_retreival_tables_many_magnitudes(self):
+        """
+        Tests the retreival of the IML tables for an array of magnitudes,
+        which must be the same as for the magnitudes taken one at the time
+        """
+        gsim = GMPETable(gmpe_table=self.TABLE_FILE)
+        mags = np.array([5.0, 5.3, 6.5, 7.0, 7.2])
+        for imt in [imt_module.PGA(), imt_module.SA(0.5)]:
+            table = gsim._return_tables(mags, imt, "IMLs")
+            self.assertEqual(table.shape, (3, 5))
+            for i, mag in enumerate(mags):
+                np.testing.assert_array_almost_equal(
+                    table[:, i], gsim._return_tables(mag, imt, "IMLs"))
+
+    def test_set_tables(self):
+        """
+        The tables interpolated in a single pass by set_tables are cached
+        and equal to the ones interpolated one magnitude at the time
+        """
+        gsim = GMPETable(gmpe_table=self.TABLE_FILE)
+        expected = GMPETable(gmpe_table=self.TABLE_FILE)
+        imts = [imt_module.PGA(), imt_module.SA(0.5)]
+        gsim.set_tables([6.5, 5.3, 6.5, 7.2, 4.0], imts)  # 4.0 out of range
+        for imt in imts:
+            for val_type in ["IMLs", "Total"]:
+                for mag in [5.3, 6.5, 7.2]:
+                    table = gsim._cache[str(imt), val_type, mag]
+                    np.testing.assert_array_almost_equal(
+                        table, expected._return_tables(mag, imt, val_type))
+                self.assertNotIn((str(imt), val_type, 4.0), gsim._cache)
+
+    def test_pickle(self):
+        """
+        The memory-mapped tables are read again after unpickling
+        """
+        gsim = GMPETable(gmpe_table=self.TABLE_FILE)
+        self.assertIsInstance(gsim.imls["SA"], np.memmap)
+        gsim2 = pickle.loads(pickle.dumps(gsim))
+        for iml in ["PGA", "PGV", "SA", "T"]:
+            np.testing.assert_array_equal(gsim2.imls[iml], gsim.imls[iml])
+        np.testing.assert_array_equal(
+            gsim2._return_tables(6.5, imt_module.SA(1.0), "IMLs"),
+            gsim._return_tables(6.5, imt_module.SA(1.0), "IMLs"))
+
     def test_retreival_tables_outside_mag_range(self):
         """
         Tests that an error is raised when inputting a magnitude value
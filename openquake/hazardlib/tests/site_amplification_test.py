@@ -160,3 +160,21 @@ class AmplifierTestCase(unittest.TestCase):
         aw = read_csv(fname, {'ampcode': ampcode_dt, None: numpy.float64})
         with self.assertRaises(ValueError):
             Amplifier(self.imtls, aw)
+
+    def test_amplify_array(self):
+        fname = gettemp(simple_ampl_func)
+        aw = read_csv(fname, {'ampcode': ampcode_dt, None: numpy.float64})
+        a = Amplifier(self.imtls, aw, self.soil_levels)
+        # 2 sites x 3 realizations x 4 IMTs x 11 levels
+        poes = numpy.array(self.hcurve).flatten() * numpy.ones((2, 3, 1))
+        poes[1] *= .5
+        ampl = a.amplify_array(b'A', poes)
+        self.assertEqual(ampl.shape, (2, 3, 28))
+        for m, imt in enumerate(self.imtls):
+            for s, scale in enumerate([1, .5]):
+                expected = a.amplify_one(
+                    b'A', imt, numpy.array(self.hcurve[m]).reshape(-1, 1)
+                    * scale).flatten()
+                for r in range(3):
+                    numpy.testing.assert_allclose(
+                        ampl[s, r, m * 7:(m + 1) * 7], expected)
@@ -260,6 +260,44 @@ class SourceConverterTestCase(unittest.TestCase):
         self.assertEqual(
             'There were repeated values %s in %s:%s', w.call_args[0][0])
 
+    def test_read_source_model(self):
+        # the streaming parser gives the same sources as the tree parser
+        for fname in ('mixed.xml', 'alternative-mfds.xml',
+                      'source_group_collection.xml',
+                      'nonparametric-source-mutex-ruptures.xml'):
+            testfile = os.path.join(testdir, fname)
+            sc = SourceConverter(area_source_discretization=10.)
+            sm1 = nrml.to_python(testfile, sc)
+            sm2 = nrml.read_source_model(testfile, sc)
+            self.assertEqual(sm1.name, sm2.name)
+            self.assertEqual(sm1.investigation_time, sm2.investigation_time)
+            self.assertEqual(len(sm1.src_groups), len(sm2.src_groups))
+            for sg1, sg2 in zip(sm1.src_groups, sm2.src_groups):
+                self.assertEqual(sg1.trt, sg2.trt)
+                self.assertEqual(sg1.src_interdep, sg2.src_interdep)
+                self.assertEqual(sg1.rup_interdep, sg2.rup_interdep)
+                self.assertEqual([src.source_id for src in sg1],
+                                 [src.source_id for src in sg2])
+                self.assertEqual([src.num_ruptures for src in sg1],
+                                 [src.num_ruptures for src in sg2])
+
+        # the errors contain the line number as in the tree parser
+        testfile = os.path.join(testdir, 'wrong-trt.xml')
+        with self.assertRaises(ValueError) as ctx:
+            nrml.read_source_model(testfile)
+        self.assertIn('node pointSource: Found Cratonic, expected '
+                      'Active Shallow Crust, line 67', str(ctx.exception))
+
+        # the streaming parser is used only if requested
+        testfile = os.path.join(testdir, 'mixed.xml')
+        with unittest.mock.patch.object(nrml, 'read_source_model') as read:
+            [sm] = nrml.read_source_models([testfile], SourceConverter())
+        self.assertEqual(read.call_count, 0)
+        sc = SourceConverter(streaming=True)
+        with unittest.mock.patch.object(nrml, 'read_source_model') as read:
+            [sm] = nrml.read_source_models([testfile], sc)
+        self.assertEqual(read.call_count, 1)
+
 
 class SourceGroupHDF5TestCase(unittest.TestCase):
     def test_serialization(self):
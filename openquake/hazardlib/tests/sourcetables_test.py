@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+#
+# Copyright (C) 2020 GEM Foundation
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake.  If not, see <http://www.gnu.org/licenses/>.
+import os
+import shutil
+import tempfile
+import unittest
+import numpy
+from openquake.baselib import hdf5
+from openquake.hazardlib import nrml, sourcetables
+from openquake.hazardlib.sourceconverter import SourceConverter
+from openquake.hazardlib.sourcewriter import obj_to_node
+
+testdir = os.path.join(os.path.dirname(__file__), 'source_model')
+
+
+class SourceTablesTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def convert(self, fname):
+        xmlfname = os.path.join(testdir, fname)
+        return sourcetables.write(
+            xmlfname, os.path.join(self.tmpdir, fname[:-3] + 'hdf5'))
+
+    def check_round_trip(self, fname, converter):
+        hdf5fname = self.convert(fname)
+        xmlfname = os.path.join(testdir, fname)
+        [sm1] = nrml.read_source_models([xmlfname], converter)
+        [sm2] = nrml.read_source_models([hdf5fname], converter)
+        self.assertEqual(sm1.name, sm2.name)
+        self.assertEqual(sm1.investigation_time, sm2.investigation_time)
+        self.assertEqual(len(sm1.src_groups), len(sm2.src_groups))
+        for sg1, sg2 in zip(sm1.src_groups, sm2.src_groups):
+            self.assertEqual(sg1.trt, sg2.trt)
+            self.assertEqual(sg1.name, sg2.name)
+            self.assertEqual(sg1.src_interdep, sg2.src_interdep)
+            self.assertEqual(sg1.rup_interdep, sg2.rup_interdep)
+            self.assertEqual(sg1.cluster, sg2.cluster)
+            self.assertEqual(len(sg1), len(sg2))
+            for src1, src2 in zip(sg1, sg2):
+                self.assertEqual(src1.__class__, src2.__class__)
+                self.assertEqual(sorted(vars(src1)), sorted(vars(src2)))
+                self.assertEqual(src1.tectonic_region_type,
+                                 src2.tectonic_region_type)
+                self.assertEqual(src1.num_ruptures, src2.num_ruptures)
+                self.assertEqual(nrml.to_string(obj_to_node(src1)),
+                                 nrml.to_string(obj_to_node(src2)))
+        return sm2
+
+    def test_point(self):
+        self.check_round_trip('point-source.xml', SourceConverter())
+        self.check_round_trip('source_group_collection.xml',
+                              SourceConverter(width_of_mfd_bin=.1))
+
+    def test_area(self):
+        self.check_round_trip('area-source.xml',
+                              SourceConverter(area_source_discretization=10.))
+
+    def test_multi_point(self):
+        self.check_round_trip('multi-point-source.xml',
+                              SourceConverter(width_of_mfd_bin=.1))
+
+    def test_simple_fault(self):
+        self.check_round_trip('simple-fault-source.xml', SourceConverter())
+        self.check_round_trip('tom_poisson_with_rate.xml', SourceConverter())
+
+    def test_complex_fault(self):
+        self.check_round_trip('complex-fault-source.xml',
+                              SourceConverter(complex_fault_mesh_spacing=10))
+
+    def test_characteristic(self):
+        self.check_round_trip('characteristic-source.xml', SourceConverter())
+        self.check_round_trip('source_group_cluster.xml', SourceConverter())
+
+    def test_nonparametric(self):
+        self.check_round_trip('nonparametric-source.xml',
+                              SourceConverter(investigation_time=1.))
+        self.check_round_trip('nonparametric-source-mutex-ruptures.xml',
+                              SourceConverter(investigation_time=1.))
+
+    def test_mixed(self):
+        # including simple faults with hypoList and slipList and
+        # arbitrary and YoungsCoppersmith MFDs
+        sc = SourceConverter(area_source_discretization=10.)
+        self.check_round_trip('mixed.xml', sc)
+        self.check_round_trip('alternative-mfds.xml', sc)
+
+    def test_filtering(self):
+        hdf5fname = self.convert('mixed.xml')
+        sc = SourceConverter(area_source_discretization=10.,
+                             source_id=['1', '4'],
+                             discard_trts='Subduction Interface')
+        [sm] = nrml.read_source_models([hdf5fname], sc)
+        self.assertEqual([src.source_id for sg in sm for src in sg], ['1'])
+
+    def test_info(self):
+        hdf5fname = self.convert('mixed.xml')
+        trts, ids, kinds = sourcetables.get_info(hdf5fname)
+        self.assertEqual(ids, ['2', '4', '1', '3', '5', '6', '7'])
+        self.assertEqual(sorted(kinds), [
+            'areaSource', 'characteristicFaultSource', 'complexFaultSource',
+            'pointSource', 'simpleFaultSource'])
+        self.assertEqual(len(trts), 4)
+
+    def test_wrong_trt(self):
+        hdf5fname = self.convert('wrong-trt.xml')
+        with self.assertRaises(ValueError) as ctx:
+            next(nrml.read_source_models([hdf5fname], SourceConverter()))
+        self.assertIn('Found Cratonic, expected Active Shallow Crust',
+                      str(ctx.exception))
+
+    def test_no_pickle(self):
+        # the non columnar nodes are stored as NRML strings, not pickles
+        hdf5fname = self.convert('mixed.xml')
+        with hdf5.File(hdf5fname, 'r') as h5:
+            xmls = list(h5['groups'][()]) + list(h5['nodes'][()])
+        self.assertEqual(len(xmls), 8)
+        for xml in xmls:
+            self.assertTrue(xml.startswith('<?xml'), xml)
+
+    def test_mfd_columns(self):
+        # two truncated GR MFDs, the first one without binWidth, and two
+        # incremental MFDs; each field is preceded by the number of values
+        flat = numpy.array([1, 5.0, 1, 7.0, 0, 1, 4.0, 1, 1.0,
+                            1, 5.5, 1, 7.5, 1, 0.1, 1, 3.0, 1, 0.9,
+                            1, 6.0, 1, 0.2, 1, 2, 2, .01, .02,
+                            1, 6.5, 1, 0.1, 1, 1, 1, .03])
+        cols = sourcetables._mfd_columns(
+            numpy.array([0, 9]), flat, 'truncGutenbergRichterMFD')
+        numpy.testing.assert_equal(cols['min_mag'], [5.0, 5.5])
+        numpy.testing.assert_equal(cols['bin_width'], [numpy.nan, 0.1])
+        numpy.testing.assert_equal(cols['b_val'], [1.0, 0.9])
+        cols = sourcetables._mfd_columns(
+            numpy.array([19, 28]), flat, 'incrementalMFD')
+        numpy.testing.assert_equal(cols['min_mag'], [6.0, 6.5])
+        numpy.testing.assert_equal(cols['occurRates'][0], [.01, .02])
+        numpy.testing.assert_equal(cols['occurRates'][1], [.03])
@@ -50,8 +50,16 @@ Module :mod:`openquake.hmtk.parsers.catalogue.base` defines an abstract base cla
 for :class:`CatalogueParser <BaseCatalogueDecluster>`.
 """
 import abc
+import numpy as np
+from openquake.baselib.parallel import Starmap
+from openquake.hazardlib.geo.utils import EARTH_RADIUS, spherical_to_cartesian
 from openquake.hmtk.registry import CatalogueFunctionRegistry
 
+# padding (in decimal years and km) used when preselecting candidate events;
+# the exact time and distance criteria are always applied afterwards
+TIME_PAD = 1E-7
+DIST_PAD = 1E-6
+
 
 class BaseCatalogueDecluster(object):
     """
@@ -74,4 +82,86 @@ class BaseCatalogueDecluster(object):
         return
 
 
+def get_xyz(lons, lats):
+    """
+    :param lons: longitudes of the events
+    :param lats: latitudes of the events
+    :returns: an array of shape (N, 3) with the cartesian coordinates of
+              the epicentres, suitable for building a KD-tree
+    """
+    return spherical_to_cartesian(lons, lats)
+
+
+def get_chord(distance, earth_rad=6371.227):
+    """
+    Convert a great circle distance, as computed by
+    :func:`openquake.hmtk.seismicity.utils.haversine`, into a (slightly
+    padded) radius for a KD-tree query on the points returned by
+    :func:`get_xyz`.
+
+    :param distance: distance in km
+    :param earth_rad: radius of the earth in km used by the haversine
+    :returns: chord length in km
+    """
+    angle = min(distance / earth_rad, np.pi)
+    return 2. * EARTH_RADIUS * np.sin(angle / 2.) * (1. + DIST_PAD) + DIST_PAD
+
+
+def split_blocks(cuts, neq, num_blocks):
+    """
+    Split the range [0, neq) into at most `num_blocks` contiguous blocks
+    of similar size, cutting only at the given positions.
+
+    :param cuts: sorted array of positions where a block can start
+    :param neq: total number of events
+    :param num_blocks: desired number of blocks
+    :returns: a list of pairs (start, stop)
+    """
+    blocks = []
+    start = 0
+    for b in range(1, num_blocks):
+        idx = np.searchsorted(cuts, max(start + 1, b * neq // num_blocks))
+        if idx == len(cuts):
+            break
+        blocks.append((start, cuts[idx]))
+        start = cuts[idx]
+    blocks.append((start, neq))
+    return blocks
+
+
+def decluster_blocks(task, allargs, neq):
+    """
+    Run the declustering `task` on independent blocks of events, in
+    parallel if there is more than one block, and merge the results.
+
+    The task must return a tuple (idx, vcl, flagvector, ranks) where
+    `idx` are the indices of the events of the block in the catalogue,
+    `vcl` and `flagvector` the block-local cluster numbers and flags and
+    `ranks` the magnitude ranks of the mainshocks of the clusters.
+    The clusters are renumbered globally in order of mainshock rank,
+    exactly as if the catalogue had been processed in a single pass.
+
+    :param task: a function declustering a block of events
+    :param allargs: a list of argument tuples, one per block
+    :param neq: total number of events in the catalogue
+    :returns: **vcl vector** and **flagvector**
+    """
+    if len(allargs) == 1:
+        results = [task(*allargs[0])]
+    else:
+        results = list(Starmap(task, allargs))
+    ranks = np.concatenate([res[3] for res in results] + [[]])
+    newid = np.zeros(len(ranks), int)
+    newid[np.argsort(ranks)] = np.arange(1, len(ranks) + 1)
+    vcl = np.zeros(neq, dtype=int)
+    flagvector = np.zeros(neq, dtype=int)
+    offset = 0
+    for idx, block_vcl, block_flag, block_ranks in results:
+        clustered = block_vcl > 0
+        vcl[idx[clustered]] = newid[offset + block_vcl[clustered] - 1]
+        flagvector[idx] = block_flag
+        offset += len(block_ranks)
+    return vcl, flagvector
+
+
 DECLUSTERER_METHODS = CatalogueFunctionRegistry()
@@ -46,18 +46,86 @@
 # liability for use of the software.
 
 import numpy as np
+from scipy.spatial import cKDTree
 
 from openquake.hmtk.seismicity.declusterer.base import (
-    BaseCatalogueDecluster, DECLUSTERER_METHODS)
+    BaseCatalogueDecluster, DECLUSTERER_METHODS, get_xyz, get_chord,
+    split_blocks, decluster_blocks)
 from openquake.hmtk.seismicity.utils import decimal_year, haversine
 from openquake.hmtk.seismicity.declusterer.distance_time_windows import (
     TIME_DISTANCE_WINDOW_FUNCTIONS)
 
 
+def _chain_length(delta_time, time_window):
+    # number of events before the first gap not smaller than the window
+    gaps = np.where(~(delta_time < time_window))[0]
+    return gaps[0] if len(gaps) else len(delta_time)
+
+
+def afteran_block(idx, year_dec, longitude, latitude, sw_space, rank,
+                  time_window):
+    """
+    Decluster a block of events in catalogue order, independent from the
+    other blocks. The events inside the distance window of each mainshock
+    are found with a KD-tree query on the epicentres.
+
+    :param idx: indices of the events in the catalogue
+    :param year_dec: decimal years of the events
+    :param longitude: longitudes of the events
+    :param latitude: latitudes of the events
+    :param sw_space: distance windows of the events
+    :param rank: magnitude ranks of the events (0 for the largest)
+    :param time_window: length of the moving time window in decimal years
+    :returns: idx, vcl, flagvector, ranks of the mainshocks
+    """
+    neq = len(year_dec)
+    vcl = np.zeros(neq, dtype=int)
+    flagvector = np.zeros(neq, dtype=int)
+    xyz = get_xyz(longitude, latitude)
+    kdt = cKDTree(xyz)
+    ranks = []
+    for imarker in np.argsort(rank):
+        # Earthquake not allocated to cluster - perform calculation
+        if vcl[imarker]:
+            continue
+        sel = np.array(sorted(kdt.query_ball_point(
+            xyz[imarker], get_chord(sw_space[imarker]))), int)
+        mdist = haversine(longitude[sel], latitude[sel],
+                          longitude[imarker], latitude[imarker])[:, 0]
+        sel = sel[mdist <= sw_space[imarker]]
+
+        # Select earthquakes inside distance window, later than
+        # mainshock and not already assigned to a cluster
+        vsel1 = sel[(vcl[sel] == 0) & (year_dec[sel] > year_dec[imarker])]
+        delta_time = np.diff(np.hstack([year_dec[imarker], year_dec[vsel1]]))
+        vsel1 = vsel1[:_chain_length(delta_time, time_window)]
+        if len(vsel1):
+            flagvector[vsel1] = 1
+            vcl[vsel1] = len(ranks) + 1
+
+        # Select earthquakes inside distance window, earlier than
+        # mainshock and not already assigned to a cluster, going backward
+        vsel2 = sel[(vcl[sel] == 0) & (year_dec[sel] < year_dec[imarker])]
+        vsel2 = vsel2[::-1]
+        times = year_dec[vsel2]
+        delta_time = np.hstack([year_dec[imarker], times[:-1]]) - times
+        vsel2 = vsel2[:_chain_length(delta_time, time_window)]
+        if len(vsel2):
+            flagvector[vsel2] = -1
+            vcl[vsel2] = len(ranks) + 1
+
+        if len(vsel1) or len(vsel2):
+            # Assign mainshock to cluster
+            ranks.append(rank[imarker])
+            vcl[imarker] = len(ranks)
+    return idx, vcl, flagvector, np.array(ranks, int)
+
+
 @DECLUSTERER_METHODS.add(
     "decluster",
     time_distance_window=TIME_DISTANCE_WINDOW_FUNCTIONS,
-    time_window=np.float)
+    time_window=np.float,
+    concurrent_tasks=1)
 class Afteran(BaseCatalogueDecluster):
     """
     This implements the Afteran algorithm as described in this paper:
@@ -69,6 +137,11 @@ class Afteran(BaseCatalogueDecluster):
         """
         catalogue_matrix, window_opt=TDW_GARDNERKNOPOFF, time_window=60.):
 
+        If the catalogue is sorted by time it is split into blocks
+        separated by gaps larger than the moving time window; if
+        'concurrent_tasks' is greater than 1 the blocks are declustered
+        in parallel.
+
         :param catalogue: a catalogue object
         :type catalogue: Instance of the openquake.hmtk.seismicity.catalogue.Catalogue()
                          class
@@ -77,6 +150,8 @@ class Afteran(BaseCatalogueDecluster):
         :type window_opt: string
         :keyword time_window: Length (in days) of moving time window
         :type time_window: positive float
+        :keyword concurrent_tasks: maximum number of parallel tasks
+        :type concurrent_tasks: positive int
         :returns: **vcl vector** indicating cluster number,
                   **flagvector** indicating which earthquakes belong to a
                   cluster
@@ -96,69 +171,27 @@ class Afteran(BaseCatalogueDecluster):
         sw_space, _ = (
             config['time_distance_window'].calc(catalogue.data['magnitude']))
 
-        # Pre-allocate cluster index vectors
-        vcl = np.zeros(neq, dtype=int)
-        flagvector = np.zeros(neq, dtype=int)
         # Rank magnitudes into descending order
         id0 = np.flipud(np.argsort(mag, kind='heapsort'))
+        rank = np.zeros(neq, dtype=int)
+        rank[id0] = np.arange(neq)
 
-        clust_index = 0
-        for imarker in id0:
-            # Earthquake not allocated to cluster - perform calculation
-            if vcl[imarker] == 0:
-                # Perform distance calculation
-                mdist = haversine(
-                    catalogue.data['longitude'],
-                    catalogue.data['latitude'],
-                    catalogue.data['longitude'][imarker],
-                    catalogue.data['latitude'][imarker]).flatten()
-
-                # Select earthquakes inside distance window, later than
-                # mainshock and not already assigned to a cluster
-                vsel1 = np.where(
-                    np.logical_and(vcl == 0,
-                                   np.logical_and(
-                                       mdist <= sw_space[imarker],
-                                       year_dec > year_dec[imarker])))[0]
-                has_aftershocks = False
-                if len(vsel1) > 0:
-                    # Earthquakes after event inside distance window
-                    temp_vsel1, has_aftershocks = self._find_aftershocks(
-                        vsel1,
-                        year_dec,
-                        time_window,
-                        imarker,
-                        neq)
-                    if has_aftershocks:
-                        flagvector[temp_vsel1] = 1
-                        vcl[temp_vsel1] = clust_index + 1
-
-                # Select earthquakes inside distance window, earlier than
-                # mainshock and not already assigned to a cluster
-                has_foreshocks = False
-                vsel2 = np.where(
-                    np.logical_and(
-                        vcl == 0,
-                        np.logical_and(mdist <= sw_space[imarker],
-                                       year_dec < year_dec[imarker])))[0]
-                if len(vsel2) > 0:
-                    # Earthquakes before event inside distance window
-                    temp_vsel2, has_foreshocks = self._find_foreshocks(
-                        vsel2,
-                        year_dec,
-                        time_window,
-                        imarker,
-                        neq)
-                    if has_foreshocks:
-                        flagvector[temp_vsel2] = -1
-                        vcl[temp_vsel2] = clust_index + 1
-
-                if has_aftershocks or has_foreshocks:
-                    # Assign mainshock to cluster
-                    vcl[imarker] = clust_index + 1
-                    clust_index += 1
-
-        return vcl, flagvector
+        # No sequence of aftershocks or foreshocks can cross a gap
+        # larger than the time window in a catalogue sorted by time
+        gaps = np.diff(year_dec)
+        if (gaps >= 0).all():
+            cuts = np.where(gaps >= time_window)[0] + 1
+        else:
+            cuts = np.array([], int)
+        allargs = []
+        for start, stop in split_blocks(
+                cuts, neq, config['concurrent_tasks']):
+            idx = np.arange(start, stop)
+            allargs.append((idx, year_dec[idx],
+                            catalogue.data['longitude'][idx],
+                            catalogue.data['latitude'][idx],
+                            sw_space[idx], rank[idx], time_window))
+        return decluster_blocks(afteran_block, allargs, neq)
 
     def _find_aftershocks(self, vsel, year_dec, time_window, imarker, neq):
         '''
@@ -51,18 +51,83 @@ defines the Gardner and Knopoff declustering algorithm
 """
 
 import numpy as np
+from scipy.spatial import cKDTree
 
 from openquake.hmtk.seismicity.declusterer.base import (
-    BaseCatalogueDecluster, DECLUSTERER_METHODS)
+    BaseCatalogueDecluster, DECLUSTERER_METHODS, TIME_PAD, get_xyz,
+    get_chord, split_blocks, decluster_blocks)
 from openquake.hmtk.seismicity.utils import decimal_year, haversine
 from openquake.hmtk.seismicity.declusterer.distance_time_windows import (
     TIME_DISTANCE_WINDOW_FUNCTIONS)
 
+# use the KD-tree when the time window contains more events than this
+KDTREE_THRESHOLD = 1000
+
+
+def gardner_knopoff_block(idx, year_dec, longitude, latitude, sw_space,
+                          sw_time, rank, fs_time_prop, skip_rank):
+    """
+    Decluster a block of events sorted by time, independent from the
+    other blocks. The events are processed in order of magnitude rank; for
+    each event the candidates are found with a sliding time window and,
+    if the window is crowded, with a KD-tree query on the epicentres.
+
+    :param idx: indices of the events in the catalogue
+    :param year_dec: decimal years of the events, in increasing order
+    :param longitude: longitudes of the events
+    :param latitude: latitudes of the events
+    :param sw_space: distance windows of the events
+    :param sw_time: time windows of the events
+    :param rank: magnitude ranks of the events (0 for the largest)
+    :param fs_time_prop: fraction of the time window used for foreshocks
+    :param skip_rank: rank of the event which cannot start a cluster
+    :returns: idx, vcl, flagvector, ranks of the mainshocks
+    """
+    neq = len(year_dec)
+    vcl = np.zeros(neq, dtype=int)
+    flagvector = np.zeros(neq, dtype=int)
+    xyz = get_xyz(longitude, latitude)
+    kdt = cKDTree(xyz)
+    ranks = []
+    for i in np.argsort(rank):
+        if vcl[i] or rank[i] == skip_rank:
+            continue
+        lo = np.searchsorted(
+            year_dec, year_dec[i] - sw_time[i] * fs_time_prop - TIME_PAD)
+        hi = np.searchsorted(
+            year_dec, year_dec[i] + sw_time[i] + TIME_PAD, 'right')
+        if hi - lo > KDTREE_THRESHOLD:
+            sel = np.array(kdt.query_ball_point(
+                xyz[i], get_chord(sw_space[i])), int)
+            sel = sel[(sel >= lo) & (sel < hi)]
+        else:
+            sel = np.arange(lo, hi)
+        # Find events inside both fore- and aftershock time windows
+        sel = sel[vcl[sel] == 0]
+        dt = year_dec[sel] - year_dec[i]
+        sel = sel[(dt >= (-sw_time[i] * fs_time_prop)) & (dt <= sw_time[i])]
+        # Of those events inside time window,
+        # find those inside distance window
+        vsel = sel[haversine(longitude[sel], latitude[sel],
+                             longitude[i], latitude[i])[:, 0] <= sw_space[i]]
+        others = vsel[vsel != i]
+        if len(others):
+            # Allocate a cluster number
+            ranks.append(rank[i])
+            vcl[vsel] = len(ranks)
+            flagvector[vsel] = 1
+            # For those events in the cluster before the main event,
+            # flagvector is equal to -1
+            flagvector[others[year_dec[others] - year_dec[i] < 0.0]] = -1
+            flagvector[i] = 0
+    return idx, vcl, flagvector, np.array(ranks, int)
+
 
 @DECLUSTERER_METHODS.add(
     "decluster",
     time_distance_window=TIME_DISTANCE_WINDOW_FUNCTIONS,
-    fs_time_prop=np.float)
+    fs_time_prop=np.float,
+    concurrent_tasks=1)
 class GardnerKnopoffType1(BaseCatalogueDecluster):
     """
     This class implements the Gardner Knopoff algorithm as described in
@@ -80,6 +145,10 @@ class GardnerKnopoffType1(BaseCatalogueDecluster):
         - A value in the interval [0,1] expressing the fraction of the
         time window used for aftershocks (key is 'fs_time_prop')
 
+        The catalogue is split into time blocks such that no time window
+        crosses the boundary between two blocks; if 'concurrent_tasks' is
+        greater than 1 the blocks are declustered in parallel.
+
         :param catalogue:
             Catalogue of earthquakes
         :type catalogue: Dictionary
@@ -99,58 +168,31 @@ class GardnerKnopoffType1(BaseCatalogueDecluster):
             catalogue.data['year'], catalogue.data['month'],
             catalogue.data['day'])
         # Get space and time windows corresponding to each event
-        # Initial Position Identifier
         sw_space, sw_time = (
            config['time_distance_window'].calc(
             catalogue.data['magnitude'], config.get('time_cutoff')))
-        eqid = np.arange(0, neq, 1)
-        # Pre-allocate cluster index vectors
-        vcl = np.zeros(neq, dtype=int)
-        # Sort magnitudes into descending order
+        fs_time_prop = config['fs_time_prop']
+        # Rank magnitudes into descending order
         id0 = np.flipud(np.argsort(catalogue.data['magnitude'],
                                    kind='heapsort'))
-        longitude = catalogue.data['longitude'][id0]
-        latitude = catalogue.data['latitude'][id0]
-        sw_space = sw_space[id0]
-        sw_time = sw_time[id0]
-        year_dec = year_dec[id0]
-        eqid = eqid[id0]
-        flagvector = np.zeros(neq, dtype=int)
-        # Begin cluster identification
-        clust_index = 0
-        for i in range(0, neq - 1):
-            if vcl[i] == 0:
-                # Find Events inside both fore- and aftershock time windows
-                dt = year_dec - year_dec[i]
-                vsel = np.logical_and(
-                    vcl == 0,
-                    np.logical_and(
-                        dt >= (-sw_time[i] * config['fs_time_prop']),
-                        dt <= sw_time[i]))
-                # Of those events inside time window,
-                # find those inside distance window
-                vsel1 = haversine(longitude[vsel],
-                                  latitude[vsel],
-                                  longitude[i],
-                                  latitude[i]) <= sw_space[i]
-                vsel[vsel] = vsel1[:, 0]
-                temp_vsel = np.copy(vsel)
-                temp_vsel[i] = False
-                if any(temp_vsel):
-                    # Allocate a cluster number
-                    vcl[vsel] = clust_index + 1
-                    flagvector[vsel] = 1
-                    # For those events in the cluster before the main event,
-                    # flagvector is equal to -1
-                    temp_vsel[dt >= 0.0] = False
-                    flagvector[temp_vsel] = -1
-                    flagvector[i] = 0
-                    clust_index += 1
-
-        # Re-sort the catalog_matrix into original order
-        id1 = np.argsort(eqid, kind='heapsort')
-        eqid = eqid[id1]
-        vcl = vcl[id1]
-        flagvector = flagvector[id1]
-
-        return vcl, flagvector
+        rank = np.zeros(neq, dtype=int)
+        rank[id0] = np.arange(neq)
+        # Sort the events by time and find the positions where no time
+        # window crosses the boundary, i.e. where the catalogue can be split
+        order = np.argsort(year_dec, kind='mergesort')
+        year_dec = year_dec[order]
+        right = np.maximum.accumulate(year_dec + sw_time[order])
+        left = np.minimum.accumulate(
+            (year_dec - sw_time[order] * fs_time_prop)[::-1])[::-1]
+        cuts = np.where((right[:-1] + TIME_PAD < year_dec[1:]) &
+                        (left[1:] - TIME_PAD > year_dec[:-1]))[0] + 1
+        allargs = []
+        for start, stop in split_blocks(
+                cuts, neq, config['concurrent_tasks']):
+            idx = order[start:stop]
+            allargs.append((idx, year_dec[start:stop],
+                            catalogue.data['longitude'][idx],
+                            catalogue.data['latitude'][idx],
+                            sw_space[idx], sw_time[idx], rank[idx],
+                            fs_time_prop, neq - 1))
+        return decluster_blocks(gardner_knopoff_block, allargs, neq)
@@ -260,6 +260,8 @@ class SmoothedSeismicity(object):
             * 'BandWidth' - Bandwidth (km) of the Smoothing Kernel (Float)
             * 'increment' - Output incremental (True) or cumulative a-value
             (False)
+            * 'Kernel_Method' - 'direct' (default) or 'kdtree', the faster
+            algorithm to apply the kernel on large grids (optional)
 
         :param np.ndarray completeness_table:
             Completeness of the catalogue assuming evenly spaced magnitudes
@@ -529,7 +531,8 @@ SMOOTHED_SEISMICITY_METHODS = CatalogueFunctionRegistry()
     grid_limits=Grid,
     Length_Limit=np.float,
     BandWidth=np.float,
-    increment=bool)
+    increment=bool,
+    Kernel_Method='direct')
 class IsotropicGaussianMethod(object):
     def run(self, catalogue, config, completeness=None):
         ss = SmoothedSeismicity(config['grid_limits'],
@@ -128,3 +128,19 @@ class AfteranTestCase(unittest.TestCase):
         model_result = self.dec._find_foreshocks(vsel, year_dec, 0.09, 2, 6)
         self.assertTrue(np.all(expected_result[0] == model_result[0]))
         self.assertFalse(model_result[1])
+
+    def test_dec_afteran_blocks(self):
+        # a copy of the catalogue shifted by a century is an independent
+        # time block, the result must not depend on the number of tasks
+        for key in self.cat.data:
+            if len(self.cat.data[key]):
+                self.cat.data[key] = np.tile(self.cat.data[key], 2)
+        self.cat.data['year'][6:] += 100
+        config = {'time_distance_window': GardnerKnopoffWindow(),
+                  'time_window': 60.}
+        vcl, flagvector = self.dec.decluster(self.cat, dict(config))
+        config['concurrent_tasks'] = 2
+        vcl2, flagvector2 = self.dec.decluster(self.cat, dict(config))
+        np.testing.assert_array_equal(vcl, vcl2)
+        np.testing.assert_array_equal(flagvector, flagvector2)
+        np.testing.assert_array_equal(flagvector, self.cat.data['flag'])
@@ -102,3 +102,20 @@ class GardnerKnopoffType1TestCase(unittest.TestCase):
         catalog_flag[4] = 0 # event becomes mainshock when time_cutoff = 100
         print('flagvector:', catalog_flag)
         np.testing.assert_allclose(flagvector,self.cat.data['flag'])
+
+    def test_dec_gardner_knopoff_blocks(self):
+        # a copy of the catalogue shifted by a century is an independent
+        # time block, the result must not depend on the number of tasks
+        for key in self.cat.data:
+            if len(self.cat.data[key]):
+                self.cat.data[key] = np.tile(self.cat.data[key], 2)
+        self.cat.data['year'][6:] += 100
+        config = {'time_distance_window': GardnerKnopoffWindow(),
+                  'fs_time_prop': 1.0}
+        dec = GardnerKnopoffType1()
+        vcl, flagvector = dec.decluster(self.cat, dict(config))
+        config['concurrent_tasks'] = 2
+        vcl2, flagvector2 = dec.decluster(self.cat, dict(config))
+        np.testing.assert_array_equal(vcl, vcl2)
+        np.testing.assert_array_equal(flagvector, flagvector2)
+        np.testing.assert_array_equal(flagvector, self.cat.data['flag'])
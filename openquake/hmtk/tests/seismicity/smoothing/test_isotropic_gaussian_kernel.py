@@ -126,3 +126,23 @@ class TestIsotropicGaussian(unittest.TestCase):
         # Assert that sum of the smoothing is equal to the sum of the
         # data values to 2 dp
         self.assertAlmostEqual(sum_data, sum_smooth, 2)
+
+    def test_kdtree_kernel(self):
+        # the KD-tree kernel gives the same results as the direct one
+        self.data[[5, 30, 65], 3] = 1.
+        self.data[30, 2] = 20.
+        config = {'Length_Limit': 3.0, 'BandWidth': 30.0}
+        for is_3d in (False, True):
+            expected = self.model.smooth_data(self.data, config, is_3d)
+            config['Kernel_Method'] = 'kdtree'
+            smoothed = self.model.smooth_data(self.data, config, is_3d)
+            del config['Kernel_Method']
+            np.testing.assert_allclose(smoothed[0], expected[0], rtol=1E-10)
+            self.assertAlmostEqual(smoothed[1], expected[1])
+            self.assertAlmostEqual(smoothed[2], expected[2])
+
+    def test_unknown_kernel_method(self):
+        config = {'Length_Limit': 3.0, 'BandWidth': 30.0,
+                  'Kernel_Method': 'fft'}
+        with self.assertRaises(ValueError):
+            self.model.smooth_data(self.data, config)
@@ -393,3 +393,13 @@ class TestSmoothedSeismicity(unittest.TestCase):
         self.assertTrue(fabs(np.sum(output_data[:, -1]) -
                              np.sum(output_data[:, -2])) < 1.0)
         self.assertTrue(fabs(np.sum(output_data[:, -1]) - 390.) < 1.0)
+
+        # the KD-tree kernel gives the same results
+        config['Kernel_Method'] = 'kdtree'
+        self.model = SmoothedSeismicity(self.grid_limits, bvalue=0.8)
+        kdtree_data = self.model.run_analysis(
+            self.catalogue,
+            config,
+            completeness_table=comp_table,
+            smoothing_kernel=IsotropicGaussian())
+        np.testing.assert_allclose(kdtree_data, output_data, rtol=1E-10)
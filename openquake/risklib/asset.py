@@ -21,9 +21,10 @@ import logging
 import csv
 import os
 import numpy
-from shapely import wkt, geometry
+import pandas
+from shapely import wkt, vectorized
 
-from openquake.baselib import hdf5, general
+from openquake.baselib import hdf5, general, parallel
 from openquake.baselib.node import Node, context
 from openquake.baselib.python3compat import encode, decode
 from openquake.hazardlib import valid, nrml, geo, InvalidFile
@@ -135,68 +136,6 @@ costcalculator = CostCalculator(
     units=dict(structural='EUR'))
 
 
-class Asset(object):
-    """
-    Describe an Asset as a collection of several values. A value can
-    represent a replacement cost (e.g. structural cost, business
-    interruption cost) or another quantity that can be considered for
-    a risk analysis (e.g. occupants).
-    """
-    def __init__(self,
-                 ordinal,
-                 tagidxs,
-                 number,
-                 location,
-                 values,
-                 area=1,
-                 retrofitted=None,
-                 calc=costcalculator):
-        """
-        :param ordinal:
-            an integer identifier for the asset, used to order them
-        :param tagidxs:
-            a list of indices for the taxonomy and other tags
-        :param number:
-            number of apartments of number of people in the given asset
-        :param location:
-            geographic location of the asset
-        :param dict values:
-            asset values keyed by loss types
-        :param retrofitted:
-            asset retrofitted value
-        :param calc:
-            cost calculator instance
-        :param ordinal:
-            asset collection ordinal
-        """
-        self.ordinal = ordinal
-        self.tagidxs = tagidxs
-        self.number = number
-        self.location = location
-        self.values = values
-        self.area = area
-        self._retrofitted = retrofitted
-        self.calc = calc
-
-    def value(self, loss_type, time_event=None):
-        """
-        :returns: the total asset value for `loss_type`
-        """
-        if loss_type == 'occupants':
-            return self.values['occupants_' + str(time_event)]
-        return self.calc(loss_type, self.values, self.area, self.number)
-
-    def retrofitted(self):
-        """
-        :returns: the asset retrofitted value
-        """
-        return self.calc('structural', {'structural': self._retrofitted},
-                         self.area, self.number)
-
-    def __repr__(self):
-        return '<Asset #%s>' % self.ordinal
-
-
 U8 = numpy.uint8
 U32 = numpy.uint32
 F32 = numpy.float32
@@ -248,31 +187,27 @@ class TagCollection(object):
                 raise InvalidFile('contains more then %d tags' % TWO32)
             return idx
 
-    def add_tags(self, dic, prefix):
+    def add_array(self, tagname, tagvalues):
         """
-        :param dic: a dictionary tagname -> tagvalue
-        :returns: a list of tag indices, one per tagname
+        :param tagname: the name of the tag
+        :param tagvalues: an array of tag values, possibly with duplicates
+        :returns: an array of tag indices, one per tag value
         """
-        # fill missing tagvalues with "?", raise an error for unknown tagnames
-        idxs = []
-        for tagname in self.tagnames:
-            if tagname in ('exposure', 'country'):
-                idxs.append(self.add(tagname, prefix))
-                continue
-            try:
-                tagvalue = dic.pop(tagname)
-            except KeyError:
-                tagvalue = '?'
-            else:
-                if tagvalue in '?*':
-                    raise ValueError(
-                        'Invalid tagvalue="%s"' % tagvalue)
-            idxs.append(self.add(tagname, tagvalue))
-        if dic:
-            raise ValueError(
-                'Unknown tagname %s or <tagNames> not '
-                'specified in the exposure' % ', '.join(dic))
-        return idxs
+        # factorize returns the unique values in order of appearance,
+        # so the indices are the same as calling .add on each value
+        codes, uniques = pandas.factorize(tagvalues)
+        dic = getattr(self, tagname + '_idx')
+        isnew = ~pandas.Index(uniques).isin(list(dic))
+        new = uniques[isnew]
+        start, stop = len(dic), len(dic) + len(new)
+        if stop > TWO32:
+            raise InvalidFile('contains more then %d tags' % TWO32)
+        idxs = numpy.zeros(len(uniques), U32)
+        idxs[isnew] = numpy.arange(start, stop)
+        idxs[~isnew] = [dic[tag] for tag in uniques[~isnew]]
+        dic.update(zip(new, range(start, stop)))
+        getattr(self, tagname).extend(new)
+        return idxs[codes]
 
     def extend(self, other):
         for tagname in other.tagnames:
@@ -325,6 +260,16 @@ class TagCollection(object):
         # sanity check to protect against /home/michele/oqdata/calc_10826.hdf5
         numpy.testing.assert_equal(sorted(sizes), sorted(attrs['tagsizes']))
 
+    def __getattr__(self, name):
+        # the dictionaries <tagname>_idx are not stored, they are
+        # rebuilt lazily after reading a TagCollection from HDF5
+        tagnames = vars(self).get('tagnames', ())
+        if name.endswith('_idx') and name[:-4] in tagnames:
+            dic = self.get_tagidx(name[:-4])
+            setattr(self, name, dic)
+            return dic
+        raise AttributeError(name)
+
     def __iter__(self):
         tags = []
         for tagname in self.tagnames:
@@ -342,7 +287,8 @@ class AssetCollection(object):
         self.time_event = time_event
         self.tot_sites = len(assets_by_site)
         self.array, self.occupancy_periods = build_asset_array(
-            assets_by_site, exposure.tagcol.tagnames, time_event)
+            assets_by_site, exposure.tagcol.tagnames, time_event,
+            exposure.cost_calculator)
         exp_periods = exposure.occupancy_periods
         if self.occupancy_periods and not exp_periods:
             logging.warning('Missing <occupancyPeriods>%s</occupancyPeriods> '
@@ -526,21 +472,29 @@ class AssetCollection(object):
         return '<%s with %d asset(s)>' % (self.__class__.__name__, len(self))
 
 
-def build_asset_array(assets_by_site, tagnames=(), time_event=None):
+def build_asset_array(assets_by_site, tagnames=(), time_event=None,
+                      calc=costcalculator):
     """
-    :param assets_by_site: a list of lists of assets
+    :param assets_by_site: a list of arrays of exposure assets
     :param tagnames: a list of tag names
+    :param time_event: not used, kept for backward compatibility
+    :param calc: a :class:`CostCalculator` instance
     :returns: an array `assetcol`
     """
-    for assets in assets_by_site:
-        if len(assets):
-            first_asset = assets[0]
-            break
-    else:  # no break
+    sids = [sid for sid, assets in enumerate(assets_by_site) if len(assets)]
+    if not sids:
         raise ValueError('There are no assets!')
+    assets = numpy.concatenate([assets_by_site[sid] for sid in sids])
+    first_asset = assets[0]
     loss_types = []
     occupancy_periods = []
-    for name in sorted(first_asset.values):
+    values = {}
+    for name in assets.dtype.names:
+        if name.startswith('value-'):
+            values[name[6:]] = assets[name]
+        elif name.startswith('occupants_'):
+            values[name] = assets[name]
+    for name in sorted(values):
         if name.startswith('occupants_'):
             period = name.split('_', 1)[1]
             if period != 'None':
@@ -553,46 +507,33 @@ def build_asset_array(assets_by_site, tagnames=(), time_event=None):
     # loss_types can be ['value-business_interruption', 'value-contents',
     # 'value-nonstructural', 'occupants_None', 'occupants_day',
     # 'occupants_night', 'occupants_transit']
-    retro = ['retrofitted'] if first_asset._retrofitted else []
+    has_retro = ('retrofitted' in assets.dtype.names and
+                 first_asset['retrofitted'])
+    retro = ['retrofitted'] if has_retro else []
     float_fields = loss_types + retro
     int_fields = [(str(name), U32) for name in tagnames]
-    tagi = {str(name): i for i, name in enumerate(tagnames)}
     asset_dt = numpy.dtype(
         [('ordinal', U32), ('lon', F32), ('lat', F32), ('site_id', U32),
          ('number', F32), ('area', F32)] + [
              (str(name), float) for name in float_fields] + int_fields)
-    num_assets = sum(len(assets) for assets in assets_by_site)
-    assetcol = numpy.zeros(num_assets, asset_dt)
-    asset_ordinal = 0
-    fields = set(asset_dt.fields)
-    for sid, assets_ in enumerate(assets_by_site):
-        for asset in assets_:
-            asset.ordinal = asset_ordinal
-            record = assetcol[asset_ordinal]
-            asset_ordinal += 1
-            for field in fields:
-                if field == 'ordinal':
-                    value = asset.ordinal
-                elif field == 'number':
-                    value = asset.number
-                elif field == 'area':
-                    value = asset.area
-                elif field == 'site_id':
-                    value = sid
-                elif field == 'lon':
-                    value = asset.location[0]
-                elif field == 'lat':
-                    value = asset.location[1]
-                elif field.startswith('occupants_'):
-                    value = asset.values[field]
-                elif field == 'retrofitted':
-                    value = asset.retrofitted()
-                elif field in tagnames:
-                    value = asset.tagidxs[tagi[field]]
-                else:
-                    name, lt = field.split('-')
-                    value = asset.value(lt, time_event)
-                record[field] = value
+    assetcol = numpy.zeros(len(assets), asset_dt)
+    assetcol['ordinal'] = numpy.arange(len(assets))
+    assetcol['site_id'] = numpy.repeat(
+        sids, [len(assets_by_site[sid]) for sid in sids])
+    for field in ('lon', 'lat', 'number', 'area'):
+        assetcol[field] = assets[field]
+    for name in tagnames:
+        assetcol[name] = assets[name]
+    for field in float_fields:
+        if field.startswith('occupants_'):
+            assetcol[field] = values[field]
+        elif field == 'retrofitted':
+            assetcol[field] = calc('structural',
+                                   {'structural': assets['retrofitted']},
+                                   assets['area'], assets['number'])
+        else:
+            assetcol[field] = calc(field[6:], values,
+                                   assets['area'], assets['number'])
     return assetcol, ' '.join(occupancy_periods)
 
 
@@ -747,6 +688,38 @@ def assets2array(asset_nodes, fields, retrofitted, ignore_missing_costs):
     return array
 
 
+def read_csv_assets(fname, conv, rename, chunksize=1000000):
+    """
+    Read a CSV file of assets in chunks with the C parser of pandas.
+
+    :param fname: path to the CSV file
+    :param conv: a dictionary fieldname -> float for the numeric fields
+    :param rename: a dictionary fieldname -> new fieldname
+    :param chunksize: number of rows to parse at once
+    :returns: a dictionary fname -> structured array with float and
+              object fields
+    """
+    # NB: the header is read separately to strip the BOM, if any, since
+    # passing encoding='utf-8-sig' to pandas is extremely slow
+    header = pandas.read_csv(fname, nrows=0, encoding='utf-8-sig').columns
+    dtype = {name: conv.get(name, str) for name in header}
+    dt = [(rename.get(name, name), conv.get(name, object)) for name in header]
+    arrays = []
+    try:
+        for df in pandas.read_csv(fname, names=header, header=0, dtype=dtype,
+                                  na_filter=False, chunksize=chunksize):
+            array = numpy.zeros(len(df), dt)
+            for name, (newname, _) in zip(header, dt):
+                array[newname] = df[name].values
+            arrays.append(array)
+    except ValueError as exc:
+        raise InvalidFile('%s: %s' % (fname, exc))
+    array = numpy.concatenate(arrays) if arrays else numpy.zeros(0, dt)
+    array['lon'] = numpy.round(array['lon'], 5)
+    array['lat'] = numpy.round(array['lat'], 5)
+    return {fname: array}
+
+
 class Exposure(object):
     """
     A class to read the exposure from XML/CSV files
@@ -760,10 +733,9 @@ class Exposure(object):
     def check(fname):
         exp = Exposure.read([fname])
         err = []
-        for asset, aref in zip(exp.assets, exp.asset_refs):
-            if asset.number > 65535:
-                err.append('Asset %s has number %s > 65535' %
-                           (aref, asset.number))
+        for asset in exp.assets[exp.assets['number'] > 65535]:
+            err.append('Asset %s has number %s > 65535' %
+                       (exp.asset_refs[asset['ordinal']], asset['number']))
         return '\n'.join(err)
 
     @staticmethod
@@ -772,9 +744,7 @@ class Exposure(object):
              tagcol=None, by_country=False):
         """
         Call `Exposure.read(fname)` to get an :class:`Exposure` instance
-        keeping all the assets in memory or
-        `Exposure.read(fname, asset_nodes=True)` to get an iterator over
-        Node objects (one Node for each asset).
+        keeping all the assets in memory as a structured array.
         """
         if by_country:  # E??_ -> countrycode
             prefix2cc = countries.from_exposures(
@@ -803,8 +773,9 @@ class Exposure(object):
                 assert exposure.occupancy_periods == exp.occupancy_periods
                 assert exposure.retrofitted == exp.retrofitted
                 assert exposure.area == exp.area
-                exp.assets.extend(exposure.assets)
-                exp.asset_refs.extend(exposure.asset_refs)
+                exp.assets = numpy.concatenate([exp.assets, exposure.assets])
+                exp.asset_refs = numpy.concatenate(
+                    [exp.asset_refs, exposure.asset_refs])
                 exp.tagcol.extend(exposure.tagcol)
         exp.exposures = [os.path.splitext(os.path.basename(f))[0]
                          for f in fnames]
@@ -843,8 +814,10 @@ class Exposure(object):
         if len(exposure.assets) == 0:
             raise RuntimeError('Could not find any asset within the region!')
         # sanity checks
-        values = any(len(ass.values) + ass.number for ass in exposure.assets)
-        assert values, 'Could not find any value??'
+        values = [name for name in exposure.assets.dtype.names
+                  if name.startswith(('value-', 'occupants_'))]
+        assert values or exposure.assets['number'].any(), (
+            'Could not find any value??')
         exposure.param = param
         return exposure
 
@@ -881,7 +854,7 @@ class Exposure(object):
 
     def _read_csv(self):
         """
-        :yields: asset nodes
+        :returns: a structured array with the assets in the CSV files
         """
         expected_header = set(self._csv_header('', ''))
         for fname in self.datafiles:
@@ -899,7 +872,7 @@ class Exposure(object):
                     raise InvalidFile(msg % (fname, sorted(expected_header),
                                              sorted(header), missing))
         conv = {'lon': float, 'lat': float, 'number': float, 'area': float,
-                'retrofitted': float, None: object}
+                'retrofitted': float}
         rename = {}
         for field in self.cost_types['name']:
             conv[field] = float
@@ -907,94 +880,154 @@ class Exposure(object):
         for field in self.occupancy_periods.split():
             conv[field] = float
             rename[field] = 'occupants_' + field
-        for fname in self.datafiles:
-            array = hdf5.read_csv(fname, conv, rename).array
-            array['lon'] = numpy.round(array['lon'], 5)
-            array['lat'] = numpy.round(array['lat'], 5)
-            yield from array
+        allargs = [(fname, conv, rename) for fname in self.datafiles]
+        if len(allargs) == 1:
+            dic = read_csv_assets(*allargs[0])
+        else:
+            # NB: the CSV files are often NOT in the shared directory
+            # so the processpool must be used
+            dist = ('no' if os.environ.get('OQ_DISTRIBUTE') == 'no'
+                    else 'processpool')
+            dic = parallel.Starmap(
+                read_csv_assets, allargs, distribute=dist).reduce()
+        return numpy.concatenate([dic[fname] for fname in self.datafiles])
 
     def _populate_from(self, asset_array, param, check_dupl):
-        asset_refs = set()
-        for idx, asset in enumerate(asset_array):
-            asset_id = asset['id']
-            # check_dupl is False only in oq prepare_site_model since
-            # in that case we are only interested in the asset locations
-            if check_dupl and asset_id in asset_refs:
-                raise nrml.DuplicatedID(asset_id)
-            asset_refs.add(param['asset_prefix'] + asset_id)
-            self._add_asset(idx, asset, param)
-
-    def _add_asset(self, idx, asset, param):
-        values = {}
-        try:
-            retrofitted = asset['retrofitted']
-        except ValueError:
-            retrofitted = None
-        asset_id = asset['id']
+        """
+        Build the array of assets with the tag indices and the values,
+        discarding the assets outside of the region (if any)
+        """
         prefix = param['asset_prefix']
+        asset_ids = asset_array['id']
+        # check_dupl is False only in oq prepare_site_model since
+        # in that case we are only interested in the asset locations
+        if check_dupl:
+            dupl = pandas.Series(asset_ids).duplicated().values
+            if dupl.any():
+                raise nrml.DuplicatedID(asset_ids[dupl.argmax()])
         # FIXME: in case of an exposure split in CSV files the line number
         # is None because param['fname'] points to the .xml file :-(
-        self.asset_refs.append(prefix + asset_id)
-        taxonomy = asset['taxonomy']
-        number = asset['number']
-        location = asset['lon'], asset['lat']
-        if param['region'] and not geometry.Point(*location).within(
-                param['region']):
-            param['out_of_region'] += 1
-            return
-        dic = {tagname: asset[tagname] for tagname in self.tagcol.tagnames
-               if tagname not in ('country', 'exposure') and
-               asset[tagname] != '?'}
-        dic['taxonomy'] = taxonomy
-        dic['id'] = prefix + asset_id
-        idxs = self.tagcol.add_tags(dic, prefix)
-        tot_occupants = 0
-        num_occupancies = 0
-        for name in asset.dtype.names:
-            if name.startswith('value-'):
-                values[name[6:]] = asset[name]
-            elif name.startswith('occupants_'):
-                values[name] = occ = float(asset[name])
-                tot_occupants += occ
-                num_occupancies += 1
-        if num_occupancies:
+        self.asset_refs = numpy.array(
+            [prefix + asset_id for asset_id in asset_ids], object)
+        lons = numpy.array(asset_array['lon'], float)
+        lats = numpy.array(asset_array['lat'], float)
+        ordinals = numpy.arange(len(asset_array))
+        if param['region']:
+            ok = vectorized.contains(param['region'], lons, lats)
+            param['out_of_region'] += len(ok) - ok.sum()
+            asset_array = asset_array[ok]
+            ordinals = ordinals[ok]
+            lons = lons[ok]
+            lats = lats[ok]
+        names = asset_array.dtype.names
+        values = [name for name in names if name.startswith('value-')]
+        occupants = [name for name in names if name.startswith('occupants_')]
+        if occupants:
             # store average occupants
-            values['occupants_None'] = tot_occupants / num_occupancies
+            occupants.append('occupants_None')
+        retrofitted = ['retrofitted'] if 'retrofitted' in names else []
 
         # check we are not missing a cost type
-        missing = param['relevant_cost_types'] - set(values)
+        missing = param['relevant_cost_types'] - set(
+            name[6:] for name in values) - set(occupants)
         if missing and missing <= param['ignore_missing_costs']:
             logging.warning(
-                'Ignoring asset %s, missing cost type(s): %s',
-                asset_id, ', '.join(missing))
-            for cost_type in missing:
-                values[cost_type] = None
-        elif missing and 'damage' not in param['calculation_mode']:
+                'Ignoring missing cost type(s) %s for all the assets',
+                ', '.join(missing))
+            values.extend('value-' + cost_type for cost_type in missing)
+        elif missing and 'damage' not in param['calculation_mode'] and len(
+                asset_array):
             # missing the costs is okay for damage calculators
             raise ValueError("Invalid Exposure. "
                              "Missing cost %s for asset %s" % (
-                                 missing, asset_id))
-        try:
-            area = asset['area']
-        except ValueError:
-            area = 1
-        ass = Asset(idx, idxs, number, location, values, area,
-                    retrofitted, self.cost_calculator)
-        self.assets.append(ass)
+                                 missing, asset_array[0]['id']))
+
+        tagnames = self.tagcol.tagnames
+        dt = [('ordinal', U32), ('lon', float), ('lat', float),
+              ('number', float), ('area', float)] + [
+                  (str(name), U32) for name in tagnames] + [
+                  (str(name), float)
+                  for name in values + occupants + retrofitted]
+        array = numpy.zeros(len(asset_array), dt)
+        array['ordinal'] = ordinals
+        array['lon'] = lons
+        array['lat'] = lats
+        array['number'] = asset_array['number']
+        array['area'] = asset_array['area'] if 'area' in names else 1
+        for name in values:
+            array[name] = asset_array[name] if name in names else numpy.nan
+        if occupants:
+            tot_occupants = 0
+            for name in occupants[:-1]:
+                array[name] = asset_array[name]
+                tot_occupants += array[name]
+            array['occupants_None'] = tot_occupants / (len(occupants) - 1)
+        if retrofitted:
+            array['retrofitted'] = asset_array['retrofitted']
+
+        # missing tagvalues are stored as "?", which is not a valid
+        # taxonomy or asset ID
+        for tagname in tagnames:
+            if tagname in ('exposure', 'country'):
+                tagvalues = numpy.full(len(asset_array), prefix, object)
+            elif tagname == 'id':
+                tagvalues = self.asset_refs[ordinals]
+            else:
+                tagvalues = asset_array[tagname]
+            invalid = pandas.Series(tagvalues).isin(
+                ['', '?', '*', '?*'] if tagname in ('taxonomy', 'id')
+                else ['', '*', '?*']).values
+            if invalid.any():
+                raise ValueError(
+                    'Invalid tagvalue="%s"' % tagvalues[invalid.argmax()])
+            array[tagname] = self.tagcol.add_array(tagname, tagvalues)
+        self.assets = array
 
     def get_mesh_assets_by_site(self):
         """
         :returns: (Mesh instance, assets_by_site list)
         """
-        assets_by_loc = general.groupby(self, key=lambda a: a.location)
-        mesh = geo.Mesh.from_coords(list(assets_by_loc))
-        assets_by_site = [
-            assets_by_loc[lonlat] for lonlat in zip(mesh.lons, mesh.lats)]
+        # sort the assets by location, keeping the original order
+        # for assets on the same location
+        assets = self.assets[
+            numpy.lexsort((self.assets['lat'], self.assets['lon']))]
+        lons, lats = assets['lon'], assets['lat']
+        changes = (lons[1:] != lons[:-1]) | (lats[1:] != lats[:-1])
+        starts = numpy.concatenate([[0], numpy.where(changes)[0] + 1])
+        mesh = geo.Mesh(lons[starts], lats[starts])
+        assets_by_site = numpy.split(assets, starts[1:])
         return mesh, assets_by_site
 
     def __iter__(self):
         return iter(self.assets)
 
+    def __toh5__(self):
+        dic = dict(assets=self.assets, asset_refs=self.asset_refs,
+                   cost_types=self.cost_types,
+                   cost_calculator=self.cost_calculator, tagcol=self.tagcol,
+                   exposures=numpy.array(self.exposures))
+        attrs = {'id': self.id, 'category': self.category,
+                 'description': self.description or '',
+                 'occupancy_periods': self.occupancy_periods,
+                 'retrofitted': self.retrofitted}
+        for k, v in self.area.items():
+            attrs['area_' + k] = v
+        return dic, attrs
+
+    def __fromh5__(self, dic, attrs):
+        for k in ('id', 'category', 'description', 'occupancy_periods'):
+            setattr(self, k, decode(attrs[k]))
+        self.retrofitted = bool(attrs['retrofitted'])
+        self.area = {k[5:]: decode(v) for k, v in attrs.items()
+                     if k.startswith('area_')}
+        self.assets = dic['assets'][()]
+        self.asset_refs = dic['asset_refs'][()]
+        self.cost_types = dic['cost_types'][()]
+        self.cost_calculator = dic['cost_calculator']
+        self.tagcol = dic['tagcol']
+        self.exposures = [decode(e) for e in dic['exposures'][()]]
+        self.datafiles = []
+
     def __repr__(self):
         return '<%s with %s assets>' % (self.__class__.__name__,
                                         len(self.assets))
@@ -16,7 +16,6 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
 
-import logging
 import numpy
 
 from openquake.baselib import hdf5
@@ -27,25 +26,17 @@ U32 = numpy.uint32
 F32 = numpy.float32
 
 
-def get_assets_by_taxo(assets, tempname=None):
+def get_assets_by_taxo(assets, epsgetter=None):
     """
     :param assets: an array of assets
-    :param tempname: hdf5 file where the epsilons are (or None)
-    :returns: assets_by_taxo with attributes eps and idxs
+    :param epsgetter: an :class:`EpsilonGetter` instance (or None)
+    :returns: assets_by_taxo with attributes epsgetter and idxs
     """
     assets_by_taxo = AccumDict(group_array(assets, 'taxonomy'))
     assets_by_taxo.assets = assets
     assets_by_taxo.idxs = numpy.argsort(numpy.concatenate([
         a['ordinal'] for a in assets_by_taxo.values()]))
-    assets_by_taxo.eps = {}
-    if tempname is None:  # no epsilons
-        return assets_by_taxo
-    # otherwise read the epsilons and group them by taxonomy
-    with hdf5.File(tempname, 'r') as h5:
-        dset = h5['epsilon_matrix']
-        for taxo, assets in assets_by_taxo.items():
-            lst = [dset[aid] for aid in assets['ordinal']]
-            assets_by_taxo.eps[taxo] = numpy.array(lst)
+    assets_by_taxo.epsgetter = epsgetter
     return assets_by_taxo
 
 
@@ -81,13 +72,16 @@ def get_output(crmodel, assets_by_taxo, haz, rlzi=None):
                loss_types=crmodel.loss_types)
     if rlzi is not None:
         dic['rlzi'] = rlzi
+    eps = {}  # taxonomy -> epsilons of shape (A, E)
+    for taxonomy, assets_ in assets_by_taxo.items():
+        if assets_by_taxo.epsgetter and len(eids):
+            eps[taxonomy] = assets_by_taxo.epsgetter.get(assets_, eids)
+        else:  # no CoVs
+            eps[taxonomy] = ()
     for l, lt in enumerate(crmodel.loss_types):
         ls = []
         for taxonomy, assets_ in assets_by_taxo.items():
-            if len(assets_by_taxo.eps):
-                epsilons = assets_by_taxo.eps[taxonomy][:, eids]
-            else:  # no CoVs
-                epsilons = ()
+            epsilons = eps[taxonomy]
             arrays = []
             rmodels, weights = crmodel.get_rmodels_weights(taxonomy)
             for rm in rmodels:
@@ -126,13 +120,14 @@ class RiskInput(object):
             aids.append(asset['ordinal'])
         self.aids = numpy.array(aids, numpy.uint32)
 
-    def gen_outputs(self, cr_model, monitor, tempname=None, haz=None):
+    def gen_outputs(self, cr_model, monitor, epsgetter=None, haz=None):
         """
         Group the assets per taxonomy and compute the outputs by using the
         underlying riskmodels. Yield one output per realization.
 
         :param cr_model: a CompositeRiskModel instance
         :param monitor: a monitor object used to measure the performance
+        :param epsgetter: an :class:`EpsilonGetter` instance (or None)
         """
         self.monitor = monitor
         hazard_getter = self.hazard_getter
@@ -148,7 +143,7 @@ class RiskInput(object):
             # small arrays are passed (one per realization) instead of
             # a long array with all realizations; ebrisk does the right
             # thing since it calls get_output directly
-            assets_by_taxo = get_assets_by_taxo(self.assets, tempname)
+            assets_by_taxo = get_assets_by_taxo(self.assets, epsgetter)
             for rlzi, haz_by_rlzi in items:
                 out = get_output(cr_model, assets_by_taxo, haz_by_rlzi, rlzi)
                 yield out
@@ -158,53 +153,52 @@ class RiskInput(object):
             self.__class__.__name__, self.sid, len(self.aids))
 
 
-# used in scenario_risk
-def make_eps(asset_array, num_samples, seed, correlation):
+class EpsilonGetter(object):
     """
-    :param asset_array: an array of assets
-    :param int num_samples: the number of ruptures
-    :param int seed: a random seed
-    :param float correlation: the correlation coefficient
-    :returns: epsilons matrix of shape (num_assets, num_samples)
+    Generate the epsilons of the assets on demand with a counter-based
+    random number generator keyed on the master seed, the asset ordinal and
+    the event ID: the epsilons do not depend on how the assets and the
+    events are split across the tasks.
+
+    :param master_seed: the master seed
+    :param asset_correlation: the correlation coefficient between the
+        epsilons of assets with the same taxonomy
     """
-    assets_by_taxo = group_array(asset_array, 'taxonomy')
-    eps = numpy.zeros((len(asset_array), num_samples), numpy.float32)
-    for taxonomy, assets in assets_by_taxo.items():
-        shape = (len(assets), num_samples)
-        logging.info('Building %s epsilons for taxonomy %s', shape, taxonomy)
-        zeros = numpy.zeros(shape)
-        epsilons = scientific.make_epsilons(zeros, seed, correlation)
-        for asset, epsrow in zip(assets, epsilons):
-            eps[asset['ordinal']] = epsrow
-    return eps
-
-
-def cache_epsilons(dstore, oq, assetcol, crmodel, E):
+    def __init__(self, master_seed, asset_correlation):
+        self.master_seed = master_seed
+        self.asset_correlation = asset_correlation or 0
+
+    def get(self, assets, eids):
+        """
+        :param assets: an array of assets with the same taxonomy
+        :param eids: an array of E event IDs
+        :returns: an array of epsilons of shape (A, E)
+        """
+        rho = self.asset_correlation
+        if rho < 1:
+            eps = scientific.counter_normals(
+                self.master_seed, assets['ordinal'], eids)
+        if rho:  # the taxonomy index is used to generate a common stream
+            common = scientific.counter_normals(
+                self.master_seed, assets['taxonomy'][:1], eids, stream=1)
+            eps = common if rho == 1 else (
+                numpy.sqrt(rho) * common + numpy.sqrt(1 - rho) * eps)
+        return F32(numpy.broadcast_to(eps, (len(assets), len(eids))))
+
+    def __repr__(self):
+        return '<%s seed=%s, correlation=%s>' % (
+            self.__class__.__name__, self.master_seed, self.asset_correlation)
+
+
+def get_epsilon_getter(oq, crmodel):
     """
-    Do nothing if there are no coefficients of variation of ignore_covs is
-    set. Otherwise, generate an epsilon matrix of shape (A, E) and save it
-    in the cache file, by returning the path to it.
+    :returns:
+        None if there are no coefficients of variation or ignore_covs is set,
+        otherwise an :class:`EpsilonGetter` instance
     """
     if oq.ignore_covs or not crmodel.covs or 'LN' not in crmodel.distributions:
         return
-    A = len(assetcol)
-    logging.info('Storing the epsilon matrix in %s', dstore.tempname)
-    if oq.calculation_mode == 'scenario_risk':
-        eps = make_eps(assetcol.array, E, oq.master_seed, oq.asset_correlation)
-    else:  # event based
-        if oq.asset_correlation:
-            numpy.random.seed(oq.master_seed)
-            eps = numpy.array([numpy.random.normal(size=E)] * A)
-        else:
-            seeds = oq.master_seed + numpy.arange(E)
-            eps = numpy.zeros((A, E), F32)
-            for i, seed in enumerate(seeds):
-                numpy.random.seed(seed)
-                eps[:, i] = numpy.random.normal(size=A)
-    with hdf5.File(dstore.tempname, 'w') as cache:
-        cache['sitecol'] = dstore['sitecol']
-        cache['epsilon_matrix'] = eps
-    return dstore.tempname
+    return EpsilonGetter(oq.master_seed, oq.asset_correlation)
 
 
 def str2rsi(key):
@@ -174,14 +174,14 @@ def rescale(curves, values):
     Multiply the losses in each curve of kind (losses, poes) by the
     corresponding value.
 
-    :param curves: an array of shape (A, 2, C)
+    :param curves: an array of shape (2, C) or (R, 2, C)
     :param values: an array of shape (A,)
+    :returns: a composite array of shape (A, C) or (R, A, C)
     """
-    A, _, C = curves.shape
-    assert A == len(values), (A, len(values))
-    array = numpy.zeros((A, C), loss_poe_dt)
-    array['loss'] = [c * v for c, v in zip(curves[:, 0], values)]
-    array['poe'] = curves[:, 1]
+    shape = curves.shape[:-2] + (len(values), curves.shape[-1])
+    array = numpy.zeros(shape, loss_poe_dt)
+    array['loss'] = curves[..., None, 0, :] * values[:, None]
+    array['poe'] = curves[..., None, 1, :]
     return array
 
 
@@ -249,21 +249,20 @@ class RiskModel(object):
             assets is an iterator over A
             :class:`openquake.risklib.scientific.Asset` instances
         :param hazard_curve:
-            an array of poes
+            an array of poes, or an array of shape (R, I) with a hazard
+            curve per realization
         :param eids:
             ignored, here only for API compatibility with other calculators
         :param eps:
             ignored, here only for API compatibility with other calculators
         :returns:
-            a composite array (loss, poe) of shape (A, C)
+            a composite array (loss, poe) of shape (A, C) or (R, A, C)
         """
-        n = len(assets)
         vf = self.risk_functions[loss_type, 'vulnerability']
         lratios = self.loss_ratios[loss_type]
         imls = self.hazard_imtls[vf.imt]
         values = get_values(loss_type, assets)
-        lrcurves = numpy.array(
-            [scientific.classical(vf, imls, hazard_curve, lratios)] * n)
+        lrcurves = scientific.classical(vf, imls, hazard_curve, lratios)
         return rescale(lrcurves, values)
 
     def event_based_risk(self, loss_type, assets, gmvs, eids, epsilons):
@@ -283,19 +282,10 @@ class RiskModel(object):
         A = len(assets)
         loss_ratios = numpy.zeros((A, E), F32)
         vf = self.risk_functions[loss_type, 'vulnerability']
-        means, covs, idxs = vf.interpolate(gmvs)
-        if len(means) == 0:  # all gmvs are below the minimum imls, 0 ratios
-            pass
-        elif self.ignore_covs or covs.sum() == 0 or len(epsilons) == 0:
-            # the ratios are equal for all assets
-            ratios = vf.sample(means, covs, idxs, None)  # right shape
-            for a in range(A):
-                loss_ratios[a, idxs] = ratios
-        else:
-            # take into account the epsilons
-            for a, asset in enumerate(assets):
-                loss_ratios[a, idxs] = vf.sample(
-                    means, covs, idxs, epsilons[a])
+        if self.ignore_covs:
+            epsilons = ()
+        # if there are no epsilons the ratios are equal for all assets
+        loss_ratios[:] = vf.get_loss_ratios(gmvs, epsilons)
         return loss_ratios
 
     ebrisk = event_based_risk
@@ -312,7 +302,6 @@ class RiskModel(object):
         if loss_type != 'structural':
             raise NotImplementedError(
                 'retrofitted is not defined for ' + loss_type)
-        n = len(assets)
         self.assets = assets
         vf = self.risk_functions[loss_type, 'vulnerability']
         imls = self.hazard_imtls[vf.imt]
@@ -323,21 +312,16 @@ class RiskModel(object):
         curves_retro = functools.partial(
             scientific.classical, vf_retro, imls,
             loss_ratios=self.loss_ratios_retro[loss_type])
-        original_loss_curves = numpy.array([curves_orig(hazard)] * n)
-        retrofitted_loss_curves = numpy.array([curves_retro(hazard)] * n)
-
-        eal_original = numpy.array([scientific.average_loss(lc)
-                                    for lc in original_loss_curves])
-
-        eal_retrofitted = numpy.array([scientific.average_loss(lc)
-                                       for lc in retrofitted_loss_curves])
-
-        bcr_results = [
-            scientific.bcr(
-                eal_original[i], eal_retrofitted[i],
-                self.interest_rate, self.asset_life_expectancy,
-                asset['value-' + loss_type], asset['retrofitted'])
-            for i, asset in enumerate(assets)]
+        # the loss ratio curves are the same for all the assets
+        n = len(assets)
+        eal_original = numpy.repeat(
+            scientific.average_loss(curves_orig(hazard)), n)
+        eal_retrofitted = numpy.repeat(
+            scientific.average_loss(curves_retro(hazard)), n)
+        bcr_results = scientific.bcr(
+            eal_original, eal_retrofitted,
+            self.interest_rate, self.asset_life_expectancy,
+            assets['value-' + loss_type], assets['retrofitted'])
         return list(zip(eal_original, eal_retrofitted, bcr_results))
 
     def scenario_risk(self, loss_type, assets, gmvs, eids, epsilons):
@@ -362,16 +346,10 @@ class RiskModel(object):
         loss_matrix.fill(numpy.nan)
 
         vf = self.risk_functions[loss_type, 'vulnerability']
-        means, covs, idxs = vf.interpolate(gmvs)
-        loss_ratio_matrix = numpy.zeros((len(assets), E))
-        if len(epsilons):
-            for a, eps in enumerate(epsilons):
-                loss_ratio_matrix[a, idxs] = vf.sample(means, covs, idxs, eps)
-        else:
-            ratios = vf.sample(means, covs, idxs, numpy.zeros(len(means), F32))
-            for a in range(len(assets)):
-                loss_ratio_matrix[a, idxs] = ratios
-        loss_matrix[:, :] = (loss_ratio_matrix.T * values).T
+        if not len(epsilons):  # use the median loss ratios
+            epsilons = numpy.zeros((1, E), F32)
+        loss_ratio_matrix = vf.get_loss_ratios(gmvs, epsilons)
+        loss_matrix[:, :] = loss_ratio_matrix * values[:, None]
         return loss_matrix
 
     scenario = scenario_risk
@@ -400,9 +378,9 @@ class RiskModel(object):
         :param loss_type: the loss type
         :param assets: a list of N assets of the same taxonomy
         :param hazard_curve: an hazard curve array
-        :returns: an array of N assets and an array of N x D elements
+        :returns: an array of N x D elements
 
-        where N is the number of points and D the number of damage states.
+        where N is the number of assets and D the number of damage states.
         """
         ffl = self.risk_functions[loss_type, 'fragility']
         hazard_imls = self.hazard_imtls[ffl.imt]
@@ -410,7 +388,7 @@ class RiskModel(object):
             ffl, hazard_imls, hazard_curve,
             investigation_time=self.investigation_time,
             risk_investigation_time=self.risk_investigation_time)
-        return [a['number'] * damage for a in assets]
+        return assets['number'][:, None] * damage
 
 
 # NB: the approach used here relies on the convention of having the
@@ -29,7 +29,7 @@ from functools import lru_cache
 
 import numpy
 from numpy.testing import assert_equal
-from scipy import interpolate, stats, random
+from scipy import interpolate, stats, random, special
 
 from openquake.baselib.general import CallableDict, cached_property
 from openquake.hazardlib.stats import compute_stats2
@@ -191,6 +191,43 @@ class VulnerabilityFunction(object):
         res = self.distribution.sample(means, covs, means * covs, idxs)
         return res
 
+    def get_loss_ratios(self, gmvs, epsilons=()):
+        """
+        Vectorized version of .interpolate + .sample, working on all the
+        assets and events of a taxonomy at once. The results are the same
+        as calling .sample asset by asset.
+
+        :param gmvs:
+           an array of E ground motion values or a matrix of shape (A, E)
+        :param epsilons:
+           a matrix of epsilons of shape (A, E) or an empty tuple
+        :returns:
+           a matrix of loss ratios of shape (A, E), with A=1 if both the
+           gmvs and the epsilons (if any) are the same for all the assets
+        """
+        gmvs = numpy.array(gmvs, F64, ndmin=2)
+        # gmvs are clipped to max(iml)
+        gmvs_curve = numpy.minimum(gmvs, self.imls[-1])
+        ok = gmvs_curve >= self.imls[0]  # indices over the minimum
+        means = numpy.interp(gmvs_curve, self.imls, self.mean_loss_ratios)
+        covs = numpy.interp(gmvs_curve, self.imls, self.covs)
+        if not (self.covs > 0).any() or (
+                self.distribution_name == 'LN' and len(epsilons) == 0):
+            ratios = means
+        elif self.distribution_name == 'LN':
+            sigma = numpy.sqrt(numpy.log(covs ** 2.0 + 1.0))
+            ratios = (means / numpy.sqrt(1 + covs ** 2) *
+                      numpy.exp(epsilons * sigma))
+        else:  # the seed is reset for each asset, as in .sample
+            ratios = numpy.zeros_like(means)
+            for row, idxs in enumerate(ok):
+                self.set_distribution()
+                ratios[row, idxs] = self.distribution.sample(
+                    means[row, idxs], None,
+                    means[row, idxs] * covs[row, idxs], None)
+        # for gmvs < min(iml) we return a loss of 0
+        return numpy.where(ok, ratios, 0.)
+
     # this is used in the tests, not in the engine code base
     def __call__(self, gmvs, epsilons):
         """
@@ -434,6 +471,37 @@ class VulnerabilityFunctionWithPMF(VulnerabilityFunction):
         self.set_distribution(epsilons)
         return self.distribution.sample(self.loss_ratios, probs)
 
+    def get_loss_ratios(self, gmvs, epsilons=()):
+        """
+        Vectorized version of .interpolate + .sample: the loss ratios are
+        sampled by looking up the cumulative probabilities, with the
+        same random numbers used by .sample.
+
+        :param gmvs:
+           an array of E ground motion values or a matrix of shape (A, E)
+        :param epsilons:
+           ignored, it is there only for API consistency
+        :returns:
+           a matrix of loss ratios of shape (A, E), with A=1 if the gmvs
+           are the same for all the assets
+        """
+        gmvs = numpy.array(gmvs, F64, ndmin=2)
+        imls = numpy.asarray(self.imls)
+        # gmvs are clipped to max(iml)
+        gmvs_curve = numpy.minimum(gmvs, imls[-1])
+        ok = gmvs_curve >= imls[0]  # indices over the minimum
+        uniforms = self.distribution.get_uniforms(ok.sum(axis=1).max())
+        loss_ratios = numpy.asarray(self.loss_ratios)
+        ratios = numpy.zeros(gmvs.shape)
+        for row, idxs in enumerate(ok):
+            probs = numpy.array([numpy.interp(gmvs_curve[row, idxs], imls, ps)
+                                 for ps in self.probs])  # shape (M, E')
+            if probs.size:
+                cumprobs = numpy.cumsum(probs, axis=0)
+                ratios[row, idxs] = loss_ratios[
+                    (cumprobs >= uniforms[:probs.shape[1]]).argmax(axis=0)]
+        return ratios
+
     @lru_cache()
     def loss_ratio_exceedance_matrix(self, loss_ratios):
         """
@@ -801,6 +869,63 @@ def make_epsilons(matrix, seed, correlation):
         means_vector, covariance_matrix, samples).transpose()
 
 
+U64 = numpy.uint64
+MASK32 = U64(0xFFFFFFFF)
+PHILOX_M = (U64(0xD2511F53), U64(0xCD9E8D57))
+PHILOX_W = (U64(0x9E3779B9), U64(0xBB67AE85))
+
+
+def philox4x32(counter, key, rounds=10):
+    """
+    Counter-based random number generator Philox4x32 (Salmon et al.,
+    "Parallel random numbers: as easy as 1, 2, 3", SC11), vectorized
+    with numpy.
+
+    :param counter: four integer arrays (broadcastable) with values < 2**32
+    :param key: a pair of integers < 2**32
+    :param rounds: the number of rounds (default 10)
+    :returns: four arrays of random 32 bit integers, stored as uint64
+
+    >>> [hex(int(x)) for x in philox4x32([0, 0, 0, 0], [0, 0])]
+    ['0x6627e8d5', '0xe169c58d', '0xbc57ac4c', '0x9b00dbd8']
+    """
+    c0, c1, c2, c3 = numpy.broadcast_arrays(
+        *[numpy.array(c, U64) for c in counter])
+    k0, k1 = U64(key[0]), U64(key[1])
+    for _ in range(rounds):
+        p0 = PHILOX_M[0] * c0
+        p1 = PHILOX_M[1] * c2
+        c0, c1, c2, c3 = ((p1 >> U64(32)) ^ c1 ^ k0, p1 & MASK32,
+                          (p0 >> U64(32)) ^ c3 ^ k1, p0 & MASK32)
+        k0 = (k0 + PHILOX_W[0]) & MASK32
+        k1 = (k1 + PHILOX_W[1]) & MASK32
+    return c0, c1, c2, c3
+
+
+def counter_normals(seed, idx, eids, stream=0):
+    """
+    Generate standard normal numbers keyed on the seed, on an index
+    (for instance an asset ordinal) and on the event IDs. The numbers
+    do not depend on the order or on the grouping of the requests, so
+    they can be generated on demand in the workers.
+
+    :param seed: a non-negative integer < 2**64
+    :param idx: an array of N non-negative integers < 2**32
+    :param eids: an array of E event IDs < 2**32
+    :param stream: an integer < 2**32 to generate independent streams
+    :returns: an array of shape (N, E)
+    """
+    seed = int(seed)
+    c0 = numpy.array(eids, U64)[None, :]
+    c2 = numpy.array(idx, U64)[:, None]
+    w0, w1, _, _ = philox4x32(
+        [c0, 0, c2, stream], [seed & 0xFFFFFFFF, seed >> 32])
+    # 53 random bits as in numpy.random.random_sample, shifted by half
+    # a unit to stay in the open interval (0, 1)
+    u = ((w0 >> U64(5)) * 67108864. + (w1 >> U64(6)) + .5) / 2. ** 53
+    return special.ndtri(u)
+
+
 @DISTRIBUTIONS.add('LN')
 class LogNormalDistribution(Distribution):
     """
@@ -864,6 +989,17 @@ class BetaDistribution(Distribution):
 class DiscreteDistribution(Distribution):
     seed = None  # to be set
 
+    def get_uniforms(self, n):
+        """
+        :param n: number of events
+        :returns: the n uniform random numbers used by .sample
+        """
+        uniforms = numpy.zeros(n)
+        for i in range(n):
+            random.seed(self.seed + i)
+            uniforms[i] = random.random_sample()
+        return uniforms
+
     def sample(self, loss_ratios, probs):
         ret = []
         r = numpy.arange(len(loss_ratios))
@@ -941,45 +1077,68 @@ def classical_damage(
     :param hazard_imls:
         Intensity Measure Levels
     :param hazard_poes:
-        hazard curve
+        hazard curve or array of N hazard curves of shape (N, I)
     :param investigation_time:
         hazard investigation time
     :param risk_investigation_time:
         risk investigation time
     :returns:
         an array of M probabilities of occurrence where M is the numbers
-        of damage states.
+        of damage states, or an array of shape (N, M) for N hazard curves
     """
     spi = fragility_functions.steps_per_interval
     if spi and spi > 1:  # interpolate
         imls = numpy.array(fragility_functions.interp_imls)
         min_val, max_val = hazard_imls[0], hazard_imls[-1]
         assert min_val > 0, hazard_imls  # sanity check
-        numpy.putmask(imls, imls < min_val, min_val)
-        numpy.putmask(imls, imls > max_val, max_val)
-        poes = interpolate.interp1d(hazard_imls, hazard_poes)(imls)
+        imls = numpy.clip(imls, min_val, max_val)
+        poes = interp_curves(imls, hazard_imls, hazard_poes)
     else:
-        imls = hazard_imls
+        imls = numpy.array(hazard_imls)
         poes = numpy.array(hazard_poes)
     afe = annual_frequency_of_exceedence(poes, investigation_time)
-    annual_frequency_of_occurrence = pairwise_diff(
-        pairwise_mean([afe[0]] + list(afe) + [afe[-1]]))
-    poes_per_damage_state = []
-    for ff in fragility_functions:
-        frequency_of_exceedence_per_damage_state = numpy.dot(
-            annual_frequency_of_occurrence, list(map(ff, imls)))
-        poe_per_damage_state = 1. - numpy.exp(
-            - frequency_of_exceedence_per_damage_state *
-            risk_investigation_time)
-        poes_per_damage_state.append(poe_per_damage_state)
-    poos = pairwise_diff([1] + poes_per_damage_state + [0])
-    return poos
+    # pairwise mean of the padded frequencies, then pairwise difference
+    padded = numpy.concatenate([afe[..., :1], afe, afe[..., -1:]], axis=-1)
+    means = (padded[..., :-1] + padded[..., 1:]) / 2.
+    afo = means[..., :-1] - means[..., 1:]  # annual frequency of occurrence
+    # matrix of shape (I, D - 1) with the PoEs of each damage state
+    ffs = numpy.array([ff(imls) for ff in fragility_functions]).T
+    ffs[imls == 0] = 0  # as in the fragility functions for a scalar iml
+    poes_per_damage_state = 1. - numpy.exp(
+        - (afo @ ffs) * risk_investigation_time)
+    ones = numpy.ones(afo.shape[:-1] + (1,))
+    poes = numpy.concatenate(
+        [ones, poes_per_damage_state, ones * 0], axis=-1)
+    return poes[..., :-1] - poes[..., 1:]
 
 #
 # Classical
 #
 
 
+def interp_curves(imls, hazard_imls, hazard_poes):
+    """
+    Linear interpolation of one or more hazard curves, equivalent to
+    `interp1d(hazard_imls, hazard_poes)(imls)` but computing the indices
+    and the weights only once for all the curves.
+
+    :param imls: I' intensity measure levels inside the hazard range
+    :param hazard_imls: I hazard intensity measure levels
+    :param hazard_poes: an array of shape (I,) or (N, I)
+    :returns: an array of shape (I',) or (N, I')
+
+    >>> interp_curves([.15, .3], [.1, .2, .4], [[.9, .5, .1], [.8, .4, 0]])
+    array([[0.7, 0.3],
+           [0.6, 0.2]])
+    """
+    xp = numpy.asarray(hazard_imls, float)
+    fp = numpy.asarray(hazard_poes, float)
+    idx = numpy.searchsorted(xp, imls).clip(1, len(xp) - 1)
+    lo, hi = idx - 1, idx
+    slope = (fp[..., hi] - fp[..., lo]) / (xp[hi] - xp[lo])
+    return slope * (imls - xp[lo]) + fp[..., lo]
+
+
 def classical(vulnerability_function, hazard_imls, hazard_poes, loss_ratios):
     """
     :param vulnerability_function:
@@ -989,32 +1148,30 @@ def classical(vulnerability_function, hazard_imls, hazard_poes, loss_ratios):
     :param hazard_imls:
         the hazard intensity measure type and levels
     :type hazard_poes:
-        the hazard curve
+        the hazard curve or an array of N hazard curves of shape (N, I)
     :param loss_ratios:
         a tuple of C loss ratios
     :returns:
-        an array of shape (2, C)
+        an array of shape (2, C), or (N, 2, C) for N hazard curves
     """
-    assert len(hazard_imls) == len(hazard_poes), (
-        len(hazard_imls), len(hazard_poes))
+    hazard_poes = numpy.asarray(hazard_poes)
+    assert len(hazard_imls) == hazard_poes.shape[-1], (
+        len(hazard_imls), hazard_poes.shape)
     vf = vulnerability_function
-    imls = vf.mean_imls()
     lrem = vf.loss_ratio_exceedance_matrix(loss_ratios)
 
     # saturate imls to hazard imls
-    min_val, max_val = hazard_imls[0], hazard_imls[-1]
-    numpy.putmask(imls, imls < min_val, min_val)
-    numpy.putmask(imls, imls > max_val, max_val)
-
-    # interpolate the hazard curve
-    poes = interpolate.interp1d(hazard_imls, hazard_poes)(imls)
+    imls = numpy.clip(vf.mean_imls(), hazard_imls[0], hazard_imls[-1])
 
-    # compute the poos
-    pos = pairwise_diff(poes)
-    lrem_po = numpy.empty(lrem.shape)
-    for idx, po in enumerate(pos):
-        lrem_po[:, idx] = lrem[:, idx] * po  # column * po
-    return numpy.array([loss_ratios, lrem_po.sum(axis=1)])
+    # interpolate the hazard curves and compute the poos
+    poes = interp_curves(imls, hazard_imls, hazard_poes)
+    pos = poes[..., :-1] - poes[..., 1:]
+    if hazard_poes.ndim == 1:
+        return numpy.array([loss_ratios, lrem @ pos])
+    curves = numpy.zeros((len(pos), 2, len(loss_ratios)))
+    curves[:, 0] = loss_ratios
+    curves[:, 1] = pos @ lrem.T
+    return curves
 
 
 def conditional_loss_ratio(loss_ratios, poes, probability):
@@ -1205,9 +1362,14 @@ def average_loss(lc):
            is a result of a linear interpolation, we compute an exact
            integral by using the trapeizodal rule with the width given by the
            loss bin width.
+
+    :param lc: a loss curve or a composite array of loss curves, with the
+               curve points in the last axis
+    :returns: the average loss or an array of average losses
     """
     losses, poes = (lc['loss'], lc['poe']) if lc.dtype.names else lc
-    return -pairwise_diff(losses) @ pairwise_mean(poes)
+    dlosses = losses[..., 1:] - losses[..., :-1]
+    return (dlosses * (poes[..., :-1] + poes[..., 1:]) / 2.).sum(axis=-1)
 
 
 def normalize_curves_eb(curves):
@@ -1344,6 +1506,95 @@ def losses_by_period(losses, return_periods, num_events=None, eff_time=None):
     return curve
 
 
+def losses_by_period_segments(losses, segments, num_events,
+                               return_periods, eff_time):
+    """
+    Vectorized version of :func:`losses_by_period`, computing the loss
+    curves for many segments (for instance realizations or pairs
+    (aggregation key, realization)) and many columns (for instance loss
+    types) at once. The losses are sorted with a single lexsort and the
+    interpolation is performed with numpy, giving the same results as
+    `numpy.interp`.
+
+    :param losses: array of shape (N, K) with the losses of N events
+    :param segments: array of N segment indices in the range 0 .. S-1
+    :param num_events: array of S numbers of events, one per segment
+    :param return_periods: P ordered return periods
+    :param eff_time: investigation_time * ses_per_logic_tree_path
+    :returns: an array of shape (S, P, K), possibly with NaN values
+
+    >>> losses = [[3], [2], [3.5], [4], [3], [23], [11], [2], [1], [4], [5]]
+    >>> curves = losses_by_period_segments(
+    ...     losses, [0] * 11, [20], [1, 2, 5, 10, 20, 50, 100], 100)
+    >>> curves[0, :, 0]
+    array([nan, nan,  0.,  2.,  4., 11., 23.])
+    """
+    losses = numpy.array(losses, F64)
+    segments = numpy.array(segments, numpy.int64)
+    num_events = numpy.array(num_events, numpy.int64)
+    N, K = losses.shape
+    S, P = len(num_events), len(return_periods)
+    counts = numpy.bincount(segments, minlength=S)  # losses per segment
+    if (counts > num_events).any():
+        raise ValueError(
+            'There are not enough events (%d) to compute the loss curve'
+            % num_events[counts > num_events][0])
+    # sort by segment, column and loss with a single lexsort; the losses
+    # of the column k of the segment s are in the slice
+    # starts[s] + k * counts[s] : starts[s] + (k + 1) * counts[s]
+    values = losses.ravel()
+    groups = (segments * K)[:, None] + numpy.arange(K)  # shape (N, K)
+    values = values[numpy.lexsort((values, groups.ravel()))]
+    starts = numpy.zeros(S, numpy.int64)
+    starts[1:] = numpy.cumsum(counts * K)[:-1]
+    # the interpolation indices and abscissas depend only on the number
+    # of events; each loss curve is padded with num_events - counts zeros
+    lo = numpy.zeros((S, P), numpy.int64)
+    hi = numpy.zeros((S, P), numpy.int64)
+    xlo, xhi = numpy.zeros((S, P)), numpy.zeros((S, P))
+    logrp = numpy.log(numpy.array(return_periods, F64))
+    for ne in numpy.unique(num_events[counts > 0]):
+        ok = num_events == ne
+        logp = numpy.log(eff_time / numpy.arange(ne, 0., -1))
+        j = numpy.searchsorted(logp, logrp, 'right') - 1
+        lo[ok] = j.clip(0, ne - 1)
+        hi[ok] = (j + 1).clip(0, ne - 1)
+        xlo[ok] = logp[lo[ok][0]]
+        xhi[ok] = logp[hi[ok][0]]
+    curves = numpy.zeros((S, P, K))
+    for k in range(K):
+        flo = _get_padded(values, starts, counts, num_events, k, lo)
+        fhi = _get_padded(values, starts, counts, num_events, k, hi)
+        delta = xhi - xlo
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            slope = (fhi - flo) / delta
+            curves[:, :, k] = numpy.where(
+                delta > 0, slope * (logrp - xlo) + flo, flo)
+    # outside the interval eff_time / num_events <= period <= eff_time
+    # the curves are not defined
+    rp = numpy.array(return_periods, F64)
+    with numpy.errstate(divide='ignore'):
+        outside = (rp < eff_time / num_events[:, None]) | (rp > eff_time)
+    # with a single event numpy.interp returns the only loss even for
+    # the NaN periods, so the curve is flat
+    outside[num_events == 1] = False
+    curves[outside] = numpy.nan
+    curves[counts == 0] = 0  # zero-curves
+    return curves
+
+
+def _get_padded(values, starts, counts, num_events, k, idx):
+    # extract the losses at the given indices (of shape (S, P)) from the
+    # sorted values, as if the column k were padded with zeros
+    pos = idx - (num_events - counts)[:, None]
+    if len(values) == 0:
+        return numpy.zeros(idx.shape)
+    out = values[((starts + k * counts)[:, None] + pos.clip(0)).clip(
+        0, len(values) - 1)]  # the clip matters only for empty segments
+    out[pos < 0] = 0
+    return out
+
+
 class LossCurvesMapsBuilder(object):
     """
     Build losses curves and maps for all loss types at the same time.
@@ -1435,18 +1686,13 @@ class LossCurvesMapsBuilder(object):
     def build_curves(self, loss_arrays, rlzi):
         if len(loss_arrays) == 0:
             return ()
-        shp = loss_arrays[0].shape  # (L, T...)
-        P = len(self.return_periods)
-        curves = numpy.zeros((P,) + shp, F32)
-        num_events = self.num_events.get(rlzi, 0)
-        acc = collections.defaultdict(list)
-        for loss_array in loss_arrays:
-            for idx, loss in numpy.ndenumerate(loss_array):
-                acc[idx].append(loss)
-        for idx, losses in acc.items():
-            curves[(slice(None),) + idx] = losses_by_period(
-                losses, self.return_periods, num_events, self.eff_time)
-        return curves
+        losses = numpy.array(loss_arrays)
+        shp = losses.shape[1:]  # (L, T...)
+        curves = losses_by_period_segments(
+            losses.reshape(len(losses), -1), numpy.zeros(len(losses), int),
+            [self.num_events.get(rlzi, 0)], self.return_periods,
+            self.eff_time)[0]
+        return F32(curves.reshape((len(self.return_periods),) + shp))
 
     def gen_curves_by_rlz(self, losses_by_event, ses_ratio):
         """
@@ -1454,10 +1700,52 @@ class LossCurvesMapsBuilder(object):
         :param ses_ratio: ses ratio
         :yield: triples (rlzi, curves, losses)
         """
-        for rlzi, losses_df in losses_by_event.groupby('rlzi'):
-            losses = numpy.array(losses_df)
-            yield (rlzi, self.build_curves(losses, rlzi),
-                   losses.sum(axis=0) * ses_ratio)
+        rlzs = losses_by_event.index.get_level_values('rlzi').to_numpy()
+        losses = numpy.array(losses_by_event)
+        for rlzi, curves, lsum in self.gen_curves(losses, rlzs):
+            yield rlzi, curves, lsum * ses_ratio
+
+    def gen_curves(self, losses, keys):
+        """
+        Build the loss curves for all the keys at once.
+
+        :param losses: an array of shape (N, K)
+        :param keys: an array of N keys which are realization indices or
+            pairs (aggregation key index, realization index)
+        :yield: triples (key, curves of shape (P, K), losses summed by key)
+        """
+        if len(losses) == 0:
+            return
+        ukeys, curves, sums = self.curves_by_key(losses, keys)
+        for s, ukey in enumerate(ukeys):
+            key = ukey if numpy.ndim(ukeys) == 1 else tuple(ukey)
+            yield key, curves[s], sums[s]
+
+    def curves_by_key(self, losses, keys):
+        """
+        Group the losses by key with a single sort and build the loss
+        curves for all the keys at once.
+
+        :param losses: an array of shape (N, K)
+        :param keys: an array of N keys which are realization indices or
+            pairs (aggregation key index, realization index)
+        :returns: S unique keys, S curves of shape (P, K) and S losses
+            of shape K summed by key
+        """
+        if numpy.ndim(keys) == 1:
+            ukeys, segments = numpy.unique(keys, return_inverse=True)
+            urlzs = ukeys
+        else:
+            ukeys, segments = numpy.unique(keys, axis=0, return_inverse=True)
+            urlzs = ukeys[:, 1]
+        num_events = [self.num_events.get(r, 0) for r in urlzs]
+        curves = losses_by_period_segments(
+            losses, segments, num_events, self.return_periods, self.eff_time)
+        order = numpy.argsort(segments, kind='stable')
+        starts = numpy.zeros(len(ukeys), int)
+        starts[1:] = numpy.cumsum(numpy.bincount(segments))[:-1]
+        sums = numpy.add.reduceat(losses[order], starts)
+        return ukeys, F32(curves), sums
 
 
 class LossesByAsset(object):
@@ -305,6 +305,62 @@ class VulnerabilityFunctionBlockSizeTestCase(unittest.TestCase):
         self.assertEqual(singleblock, multiblock)
 
 
+class VulnerabilityFunctionLossRatiosTestCase(unittest.TestCase):
+    """
+    Test the vectorized .get_loss_ratios against .interpolate + .sample
+    """
+    gmvs = numpy.array([[0.01, 0.35, 0.6, 1.5, 0.1],
+                        [0.2, 0.04, 0.9, 0.3, 0.7],
+                        [0.5, 0.5, 0.0, 0.25, 1.1]])
+    eps = numpy.array([[0.5, -0.2, 1.3, 0.1, -1.1],
+                       [-0.4, 0.8, -1.5, 0.2, 0.3],
+                       [1.2, 0.0, 0.7, -0.6, 0.9]], numpy.float32)
+
+    def expected(self, vf, eps):
+        ratios = numpy.zeros(self.gmvs.shape)
+        for a, gmvs in enumerate(self.gmvs):
+            means, covs, idxs = vf.interpolate(gmvs)
+            ratios[a, idxs] = vf.sample(
+                means, covs, idxs, eps[a] if len(eps) else None)
+        return ratios
+
+    def vf(self, covs, distribution):
+        vf = scientific.VulnerabilityFunction(
+            'RM', 'PGA', [0.02, 0.3, 0.5, 0.9, 1.2],
+            [0.05, 0.1, 0.2, 0.4, 0.8], covs, distribution)
+        vf.seed = 42
+        vf.init()
+        return vf
+
+    def test_lognormal(self):
+        vf = self.vf([0.1, 0.2, 0.3, 0.4, 0.5], 'LN')
+        for eps in (self.eps, ()):
+            aaae(vf.get_loss_ratios(self.gmvs, eps), self.expected(vf, eps))
+        # same gmvs for all the assets
+        aaae(vf.get_loss_ratios(self.gmvs[0], self.eps[:2]),
+             [vf(self.gmvs[0], eps) for eps in self.eps[:2]])
+
+    def test_beta(self):
+        vf = self.vf([0.1, 0.1, 0.2, 0.2, 0.3], 'BT')
+        aaae(vf.get_loss_ratios(self.gmvs), self.expected(vf, ()))
+
+    def test_zero_covs(self):
+        vf = self.vf([0, 0, 0, 0, 0], 'LN')
+        aaae(vf.get_loss_ratios(self.gmvs, self.eps), self.expected(vf, ()))
+
+    def test_pmf(self):
+        vf = scientific.VulnerabilityFunctionWithPMF(
+            'PM', 'PGA', numpy.array([0.02, 0.3, 0.5, 0.9, 1.2]),
+            numpy.array([0, 0.2, 0.5, 1]),
+            numpy.array([[0.8, 0.6, 0.3, 0.1, 0],
+                         [0.1, 0.2, 0.3, 0.3, 0.2],
+                         [0.1, 0.1, 0.3, 0.4, 0.3],
+                         [0, 0.1, 0.1, 0.2, 0.5]]))
+        vf.seed = 42
+        vf.init()
+        aaae(vf.get_loss_ratios(self.gmvs), self.expected(vf, ()))
+
+
 class MeanLossTestCase(unittest.TestCase):
     def test_mean_loss(self):
         vf = scientific.VulnerabilityFunction(
@@ -615,6 +671,75 @@ class InsuredLossCurveTestCase(unittest.TestCase):
             scientific.insured_loss_curve(curve, 0.1, 0.5))
 
 
+class LossesByPeriodSegmentsTestCase(unittest.TestCase):
+    def test_same_as_losses_by_period(self):
+        rng = numpy.random.RandomState(42)
+        counts = numpy.array([10, 0, 1, 25])
+        num_events = numpy.array([20, 5, 1, 25])
+        segments = numpy.repeat(numpy.arange(4), counts)
+        rng.shuffle(segments)
+        losses = rng.exponential(10, (len(segments), 2))
+        periods = [1, 2, 5, 10, 20, 50, 100, 200]
+        curves = scientific.losses_by_period_segments(
+            losses, segments, num_events, periods, 100)
+        self.assertEqual(curves.shape, (4, 8, 2))
+        for s in range(4):
+            for k in range(2):
+                expected = scientific.losses_by_period(
+                    losses[segments == s, k], periods, num_events[s], 100)
+                numpy.testing.assert_allclose(curves[s, :, k], expected)
+
+    def test_not_enough_events(self):
+        with self.assertRaises(ValueError):
+            scientific.losses_by_period_segments(
+                numpy.ones((3, 1)), [0, 0, 0], [2], [1, 2], 2)
+
+    def test_curves_by_key(self):
+        rng = numpy.random.RandomState(42)
+        periods = numpy.array([1, 2, 5, 10, 20, 50])
+        builder = scientific.LossCurvesMapsBuilder(
+            [], periods, None, [.5, .5], {0: 30, 1: 40}, 50, 50)
+        keys = numpy.zeros((50, 2), numpy.uint32)  # (aggkey index, rlz)
+        keys[:, 0] = rng.randint(0, 3, 50)
+        keys[:, 1] = rng.randint(0, 2, 50)
+        losses = numpy.float32(rng.exponential(10, (50, 2)))
+        ukeys, curves, sums = builder.curves_by_key(losses, keys)
+        self.assertEqual(curves.shape, (len(ukeys), 6, 2))
+        for (i, r), crv, lsum in zip(ukeys, curves, sums):
+            ok = (keys[:, 0] == i) & (keys[:, 1] == r)
+            numpy.testing.assert_allclose(
+                lsum, losses[ok].sum(axis=0), rtol=1E-6)
+            expected = scientific.losses_by_period(
+                losses[ok, 1], periods, builder.num_events[r], 50)
+            numpy.testing.assert_allclose(crv[:, 1], expected, rtol=1E-6)
+
+
+class CounterNormalsTestCase(unittest.TestCase):
+    def test_philox_known_answers(self):
+        # from the known answer tests of the Random123 library
+        out = scientific.philox4x32(
+            [0xffffffff] * 4, [0xffffffff, 0xffffffff])
+        self.assertEqual([int(x) for x in out],
+                         [0x408f276d, 0x41c83b0e, 0xa20bc7c6, 0x6d5451fd])
+        out = scientific.philox4x32(
+            [0x243f6a88, 0x85a308d3, 0x13198a2e, 0x03707344],
+            [0xa4093822, 0x299f31d0])
+        self.assertEqual([int(x) for x in out],
+                         [0xd16cfe09, 0x94fdcceb, 0x5001e420, 0x24126ea1])
+
+    def test_independent_of_split(self):
+        eps = scientific.counter_normals(42, numpy.arange(200), range(500))
+        self.assertEqual(eps.shape, (200, 500))
+        self.assertAlmostEqual(eps.mean(), 0, places=2)
+        self.assertAlmostEqual(eps.std(), 1, places=2)
+        # the same numbers are generated for a subset of assets and events
+        sub = scientific.counter_normals(42, [150, 7], [499, 3])
+        numpy.testing.assert_equal(sub, eps[[150, 7]][:, [499, 3]])
+        # a different seed gives different numbers
+        other = scientific.counter_normals(43, [150, 7], [499, 3])
+        self.assertFalse((sub == other).any())
+
+
 class ClassicalDamageTestCase(unittest.TestCase):
     def test_discrete(self):
         hazard_imls = [0.05, 0.2, 0.4, 0.6, 0.8, 1, 1.2, 1.4]
@@ -705,3 +830,39 @@ class ClassicalDamageTestCase(unittest.TestCase):
             fragility_functions, hazard_imls, hazard_poes,
             investigation_time, risk_investigation_time)
         aaae(poos, [0.56652127, 0.12513401, 0.1709355, 0.06555033, 0.07185889])
+
+        # the batched version gives the same results curve by curve
+        curves = numpy.array([hazard_poes, hazard_poes / 2])
+        poos = scientific.classical_damage(
+            fragility_functions, hazard_imls, curves,
+            investigation_time, risk_investigation_time)
+        self.assertEqual(poos.shape, (2, 5))
+        for poo, poes in zip(poos, curves):
+            aaae(poo, scientific.classical_damage(
+                fragility_functions, hazard_imls, poes,
+                investigation_time, risk_investigation_time))
+
+
+class ClassicalTestCase(unittest.TestCase):
+    def test_batched(self):
+        vf = scientific.VulnerabilityFunction(
+            'vf1', 'PGA', [0.1, 0.2, 0.3, 0.5, 0.7],
+            [0.05, 0.1, 0.2, 0.4, 0.8], [0.5, 0.4, 0.3, 0.2, 0.1], 'LN')
+        vf.seed = 42
+        vf.init()
+        loss_ratios = tuple(vf.mean_loss_ratios_with_steps(2))
+        hazard_imls = [0.05, 0.1, 0.2, 0.4, 0.6, 0.8]
+        curves = numpy.array([[0.99, 0.9, 0.5, 0.1, 0.01, 0.001],
+                              [0.9, 0.5, 0.1, 0.05, 0.001, 0.0001]])
+        batch = scientific.classical(vf, hazard_imls, curves, loss_ratios)
+        self.assertEqual(batch.shape, (2, 2, len(loss_ratios)))
+        for curve, poes in zip(batch, curves):
+            aaae(curve, scientific.classical(
+                vf, hazard_imls, poes, loss_ratios))
+        # average losses of many loss curves at once
+        lcs = numpy.zeros((2, len(loss_ratios)),
+                          [('loss', float), ('poe', float)])
+        lcs['loss'] = batch[:, 0]
+        lcs['poe'] = batch[:, 1]
+        aaae(scientific.average_loss(lcs),
+             [scientific.average_loss(curve) for curve in batch])
@@ -391,6 +391,21 @@ def log(db, job_id, timestamp, level, process, message):
        'VALUES (?X)', (job_id, timestamp, level, process, message))
 
 
+def log_many(db, rows):
+    """
+    Write many log records in the database with a single executemany.
+
+    :param db:
+        a :class:`openquake.server.dbapi.Db` instance
+    :param rows:
+        a list of tuples (job_id, timestamp, level, process, message)
+    """
+    with db:  # a single transaction, committed at the end
+        db('BEGIN')
+        db.insert('log', 'job_id timestamp level process message'.split(),
+                  rows)
+
+
 def get_log(db, job_id):
     """
     Extract the logs as a big string
@@ -255,6 +255,14 @@ class EngineServerTestCase(unittest.TestCase):
         resp = self.c.get(url)
         self.assertEqual(resp.status_code, 200)
 
+        # check extract with slicing of the arrays
+        url = '/v1/calc/%s/extract/hcurves?kind=mean&imt=PGA' % job_id
+        mean = loadnpz(self.c.get(url))['mean']
+        got = loadnpz(self.c.get(url + '&start=1&stop=3'))['mean']
+        numpy.testing.assert_equal(got, mean[1:3])
+        resp = self.c.get(url + '&start=1&stop=x')
+        self.assertEqual(resp.status_code, 400)
+
         # check deleting job without the webAPI
         engine.del_calculation(job_id, True)
 
@@ -270,6 +278,19 @@ class EngineServerTestCase(unittest.TestCase):
         # download the datastore, even if incomplete
         resp = self.c.get('/v1/calc/%s/datastore' % job_id)
         self.assertEqual(resp.status_code, 200)
+        data = b''.join(resp.streaming_content)
+
+        # download the datastore in two parts, with range requests
+        url = '/v1/calc/%s/datastore' % job_id
+        resp1 = self.c.get(url, HTTP_RANGE='bytes=0-99')
+        self.assertEqual(resp1.status_code, 206)
+        resp2 = self.c.get(url, HTTP_RANGE='bytes=100-')
+        self.assertEqual(resp2['Content-Range'],
+                         'bytes 100-%d/%d' % (len(data) - 1, len(data)))
+        self.assertEqual(b''.join(resp1.streaming_content) +
+                         b''.join(resp2.streaming_content), data)
+        resp = self.c.get(url, HTTP_RANGE='bytes=%d-' % len(data))
+        self.assertEqual(resp.status_code, 416)
 
         tb = self.get('%s/traceback' % job_id)
         if not tb:
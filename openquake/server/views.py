@@ -26,6 +26,7 @@ import subprocess
 import threading
 import traceback
 import signal
+import zipfile
 import zlib
 import pickle
 import urllib.parse as urlparse
@@ -58,7 +59,7 @@ from openquake.engine.export.core import DataStoreExportError
 from openquake.server import utils, dbapi
 
 from django.conf import settings
-from django.http import FileResponse
+from django.http import FileResponse, StreamingHttpResponse
 from wsgiref.util import FileWrapper
 
 if settings.LOCKDOWN:
@@ -81,6 +82,7 @@ DEFAULT_EXPORT_TYPE = 'xml'
 
 EXPORT_CONTENT_TYPE_MAP = dict(xml=XML, geojson=JSON)
 DEFAULT_CONTENT_TYPE = 'text/plain'
+CHUNKSIZE = 4 * 1024 ** 2  # 4 MB, size of the chunks of streamed data
 
 LOGGER = logging.getLogger('openquake.server')
 
@@ -711,27 +713,144 @@ def calc_result(request, result_id):
     return response
 
 
+class _Buffer(object):
+    """
+    A write-only, non-seekable file-like object collecting bytes
+    """
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_npz(arrays, chunksize=CHUNKSIZE):
+    """
+    Generate the bytes of a compressed .npz file containing the given
+    arrays, chunk by chunk, without building the whole file in memory.
+    NB: only the encoding is streamed, the arrays are already in memory
+
+    :param arrays: a dictionary name -> array
+    :param chunksize: approximate size in bytes of the uncompressed chunks
+    """
+    buf = _Buffer()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for name, arr in arrays.items():
+            arr = numpy.asanyarray(arr)
+            with zf.open(name + '.npy', 'w', force_zip64=True) as f:
+                if arr.ndim == 0 or arr.dtype.hasobject:
+                    numpy.lib.format.write_array(f, arr, allow_pickle=True)
+                else:
+                    arr = numpy.require(arr, requirements='C')
+                    header = numpy.lib.format.header_data_from_array_1_0(arr)
+                    try:
+                        numpy.lib.format.write_array_header_1_0(f, header)
+                    except ValueError:  # header too long
+                        numpy.lib.format.write_array_header_2_0(f, header)
+                    rowsize = arr[0].nbytes if len(arr) else 1
+                    step = max(1, chunksize // max(rowsize, 1))
+                    for start in range(0, len(arr), step):
+                        f.write(arr[start:start + step].tobytes())
+                        yield buf.pop()
+            yield buf.pop()
+    yield buf.pop()
+
+
+def _get_range(range_header, size):
+    """
+    :param range_header: the value of the HTTP Range header, if any
+    :param size: the size of the requested file
+    :returns: a pair (start, stop) or None if the range is not satisfiable
+
+    >>> _get_range('bytes=0-99', 1000)
+    (0, 100)
+    >>> _get_range('bytes=900-', 1000)
+    (900, 1000)
+    >>> _get_range('bytes=-100', 1000)
+    (900, 1000)
+    >>> _get_range('bytes=1000-', 1000)
+    """
+    mo = re.match(r'bytes=(\d*)-(\d*)$', range_header.strip())
+    if not mo or mo.groups() == ('', ''):
+        return
+    first, last = mo.groups()
+    if first == '':  # suffix range, the last bytes of the file
+        start, stop = max(size - int(last), 0), size
+    else:
+        start = int(first)
+        stop = min(int(last) + 1, size) if last else size
+    if start >= stop:
+        return
+    return start, stop
+
+
+def _iter_file(fname, start, stop, chunksize=CHUNKSIZE):
+    # yield the bytes of the file in the range [start, stop)
+    with open(fname, 'rb') as f:
+        f.seek(start)
+        remaining = stop - start
+        while remaining > 0:
+            data = f.read(min(chunksize, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+
+def _is_payload(key):
+    # True for the data of an ArrayWrapper returned by an extractor, i.e.
+    # `array` or the arrays of the realizations and of the statistics;
+    # False for the metadata, like the bin edges or the parameters
+    return (key == 'array' or key.startswith(('rlz-', 'quantile-')) or
+            key in ('mean', 'std', 'max'))
+
+
 @cross_domain_ajax
 @require_http_methods(['GET', 'HEAD'])
 def extract(request, calc_id, what):
     """
     Wrapper over the `oq extract` command. If `setting.LOCKDOWN` is true
     only calculations owned by the current user can be retrieved.
+    The optional integer parameters `start` and `stop` are not passed to
+    the extractor and are used to slice on the first axis the extracted
+    data, i.e. `array` or the arrays of the realizations and statistics
+    (`rlz-XXX`, `mean`, `quantile-X`, ...); the metadata are not sliced.
+    NB: the extracted arrays are kept in memory (also when slicing), only
+    the .npz encoding is streamed.
     """
     job = logs.dbcmd('get_job', int(calc_id))
     if job is None:
         return HttpResponseNotFound()
     if not utils.user_has_permission(request, job.user_name):
         return HttpResponseForbidden()
+    try:
+        start = request.GET.get('start')
+        stop = request.GET.get('stop')
+        start = int(start) if start else None
+        stop = int(stop) if stop else None
+    except ValueError:
+        return HttpResponseBadRequest(
+            'start and stop must be integers, got start=%s, stop=%s' %
+            (request.GET.get('start'), request.GET.get('stop')))
 
     try:
-        # read the data and save them on a temporary .npz file
+        n = len(request.path_info)
+        query_string = unquote_plus(request.get_full_path()[n:])
+        if start is not None or stop is not None:
+            params = [p for p in query_string.lstrip('?').split('&')
+                      if p and not p.startswith(('start=', 'stop='))]
+            query_string = '?' + '&'.join(params) if params else ''
+        # read the data and convert them into arrays
         with datastore.read(job.ds_calc_dir + '.hdf5') as ds:
-            fd, fname = tempfile.mkstemp(
-                prefix=what.replace('/', '-'), suffix='.npz')
-            os.close(fd)
-            n = len(request.path_info)
-            query_string = unquote_plus(request.get_full_path()[n:])
             aw = _extract(ds, what + query_string)
             a = {}
             for key, val in vars(aw).items():
@@ -744,21 +863,22 @@ def extract(request, calc_id, what):
                     # this is hack: we are losing the values
                     a[key] = list(val)
                 else:
+                    if (isinstance(val, numpy.ndarray) and val.ndim and
+                            _is_payload(key)):
+                        val = val[start:stop]  # slice on the first axis
                     a[key] = utils.array_of_strings_to_bytes(val, key)
-            numpy.savez_compressed(fname, **a)
     except Exception as exc:
         tb = ''.join(traceback.format_tb(exc.__traceback__))
         return HttpResponse(
             content='%s: %s\n%s' % (exc.__class__.__name__, exc, tb),
             content_type='text/plain', status=500)
 
-    # stream the data back
-    stream = FileWrapper(open(fname, 'rb'))
-    stream.close = lambda: (FileWrapper.close(stream), os.remove(fname))
-    response = FileResponse(stream, content_type='application/octet-stream')
+    # stream the data back, generating the .npz file chunk by chunk;
+    # the arrays in `a` are already in memory
+    response = StreamingHttpResponse(
+        stream_npz(a), content_type='application/octet-stream')
     response['Content-Disposition'] = (
-        'attachment; filename=%s' % os.path.basename(fname))
-    response['Content-Length'] = str(os.path.getsize(fname))
+        'attachment; filename=%s.npz' % what.replace('/', '-'))
     return response
 
 
@@ -783,11 +903,26 @@ def calc_datastore(request, job_id):
         return HttpResponseForbidden()
 
     fname = job.ds_calc_dir + '.hdf5'
-    response = FileResponse(
-        FileWrapper(open(fname, 'rb')), content_type=HDF5)
+    size = os.path.getsize(fname)
+    range_header = request.META.get('HTTP_RANGE')
+    if range_header:  # send only the requested bytes
+        rng = _get_range(range_header, size)
+        if rng is None:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */%d' % size
+            return response
+        start, stop = rng
+        response = StreamingHttpResponse(
+            _iter_file(fname, start, stop), status=206, content_type=HDF5)
+        response['Content-Range'] = 'bytes %d-%d/%d' % (start, stop - 1, size)
+    else:
+        start, stop = 0, size
+        response = StreamingHttpResponse(
+            _iter_file(fname, start, stop), content_type=HDF5)
+    response['Accept-Ranges'] = 'bytes'
     response['Content-Disposition'] = (
         'attachment; filename=%s' % os.path.basename(fname))
-    response['Content-Length'] = str(os.path.getsize(fname))
+    response['Content-Length'] = str(stop - start)
     return response
 
 